@@ -99,7 +99,10 @@ export interface paths {
          *
          *     This can be used by the initiator to retrieve the response of the recipient(s).
          *     A recipient can also use this by providing their `recipient_secret`, although it
-         *     does not provide any new information for them.
+         *     does not provide any new information for them: they only get their own reply.
+         *
+         *     The replies are paginated: use `next_cursor` from the response as `cursor` to
+         *     get the next page.
          */
         get: operations["get_exchange_result_api_exchanges__exchange_id__result__get"];
         put?: never;
@@ -110,6 +113,30 @@ export interface paths {
         patch?: never;
         trace?: never;
     };
+    "/api/exchanges/{exchange_id}/result/stream/": {
+        parameters: {
+            query?: never;
+            header?: never;
+            path?: never;
+            cookie?: never;
+        };
+        /**
+         * Stream Exchange Result
+         * @description Stream all replies of an exchange, for exchanges with many replies.
+         *
+         *     This is the same as `/result/`, but without the initiator's attributes, and with
+         *     all replies streamed as newline-delimited JSON instead of paginated. Replies are
+         *     fetched from storage in batches, so memory usage does not grow with their number.
+         */
+        get: operations["stream_exchange_result_api_exchanges__exchange_id__result_stream__get"];
+        put?: never;
+        post?: never;
+        delete?: never;
+        options?: never;
+        head?: never;
+        patch?: never;
+        trace?: never;
+    };
     "/api/signatures/requests/create/": {
         parameters: {
             query?: never;
@@ -273,13 +300,20 @@ export interface components {
              *
              */
             replies: components["schemas"]["DisclosedValue"][][];
+            /**
+             * Next Cursor
+             * @description The cursor to request the next page of replies with.
+             *
+             *             This is null if there are no more replies (yet).
+             *
+             */
+            next_cursor: number | null;
         };
         /**
          * ExchangeType
-         * @constant
          * @enum {string}
          */
-        ExchangeType: "1-to-1";
+        ExchangeType: "1-to-1" | "1-to-many";
         /**
          * HTTPExceptionResponse
          * @description Response model for HTTP exceptions.
@@ -584,6 +618,12 @@ export interface operations {
         parameters: {
             query: {
                 secret: string;
+                /** @description Index of the first reply to return. */
+                cursor?: number;
+                /** @description Maximum number of replies to return. */
+                limit?: number;
+                /** @description Give translated values that are the same in every language as a single string, instead of an object with all translations. */
+                compact?: boolean;
             };
             header?: never;
             path: {
@@ -622,6 +662,50 @@ export interface operations {
             };
         };
     };
+    stream_exchange_result_api_exchanges__exchange_id__result_stream__get: {
+        parameters: {
+            query: {
+                secret: string;
+                /** @description Give translated values that are the same in every language as a single string, instead of an object with all translations. */
+                compact?: boolean;
+            };
+            header?: never;
+            path: {
+                exchange_id: string;
+            };
+            cookie?: never;
+        };
+        requestBody?: never;
+        responses: {
+            /** @description Newline-delimited JSON, with the disclosed attributes of one reply per line, in the order the replies were received in. */
+            200: {
+                headers: {
+                    [name: string]: unknown;
+                };
+                content: {
+                    "application/x-ndjson": unknown;
+                };
+            };
+            /** @description Not Found */
+            404: {
+                headers: {
+                    [name: string]: unknown;
+                };
+                content: {
+                    "application/json": components["schemas"]["HTTPExceptionResponse"];
+                };
+            };
+            /** @description Validation Error */
+            422: {
+                headers: {
+                    [name: string]: unknown;
+                };
+                content: {
+                    "application/json": components["schemas"]["HTTPValidationError"];
+                };
+            };
+        };
+    };
     create_api_signatures_requests_create__post: {
         parameters: {
             query?: never;
@@ -0,0 +1,40 @@
+/**
+ * Prefix of signatures in verify links that are compressed with zlib and encoded with
+ * URL-safe base64. Other signatures are encoded with plain base64, which never has a '.'.
+ */
+const COMPRESSED_PREFIX = 'z.'
+
+/**
+ * Check whether the fragment of a verify link looks like an encoded signature.
+ *
+ * @param fragment The URL fragment, without the leading '#'.
+ */
+export function isEncodedSignature(fragment: string): boolean {
+  if (fragment.startsWith(COMPRESSED_PREFIX)) {
+    return /^[A-Za-z0-9_-]+$/.test(fragment.slice(COMPRESSED_PREFIX.length))
+  }
+  try {
+    window.atob(fragment)
+    return true
+  } catch {
+    return false
+  }
+}
+
+/**
+ * Decode the signature in the fragment of a verify link, which may be compressed.
+ *
+ * @param fragment The URL fragment, without the leading '#'.
+ * @returns The JSON of the signature.
+ */
+export async function decodeSignature(fragment: string): Promise<string> {
+  if (!fragment.startsWith(COMPRESSED_PREFIX)) {
+    return window.atob(fragment)
+  }
+
+  const base64 = fragment.slice(COMPRESSED_PREFIX.length).replace(/-/g, '+').replace(/_/g, '/')
+  const bytes = Uint8Array.from(window.atob(base64), (c) => c.charCodeAt(0))
+  // The 'deflate' format of the Compression Streams API is zlib.
+  const stream = new Blob([bytes]).stream().pipeThrough(new DecompressionStream('deflate'))
+  return await new Response(stream).text()
+}
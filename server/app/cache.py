@@ -0,0 +1,210 @@
+"""In-process cache of records stored in Redis, invalidated by keyspace notifications.
+
+Exchanges and signature requests are written only a few times, but read on almost every
+request. With the cache, a worker keeps the records it has read, and serves repeated
+reads without a round trip to Redis.
+
+Every write of a cached key makes Redis publish a keyspace notification, upon which all
+workers drop their copy. The cache is only used if Redis is configured to publish these
+notifications, and only while subscribed to them. It is cleared whenever the subscription
+is (re)established, so no notification can be missed. Records are cached as the bytes
+stored in Redis, so they can't be changed by the code that uses them.
+"""
+
+import asyncio
+import contextlib
+import logging
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+
+import redis.asyncio as redis
+
+from app.config import StorageCacheSettings, settings
+
+logger = logging.getLogger(__name__)
+
+# Keyspace events for writes (`$`), deletes and expiry changes (`g`), and keys that
+# expired (`x`) or were evicted (`e`).
+_NOTIFY_KEYSPACE_EVENTS = "Kg$xe"
+_ALL_EVENTS = "g$lshzxetdmn"
+
+
+@dataclass(frozen=True, slots=True)
+class RecordCacheStats:
+    """Statistics of a record cache."""
+
+    hits: int
+    misses: int
+    invalidations: int
+    entries: int
+    bytes: int
+
+
+class RecordCache:
+    """Cache of records at keys with the given prefixes, bounded by count and size.
+
+    The least recently used records are evicted first. Records are also dropped once
+    their `expire_at` has passed, as Redis may notify that a key expired a bit later.
+    """
+
+    def __init__(self, prefixes: tuple[str, ...], cache_settings: StorageCacheSettings):
+        self._prefixes = prefixes
+        self._settings = cache_settings
+        self._entries: OrderedDict[str, tuple[bytes, float]] = OrderedDict()
+        self._bytes = 0
+        self._listener: asyncio.Task | None = None
+        self._subscribed = asyncio.Event()
+        # Incremented on every invalidation, so that records that were read before an
+        # invalidation but arrive after it are not cached.
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    @property
+    def active(self) -> bool:
+        """Whether the cache is used, which is only while receiving notifications."""
+        return self._subscribed.is_set()
+
+    def get(self, key: str) -> bytes | None:
+        """Get a cached record, or None if it is not cached."""
+        if not self.active:
+            return None
+        entry = self._entries.get(key)
+        if entry is None or entry[1] <= time.time():
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[0]
+
+    def put(self, key: str, data: bytes, expire_at: float, generation: int) -> None:
+        """Cache a record, unless anything was invalidated since `generation`."""
+        if not self.active or generation != self.generation:
+            return
+        size = len(key) + len(data)
+        if size > self._settings.max_bytes:
+            return
+
+        self._discard(key)
+        self._entries[key] = (data, expire_at)
+        self._bytes += size
+        while (
+            len(self._entries) > self._settings.max_entries
+            or self._bytes > self._settings.max_bytes
+        ):
+            self._discard(next(iter(self._entries)))
+
+    def invalidate(self, key: str) -> None:
+        """Drop a record, for example after it was written."""
+        self.generation += 1
+        self.invalidations += 1
+        self._discard(key)
+
+    def _discard(self, key: str) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= len(key) + len(entry[0])
+
+    def clear(self) -> None:
+        self.generation += 1
+        self._entries.clear()
+        self._bytes = 0
+
+    def stats(self) -> RecordCacheStats:
+        return RecordCacheStats(
+            hits=self.hits,
+            misses=self.misses,
+            invalidations=self.invalidations,
+            entries=len(self._entries),
+            bytes=self._bytes,
+        )
+
+    async def _check_notifications(self, redis_client: redis.Redis) -> bool:
+        """Whether Redis publishes the required keyspace notifications.
+
+        With `configure_notifications`, missing notifications are enabled first. Either
+        way, the configuration is read back, so the cache is not used if that failed.
+        """
+        try:
+            current = await _get_notify_keyspace_events(redis_client)
+            missing = _missing_events(current)
+            if missing and self._settings.configure_notifications:
+                await redis_client.config_set("notify-keyspace-events", current + missing)
+                current = await _get_notify_keyspace_events(redis_client)
+                missing = _missing_events(current)
+        except redis.ResponseError as e:
+            logger.warning("Could not check keyspace notifications, the cache is disabled: %s", e)
+            return False
+
+        if missing:
+            logger.warning(
+                "The cache is disabled, as notify-keyspace-events does not include %r",
+                missing,
+            )
+            return False
+        return True
+
+    async def _listen(self, redis_client: redis.Redis) -> None:
+        db = redis_client.connection_pool.connection_kwargs.get("db", 0)
+        patterns = [f"__keyspace@{db}__:{prefix}*" for prefix in self._prefixes]
+        while True:
+            pubsub = redis_client.pubsub(ignore_subscribe_messages=True)
+            try:
+                await pubsub.psubscribe(*patterns)
+                self.clear()
+                self._subscribed.set()
+                async for message in pubsub.listen():
+                    if message["type"] == "pmessage":
+                        channel = message["channel"]
+                        if isinstance(channel, bytes):
+                            channel = channel.decode()
+                        self.invalidate(channel.partition(":")[2])
+            except (redis.RedisError, OSError) as e:
+                logger.warning("Lost keyspace notifications, the cache is disabled: %s", e)
+            finally:
+                self._subscribed.clear()
+                self.clear()
+                await pubsub.aclose()
+            await asyncio.sleep(1)
+
+    async def start(self, redis_client: redis.Redis) -> None:
+        """Subscribe to the keyspace notifications, after which the cache is used.
+
+        If Redis does not publish the required notifications, the cache is never used.
+        """
+        if not await self._check_notifications(redis_client):
+            return
+        # The cache may be started again after `close`, from another event loop.
+        self._subscribed = asyncio.Event()
+        self._listener = asyncio.create_task(self._listen(redis_client))
+        with contextlib.suppress(TimeoutError):
+            await asyncio.wait_for(self._subscribed.wait(), 5)
+
+    async def close(self) -> None:
+        if self._listener is not None:
+            self._listener.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._listener
+            self._listener = None
+
+
+async def _get_notify_keyspace_events(redis_client: redis.Redis) -> str:
+    config = await redis_client.config_get("notify-keyspace-events")
+    value = config.get("notify-keyspace-events") or ""
+    return value.decode() if isinstance(value, bytes) else str(value)
+
+
+def _missing_events(current: str) -> str:
+    """Get the required keyspace events that are not in `notify-keyspace-events`."""
+    # `A` is an alias for all event types.
+    enabled = set(current) | (set(_ALL_EVENTS) if "A" in current else set())
+    return "".join(flag for flag in _NOTIFY_KEYSPACE_EVENTS if flag not in enabled)
+
+
+record_cache = (
+    RecordCache(("exchange:", "signature_request:"), settings.storage_cache)
+    if settings.storage_cache.enabled
+    else None
+)
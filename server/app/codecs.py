@@ -0,0 +1,277 @@
+"""Codecs to serialize the models that are stored in Redis.
+
+Records are encoded with the configured codec, but every codec can decode records in
+any of the formats, so that the codec can be changed without migrating existing records.
+Records without a header are JSON, as written before codecs were introduced.
+
+Trusted records are wrapped in an envelope, with a fingerprint of the schema of the model
+and a checksum of the record. Records with a matching fingerprint and checksum were
+written by this server from an already validated model, so they can be loaded without
+validating them again. Anything else, such as a record from before a schema change,
+is validated as usual.
+
+Translated strings that are the same in every language can be stored as a single string.
+
+Large records can be compressed with zlib, in another envelope around all of the above.
+
+Only plain JSON records, without any of the above, can be read by releases from before
+these formats were introduced. Other records are forward-only: to be able to roll back,
+or while older workers still run, use the `json` codec without `storage_trusted_load`,
+`storage_compact_translations` and compression, which is the default.
+"""
+
+import functools
+import hashlib
+import json
+import types
+import typing
+import zlib
+from abc import ABC, abstractmethod
+from collections.abc import Callable
+from datetime import UTC, datetime
+from enum import Enum
+from typing import Any, Literal, TypeVar
+
+import msgpack  # type: ignore[import-untyped]
+from pydantic import BaseModel, TypeAdapter
+from pydantic_core import from_json, to_json
+
+from app.timing import timed
+from app.yivi.models import compact_translations
+
+M = TypeVar("M", bound=BaseModel)
+
+# Header of records in the compact format, followed by a version byte. 0xC1 is never used
+# in msgpack, and can't be the start of a JSON document either.
+_COMPACT_MAGIC = b"\xc1"
+_COMPACT_VERSION = 1
+
+# Msgpack extension type of an interned string, whose data is an index in `_INTERNED`.
+_INTERNED_EXT_TYPE = 1
+
+# Attribute IDs (and other frequent strings) that are encoded as a one-byte index instead
+# of the full string. Records refer to these by index, so this may only be appended to.
+_INTERNED = (
+    "pbdf.sidn-pbdf.email.email",
+    "pbdf.sidn-pbdf.mobilenumber.mobilenumber",
+    "pbdf.gemeente.personalData.fullname",
+    "pbdf.gemeente.personalData.dateofbirth",
+    "pbdf.gemeente.address.street",
+    "pbdf.gemeente.address.houseNumber",
+    "pbdf.gemeente.address.zipcode",
+    "pbdf.gemeente.address.city",
+    "1-to-1",
+    "1-to-many",
+)
+_INTERNED_INDEX = {value: index for index, value in enumerate(_INTERNED)}
+
+# Header of records in the trusted envelope, followed by the fingerprint of the schema of
+# the model, a checksum, and the record in any of the other formats.
+_TRUSTED_MAGIC = b"\xc2"
+# Increment when the way trusted records are loaded changes in a way that the schema
+# fingerprint doesn't capture, to have existing records validated again.
+_TRUSTED_VERSION = 1
+_FINGERPRINT_SIZE = 4
+_CHECKSUM_SIZE = 8
+_TRUSTED_HEADER_SIZE = 1 + _FINGERPRINT_SIZE + _CHECKSUM_SIZE
+
+# Header of compressed records, followed by a zlib stream of the record.
+_COMPRESSED_MAGIC = b"\xc3"
+# Compression level, favoring speed: higher levels hardly make text records smaller.
+_COMPRESSION_LEVEL = 1
+
+
+def _unintern(code: int, data: bytes) -> Any:
+    if code == _INTERNED_EXT_TYPE:
+        return _INTERNED[data[0]]
+    return msgpack.ExtType(code, data)
+
+
+def _intern_strings(value: Any) -> Any:
+    """Replace interned strings in JSON-compatible data by extension types."""
+    if isinstance(value, str):
+        index = _INTERNED_INDEX.get(value)
+        return value if index is None else msgpack.ExtType(_INTERNED_EXT_TYPE, bytes((index,)))
+    if isinstance(value, dict):
+        return {key: _intern_strings(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_intern_strings(item) for item in value]
+    return value
+
+
+@functools.cache
+def _schema_fingerprint(model_type: type[BaseModel]) -> bytes:
+    """Get a fingerprint of the schema of a model, which changes along with its fields."""
+    schema = json.dumps([_TRUSTED_VERSION, model_type.model_json_schema()], sort_keys=True)
+    return hashlib.blake2b(schema.encode(), digest_size=_FINGERPRINT_SIZE).digest()
+
+
+def _checksum(data: bytes) -> bytes:
+    return hashlib.blake2b(data, digest_size=_CHECKSUM_SIZE).digest()
+
+
+def _identity(value: Any) -> Any:
+    return value
+
+
+def _timestamp(value: Any) -> Any:
+    return datetime.fromtimestamp(value, tz=UTC) if isinstance(value, int) else value
+
+
+def _converter(annotation: Any) -> Callable[[Any], Any]:
+    """Get a function to convert JSON-compatible data to a value of type `annotation`.
+
+    Constraints and validators of fields, such as the rather slow validation of email
+    addresses, are skipped. Nested models are still validated, which is cheap for models
+    without such fields, and faster than building them in Python.
+    """
+    origin = typing.get_origin(annotation)
+    args = typing.get_args(annotation)
+    if origin is typing.Annotated:
+        return _converter(args[0])
+    if origin in (typing.Union, types.UnionType):
+        options = [_converter(arg) for arg in args if arg is not type(None)]
+        if len(options) != 1:
+            raise TypeError(f"Unsupported union in trusted record: {annotation}")
+        convert = options[0]
+        return lambda value: None if value is None else convert(value)
+    if origin is list:
+        if _converter(args[0]) is _identity:
+            return list
+        return TypeAdapter(annotation).validate_python
+    if isinstance(annotation, type):
+        if issubclass(annotation, BaseModel):
+            return annotation.model_validate
+        if issubclass(annotation, Enum):
+            return annotation
+        if issubclass(annotation, datetime):
+            return _timestamp
+    return _identity
+
+
+@functools.cache
+def _field_converters(model_type: type[BaseModel]) -> tuple[tuple[str, Callable], ...]:
+    return tuple(
+        (name, _converter(field.annotation)) for name, field in model_type.model_fields.items()
+    )
+
+
+@functools.cache
+def _is_plain_model(model_type: type[BaseModel]) -> bool:
+    """Check whether a model holds nothing but its fields, in its `__dict__`."""
+    return (
+        not model_type.__private_attributes__
+        and model_type.__pydantic_post_init__ is None
+        and model_type.model_config.get("extra") != "allow"
+    )
+
+
+def _construct(model_type: type[BaseModel], data: Any) -> Any:
+    """Build a model from trusted data, like `model_construct` with converted fields."""
+    converters = _field_converters(model_type)
+    values = {name: convert(data[name]) for name, convert in converters if name in data}
+    if len(values) != len(converters) or not _is_plain_model(model_type):
+        return model_type.model_construct(**values)
+
+    # This is what `model_construct` does when all fields are given, without looking up
+    # defaults and aliases for every field, which takes most of its time.
+    model = model_type.__new__(model_type)
+    object.__setattr__(model, "__dict__", values)
+    object.__setattr__(model, "__pydantic_fields_set__", set(values))
+    object.__setattr__(model, "__pydantic_extra__", None)
+    object.__setattr__(model, "__pydantic_private__", None)
+    return model
+
+
+class Codec(ABC):
+    """Encodes models to bytes, and decodes records in any supported format."""
+
+    name: str
+
+    def encode(
+        self,
+        model: BaseModel,
+        compress_above: int | None = None,
+        trusted: bool = False,
+        compact: bool = False,
+    ) -> bytes:
+        """Encode a model, compressing the record if it is larger than `compress_above`.
+
+        If `trusted`, the record is wrapped in the trusted envelope, so that it can be
+        loaded without validation. If `compact`, identical translations are collapsed.
+        """
+        with timed("serialization"):
+            data = self._encode(model, compact)
+            if trusted:
+                data = _TRUSTED_MAGIC + _schema_fingerprint(type(model)) + _checksum(data) + data
+            if compress_above is not None and len(data) > compress_above:
+                compressed = _COMPRESSED_MAGIC + zlib.compress(data, _COMPRESSION_LEVEL)
+                if len(compressed) < len(data):
+                    return compressed
+            return data
+
+    @abstractmethod
+    def _encode(self, model: BaseModel, compact: bool) -> bytes:
+        """Encode a model in the format of this codec, without any envelope.
+
+        If `compact`, translated strings that are the same in every language are collapsed.
+        """
+
+    def decode(self, model_type: type[M], data: bytes | str, trusted: bool = False) -> M:
+        """Decode a record, loading it without validation if `trusted` and it is intact.
+
+        This only pays off for models with expensive validation, such as email addresses.
+        """
+        with timed("validation"):
+            if isinstance(data, bytes) and data[:1] == _COMPRESSED_MAGIC:
+                data = zlib.decompress(data[1:])
+            if isinstance(data, bytes) and data[:1] == _TRUSTED_MAGIC:
+                header, data = data[:_TRUSTED_HEADER_SIZE], data[_TRUSTED_HEADER_SIZE:]
+                if (
+                    trusted
+                    and header[1 : 1 + _FINGERPRINT_SIZE] == _schema_fingerprint(model_type)
+                    and header[1 + _FINGERPRINT_SIZE :] == _checksum(data)
+                ):
+                    return _construct(model_type, self._load(data))
+
+            if isinstance(data, bytes) and data[:1] == _COMPACT_MAGIC:
+                return model_type.model_validate(self._load(data))
+            return model_type.model_validate_json(data)
+
+    @staticmethod
+    def _load(data: bytes) -> Any:
+        """Parse a record in any format to JSON-compatible data."""
+        if data[:1] == _COMPACT_MAGIC:
+            if data[1] != _COMPACT_VERSION:
+                raise ValueError(f"Unsupported compact record version: {data[1]}")
+            return msgpack.unpackb(data[2:], ext_hook=_unintern, strict_map_key=False)
+        return from_json(data)
+
+
+class JSONCodec(Codec):
+    """Stores models as their JSON representation."""
+
+    name = "json"
+
+    def _encode(self, model: BaseModel, compact: bool) -> bytes:
+        if compact:
+            return to_json(compact_translations(model.model_dump(mode="json")))
+        return model.model_dump_json().encode()
+
+
+class CompactCodec(Codec):
+    """Stores models as msgpack, with frequent strings such as attribute IDs interned."""
+
+    name = "msgpack"
+
+    def _encode(self, model: BaseModel, compact: bool) -> bytes:
+        data = model.model_dump(mode="json")
+        data = _intern_strings(compact_translations(data) if compact else data)
+        return _COMPACT_MAGIC + bytes((_COMPACT_VERSION,)) + msgpack.packb(data)
+
+
+CODECS: dict[str, Codec] = {codec.name: codec for codec in (JSONCodec(), CompactCodec())}
+
+
+def get_codec(name: Literal["json", "msgpack"]) -> Codec:
+    return CODECS[name]
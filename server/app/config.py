@@ -1,7 +1,41 @@
-from pydantic import BaseModel, Field, HttpUrl, SecretStr
+from pathlib import Path
+from typing import Literal, Self
+
+from pydantic import BaseModel, Field, HttpUrl, SecretStr, model_validator
 from pydantic_settings import BaseSettings
 
 
+class IRMAServerPublicKey(BaseModel):
+    """A public key of an IRMA server that is trusted to sign session result JWTs."""
+
+    key: bytes | None = Field(
+        default=None,
+        description="PEM-encoded public key.",
+    )
+
+    key_file: Path | None = Field(
+        default=None,
+        description="Path to a PEM file containing the public key. "
+        "The file is reloaded when it changes.",
+    )
+
+    key_id: str | None = Field(
+        default=None,
+        description="If set, this key is preferred for JWTs with this `kid` header.",
+    )
+
+    issuer: str | None = Field(
+        default=None,
+        description="If set, this key is only used for JWTs with this `iss` claim.",
+    )
+
+    @model_validator(mode="after")
+    def check_key_or_key_file(self) -> Self:
+        if (self.key is None) == (self.key_file is None):
+            raise ValueError("exactly one of key and key_file must be set")
+        return self
+
+
 class IRMAServerSettings(BaseModel):
     server_public_key: bytes = Field(
         default=b"""-----BEGIN PUBLIC KEY-----
@@ -16,6 +50,25 @@ dzGoU63CTCQZrPw/g8vgNXNr65J7XKQBuEzJOh/3opwxHVjjyb77XeWQOTIQxNcP
         description="Public key of the IRMA server to use for verifying session result JWTs.",
     )
 
+    server_public_key_file: Path | None = Field(
+        default=None,
+        description="Path to a PEM file with the public key of the IRMA server. "
+        "If set, this is used instead of `server_public_key`, and reloaded when it changes.",
+    )
+
+    trusted_public_keys: list[IRMAServerPublicKey] = Field(
+        default_factory=list,
+        description="""Additional trusted public keys for verifying session result JWTs.
+
+        This allows rotating the key of the IRMA server, or trusting multiple IRMA servers.
+        """,
+    )
+
+    public_key_reload_interval: float = Field(
+        default=10,
+        description="Minimum time in seconds between checks whether key files have changed.",
+    )
+
     session_request_secret_key: SecretStr = Field(
         description="Secret key to use for signing irma session request JWTs.",
         default=SecretStr("unsafe_secret_key"),
@@ -28,10 +81,176 @@ dzGoU63CTCQZrPw/g8vgNXNr65J7XKQBuEzJOh/3opwxHVjjyb77XeWQOTIQxNcP
     )
 
 
+class JWTWorkerSettings(BaseModel):
+    executor: Literal["thread", "process"] = Field(
+        default="thread",
+        description="Kind of worker pool to sign and verify JWTs in.",
+    )
+
+    max_workers: int = Field(
+        default=4,
+        ge=1,
+        description="Number of workers in the pool.",
+    )
+
+    max_pending: int = Field(
+        default=256,
+        ge=1,
+        description="""Maximum number of JWT operations that can be queued or running at once.
+
+        Requests that need to sign or verify a JWT when this limit is reached are rejected.
+        """,
+    )
+
+
+class RedisPoolSettings(BaseModel):
+    min_connections: int = Field(
+        default=2,
+        ge=0,
+        description="""Number of connections to open at startup, and keep open, in each worker.
+
+        This saves the first requests after a deploy from waiting for a connection.
+        """,
+    )
+
+    max_connections: int = Field(
+        default=100,
+        ge=1,
+        description="""Maximum number of connections to Redis in each worker.
+
+        When all connections are in use, commands wait for one to become available.
+        """,
+    )
+
+    timeout: float = Field(
+        default=5,
+        gt=0,
+        description="Time in seconds to wait for an available connection before failing.",
+    )
+
+    health_check_interval: float = Field(
+        default=30,
+        gt=0,
+        description="""Time in seconds between health checks of the connections.
+
+        Connections that have been idle for longer are also checked before they are used.
+        """,
+    )
+
+
+class StorageCacheSettings(BaseModel):
+    enabled: bool = Field(
+        default=False,
+        description="""Whether to cache exchanges and signature requests in each worker.
+
+        Cached records are invalidated with keyspace notifications from Redis, which are
+        enabled in the Redis configuration if `configure_notifications` is set. The cache
+        is only used if `CONFIG GET` shows that these notifications are enabled.
+        """,
+    )
+
+    max_entries: int = Field(
+        default=10_000,
+        ge=1,
+        description="Maximum number of records to cache in each worker.",
+    )
+
+    max_bytes: int = Field(
+        default=16 * 1024 * 1024,
+        ge=1,
+        description="Maximum total size in bytes of the records to cache in each worker.",
+    )
+
+    configure_notifications: bool = Field(
+        default=True,
+        description="""Whether to enable the required keyspace notifications in Redis.
+
+        Otherwise, `notify-keyspace-events` must include at least `Kg$xe` in the
+        configuration of the Redis server.
+        """,
+    )
+
+
 class SMTPSettings(BaseModel):
     hostname: str
-    username: str
-    password: str
+    port: int | None = Field(
+        default=None,
+        description="Port of the SMTP server. By default, the standard port is used.",
+    )
+    username: str | None = None
+    password: str | None = None
+    start_tls: bool = Field(
+        default=True,
+        description="Whether to require STARTTLS.",
+    )
+
+    pool_size: int = Field(
+        default=2,
+        ge=1,
+        description="""Maximum number of connections to the SMTP server in each worker.
+
+        Connections are authenticated once and reused for many emails.
+        """,
+    )
+
+    outbox_size: int = Field(
+        default=1000,
+        ge=1,
+        description="""Maximum number of emails waiting to be sent in each worker.
+
+        When the outbox is full, adding an email waits until there is room again.
+        """,
+    )
+
+    batch_size: int = Field(
+        default=20,
+        ge=1,
+        description="Maximum number of emails to send in a row over a single connection.",
+    )
+
+    max_attempts: int = Field(
+        default=5,
+        ge=1,
+        description="Number of times to try sending an email before giving up on it.",
+    )
+
+    retry_delay: float = Field(
+        default=1.0,
+        description="Time in seconds before the first retry, which doubles for every retry.",
+    )
+
+    drain_timeout: float = Field(
+        default=10.0,
+        description="Time in seconds to wait for the outbox to be empty on shutdown.",
+    )
+
+
+class MailerSettings(BaseModel):
+    concurrency: int = Field(
+        default=4,
+        ge=1,
+        description="Number of batches of emails that each mailer sends at the same time.",
+    )
+
+    retry_after: float = Field(
+        default=60,
+        description="""Time in seconds after which emails that failed are sent again.
+
+        This is also the time after which emails that a crashed mailer was sending are
+        taken over by another mailer.
+        """,
+    )
+
+    max_deliveries: int = Field(
+        default=5,
+        ge=1,
+        description="Number of attempts to send an email before it is dead-lettered.",
+    )
+
+    dead_letter_max_length: int = Field(
+        default=10_000,
+        description="Approximate number of dead-lettered emails to keep for inspection.",
+    )
 
 
 class Settings(BaseSettings):
@@ -47,12 +266,62 @@ class Settings(BaseSettings):
 
     irma: IRMAServerSettings = IRMAServerSettings()
 
+    jwt_workers: JWTWorkerSettings = JWTWorkerSettings()
+
     redis_url: str | None = Field(
         default=None,
         description="URL of the Redis server to use.",
         examples=["redis://localhost:6379/0"],
     )
 
+    redis_pool: RedisPoolSettings = RedisPoolSettings()
+
+    storage_codec: Literal["json", "msgpack"] = Field(
+        default="json",
+        description="""Format to store exchanges, replies and signature requests in.
+
+        Records in any format can always be read, so this can be changed at any time.
+        `msgpack` is more compact, and stores attribute IDs as a short index, but it can't
+        be read by releases from before it was introduced.
+        """,
+    )
+
+    storage_cache: StorageCacheSettings = StorageCacheSettings()
+
+    storage_trusted_load: bool = Field(
+        default=False,
+        description="""Load records written by this server without validating them again.
+
+        Records are stored with a fingerprint of their schema and a checksum, and only
+        records for which both match are loaded without validation.
+
+        This is off by default, as such records can't be read by releases from before this
+        setting was introduced. Only enable it once no workers of such a release run, and
+        rolling back to one is not needed.
+        """,
+    )
+
+    storage_compact_translations: bool = Field(
+        default=False,
+        description="""Store translated values that are the same in every language only once.
+
+        Most attribute values are, so this makes stored replies about a third smaller.
+        This is off by default, as such records can't be read by releases from before this
+        setting was introduced.
+        """,
+    )
+
+    signature_request_compression_threshold: int | None = Field(
+        default=None,
+        ge=0,
+        description="""Size in bytes above which stored signature requests are compressed.
+
+        Messages to sign can be long, and compress well, for example above 1024 bytes.
+        This is off (None) by default, as compressed records can't be read by releases
+        from before this setting was introduced.
+        """,
+    )
+
     exchange_ttl_before_start: int = Field(
         default=600,
         description="""Time in seconds to store an exchange before it starts.
@@ -90,11 +359,72 @@ class Settings(BaseSettings):
         description="Time in seconds for which a Yivi session request JWT is valid.",
     )
 
+    session_request_max_age: int = Field(
+        default=300,
+        # Signed session requests are cached for half of this, which must be at least 1s.
+        ge=2,
+        description="""Maximum age in seconds of session request JWTs accepted by the IRMA server.
+
+        This should match the `max_request_age` setting of the IRMA server. Signed session
+        requests are reused for at most half of this time.
+        """,
+    )
+
+    request_jwt_cache_size: int = Field(
+        default=1024,
+        ge=0,
+        description="Maximum number of signed session request JWTs to cache in each worker.",
+    )
+
+    request_jwt_cache_redis: bool = Field(
+        default=False,
+        description="Whether to also cache signed session request JWTs in Redis, "
+        "so they are shared between workers.",
+    )
+
     email_attribute: str = Field(
         default="pbdf.sidn-pbdf.email.email",
         description="Attribute ID for an email address to send emails to.",
     )
 
+    attribute_allowlist: list[str] | None = Field(
+        default=None,
+        description="""Attribute and credential IDs that can be requested, if set.
+
+        Exchanges and signature requests for any other attributes are rejected.
+        """,
+        examples=[["pbdf.gemeente.personalData", "pbdf.sidn-pbdf.email.email"]],
+    )
+
+    email_languages: list[Literal["nl", "en"]] = Field(
+        default=["nl"],
+        min_length=1,
+        description="""Languages to write emails in, in order.
+
+        Each email contains its full text in each of these languages.
+        """,
+    )
+
+    email_digest_window: int = Field(
+        default=0,
+        ge=0,
+        description="""Time in seconds to collect replies to a 1-to-many exchange in one email.
+
+        With 0, an email is sent for every reply. Otherwise, the first reply to an exchange
+        starts a window, after which a single email with all replies in it is sent.
+        """,
+    )
+
+    signature_link_encoding: Literal["base64", "zlib"] = Field(
+        default="base64",
+        description="""Encoding of signatures in the verify links that are sent by email.
+
+        `zlib` compresses the signature, which makes links with long messages several times
+        shorter, but these links can only be opened by clients that support them. `base64`
+        gives links that every version of the client can open.
+        """,
+    )
+
     email_from_domain: str = Field(
         default="localhost", description="Sender domain for outgoing email."
     )
@@ -104,6 +434,31 @@ class Settings(BaseSettings):
         description="Configuration for outgoing email.",
     )
 
+    email_outbox: Literal["memory", "redis"] = Field(
+        default="memory",
+        description="""Where to keep emails until they are sent.
+
+        With `memory`, each API worker sends its own emails, and emails that have not been
+        sent yet are lost when it stops. With `redis`, emails are added to a stream in
+        Redis, from which they are sent by a separate mailer (`python -m app.mailer`).
+        """,
+    )
+
+    mailer: MailerSettings = MailerSettings()
+
+    server_timing: bool = Field(
+        default=False,
+        description="""Add a `Server-Timing` header to every response, with the time spent
+        on Redis I/O, validation, JWTs, ConDisCons and serialization, for debugging.""",
+    )
+
+    metrics_update_interval: float = Field(
+        default=5,
+        gt=0,
+        description="""Time in seconds between updates of the metrics of the Redis connection
+        pool and the record cache of each worker, as exposed at `/api/metrics`.""",
+    )
+
 
 settings = Settings()
 
@@ -0,0 +1,51 @@
+import time
+from collections.abc import Callable
+from datetime import UTC, datetime
+from typing import Any
+
+import pytest
+
+from app.exchanges.models import DisclosedValue, Exchange, ExchangeReply, ExchangeType
+from app.yivi.models import TranslatedString
+
+
+@pytest.fixture
+def make_exchange() -> Callable[..., Exchange]:
+    """Make exchanges, which expire in 10 minutes unless `fields` say otherwise."""
+
+    def make_exchange(type: ExchangeType = ExchangeType.ONE_TO_ONE, **fields: Any) -> Exchange:
+        return Exchange(
+            **{
+                "type": type,
+                "send_email": True,
+                "attributes": ["pbdf.sidn-pbdf.email.email"],
+                "public_initiator_attributes": ["pbdf.sidn-pbdf.mobilenumber.mobilenumber"],
+                "initiator_email_value": "initiator@example.com",
+                # Timestamps are stored in whole seconds.
+                "expire_at": datetime.fromtimestamp(int(time.time()) + 600, tz=UTC),
+                **fields,
+            }
+        )
+
+    return make_exchange
+
+
+@pytest.fixture
+def make_reply() -> Callable[..., ExchangeReply]:
+    """Make replies to an exchange, disclosing `email` and any `other_values`."""
+
+    def make_reply(
+        exchange: Exchange, email: str = "foo@example.com", *other_values: DisclosedValue
+    ) -> ExchangeReply:
+        return ExchangeReply(
+            exchange_id=exchange.id,
+            attribute_values=[
+                DisclosedValue(
+                    id="pbdf.sidn-pbdf.email.email",
+                    value=TranslatedString(default=email, nl=email, en=email),
+                ),
+                *other_values,
+            ],
+        )
+
+    return make_reply
@@ -1,20 +1,171 @@
+import asyncio
+import contextlib
+import logging
+import time
+from dataclasses import dataclass
+from typing import Any
+
 import redis.asyncio as redis
 
-from app.config import settings
+from app.config import RedisPoolSettings, settings
+
+logger = logging.getLogger(__name__)
 
-_redis_connection_pool = (
-    redis.ConnectionPool.from_url(settings.redis_url) if settings.redis_url else None
-)
 _fake_redis_server = None
 
-if _redis_connection_pool is None:
+if settings.redis_url is None:
     from fakeredis import FakeAsyncRedis, FakeServer
 
     _fake_redis_server = FakeServer()
 
 
+@dataclass(frozen=True, slots=True)
+class RedisPoolStats:
+    """Statistics of the Redis connection pool of a worker."""
+
+    in_use: int
+    idle: int
+    max_connections: int
+    acquired: int
+    """Number of times a connection was taken from the pool."""
+    wait_time: float
+    """Total time in seconds spent waiting for a connection, including connecting."""
+    healthy: bool
+    """Whether the last health check succeeded."""
+
+    @property
+    def mean_wait_time(self) -> float:
+        return self.wait_time / self.acquired if self.acquired else 0.0
+
+
+class _InstrumentedConnectionPool(redis.BlockingConnectionPool):
+    """Connection pool that counts its connections, and how long it takes to get one."""
+
+    def __init__(self, **kwargs: Any):
+        super().__init__(**kwargs)
+        self.connections = 0
+        self._handed_out: set[Any] = set()
+        self.acquired = 0
+        self.wait_time = 0.0
+
+    @property
+    def in_use(self) -> int:
+        return len(self._handed_out)
+
+    def reset(self) -> None:
+        # Forget all connections, like the pool does, for example after a fork.
+        super().reset()
+        self.connections = 0
+        self._handed_out = set()
+
+    def make_connection(self):
+        self.connections += 1
+        return super().make_connection()
+
+    async def get_connection(self, *args: Any, **kwargs: Any):  # type: ignore[override]
+        start = time.perf_counter()
+        try:
+            connection = await super().get_connection(*args, **kwargs)
+        finally:
+            self.acquired += 1
+            self.wait_time += time.perf_counter() - start
+        self._handed_out.add(connection)
+        return connection
+
+    async def release(self, connection: Any) -> None:
+        # Connections that failed to connect are released before they were handed out.
+        self._handed_out.discard(connection)
+        await super().release(connection)
+
+
+class RedisManager:
+    """Manages the single Redis client of this worker.
+
+    The client and its connection pool are created on first use. In the lifespan of the
+    app, `start` also opens `min_connections` connections up front and checks the health
+    of the connections periodically, which reopens connections that were dropped.
+
+    Without a `redis_url`, an in-memory fake Redis server is used instead.
+    """
+
+    def __init__(self, url: str | None, pool_settings: RedisPoolSettings):
+        self._url = url
+        self._settings = pool_settings
+        self._pool: _InstrumentedConnectionPool | None = None
+        self._client: redis.Redis | None = None
+        self._health_check: asyncio.Task | None = None
+        self.healthy = True
+
+    @property
+    def client(self) -> redis.Redis:
+        if self._url is None:
+            return FakeAsyncRedis(server=_fake_redis_server)
+
+        if self._client is None:
+            self._pool = _InstrumentedConnectionPool.from_url(
+                self._url,
+                max_connections=self._settings.max_connections,
+                timeout=self._settings.timeout,
+                health_check_interval=self._settings.health_check_interval,
+            )
+            self._client = redis.Redis(connection_pool=self._pool)
+        return self._client
+
+    async def check_health(self) -> bool:
+        """Ping Redis over `min_connections` connections at once, opening them as needed."""
+        client = self.client
+        try:
+            await asyncio.gather(
+                *(client.ping() for _ in range(max(self._settings.min_connections, 1)))
+            )
+        except (redis.RedisError, OSError) as e:
+            if self.healthy:
+                logger.error("Redis health check failed: %s", e)
+            self.healthy = False
+        else:
+            if not self.healthy:
+                logger.info("Redis is healthy again")
+            self.healthy = True
+        return self.healthy
+
+    async def _check_health_periodically(self) -> None:
+        while True:
+            await asyncio.sleep(self._settings.health_check_interval)
+            await self.check_health()
+
+    async def start(self) -> None:
+        """Open the minimum number of connections, and start the health checks."""
+        await self.check_health()
+        self._health_check = asyncio.create_task(self._check_health_periodically())
+
+    async def close(self) -> None:
+        """Stop the health checks, and close all connections."""
+        if self._health_check is not None:
+            self._health_check.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._health_check
+            self._health_check = None
+        if self._client is not None and self._pool is not None:
+            await self._client.aclose()
+            await self._pool.disconnect()
+            self._client = self._pool = None
+
+    def stats(self) -> RedisPoolStats | None:
+        """Get statistics of the connection pool, or None if no pool is used (yet)."""
+        if self._pool is None:
+            return None
+        return RedisPoolStats(
+            in_use=self._pool.in_use,
+            idle=self._pool.connections - self._pool.in_use,
+            max_connections=self._settings.max_connections,
+            acquired=self._pool.acquired,
+            wait_time=self._pool.wait_time,
+            healthy=self.healthy,
+        )
+
+
+redis_manager = RedisManager(settings.redis_url, settings.redis_pool)
+
+
 async def get_redis():
-    if _redis_connection_pool:
-        yield redis.Redis(connection_pool=_redis_connection_pool)
-    else:
-        yield FakeAsyncRedis(server=_fake_redis_server)
+    yield redis_manager.client
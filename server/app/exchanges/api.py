@@ -1,25 +1,42 @@
+import time
 from datetime import UTC, datetime, timedelta
 from typing import Annotated
 
 import jwt
+import redis.asyncio as redis
 from fastapi import APIRouter, BackgroundTasks, Body, Depends, HTTPException, Query
-from pydantic import ValidationError
+from fastapi.responses import Response, StreamingResponse
+from pydantic import TypeAdapter, ValidationError
+from pydantic_core import to_json
 
 from app.config import settings
+from app.dependencies import get_redis
 from app.models import HTTPExceptionResponse
-from app.utils import create_condiscon
+from app.responses import ModelResponse, ModelRoute
+from app.utils import compile_condiscon, create_condiscon
+from app.yivi.cache import fingerprint, request_jwt_cache
 from app.yivi.models import (
     DisclosureRequest,
     DisclosureRequestJWT,
     DisclosureSessionResultJWT,
     ExtendedDisclosureRequest,
+    compact_translations,
+)
+from app.yivi.service import jwt_service
+
+from .dependencies import (
+    ExchangesStorage,
+    PushReplyStatus,
+    get_exchange,
+    get_exchange_result_page,
+    get_exchange_with_reply_count,
+    get_exchanges_storage,
 )
-
-from .dependencies import ExchangesStorage, get_exchange, get_exchanges_storage
 from .email import send_initiator_exchange_result_email
 from .models import (
     CreateExchangeRequest,
     DisclosedValue,
+    DisclosedValues,
     Exchange,
     ExchangeReply,
     ExchangeResultResponse,
@@ -29,7 +46,15 @@ from .models import (
     RecipientResponseResponse,
 )
 
-router = APIRouter()
+router = APIRouter(route_class=ModelRoute)
+
+CompactTranslations = Annotated[
+    bool,
+    Query(
+        description="Give translated values that are the same in every language as a single "
+        "string, instead of an object with all translations.",
+    ),
+]
 
 
 @router.post("/create/")
@@ -61,12 +86,14 @@ async def create(
         + [*exchange.public_initiator_attributes, *exchange.attributes]
     )
 
-    disclosure_request = DisclosureRequestJWT(
-        sprequest=ExtendedDisclosureRequest(
-            validity=settings.session_request_validity,
-            request=DisclosureRequest(disclose=condiscon),
-        ),
-    ).signed_jwt()
+    disclosure_request = await jwt_service.sign(
+        DisclosureRequestJWT(
+            sprequest=ExtendedDisclosureRequest(
+                validity=settings.session_request_validity,
+                request=DisclosureRequest(disclose=condiscon),
+            ),
+        )
+    )
 
     return InitiatorExchangeResponse(
         id=exchange.id,
@@ -96,14 +123,16 @@ async def start(
         raise HTTPException(status_code=400, detail="Exchange already started")
 
     try:
-        result = DisclosureSessionResultJWT.parse_jwt(disclosure_result)
+        result = await jwt_service.parse_session_result(
+            DisclosureSessionResultJWT, disclosure_result
+        )
     except jwt.PyJWTError:
         raise HTTPException(status_code=400, detail="Invalid JWT")
     except ValidationError:
         raise HTTPException(status_code=400, detail="Invalid session result")
 
     if not result.satisfies_condiscon(
-        create_condiscon(
+        compile_condiscon(
             [settings.email_attribute, *exchange.public_initiator_attributes, *exchange.attributes]
             if exchange.send_email
             else [*exchange.public_initiator_attributes, *exchange.attributes]
@@ -143,26 +172,30 @@ async def start(
     },
 )
 async def get_exchange_info(
-    exchange: Annotated[Exchange, Depends(get_exchange)],
-    storage: Annotated[ExchangesStorage, Depends(get_exchanges_storage)],
+    exchange_with_reply_count: Annotated[
+        tuple[Exchange, int], Depends(get_exchange_with_reply_count)
+    ],
+    redis_client: Annotated[redis.Redis, Depends(get_redis)],
 ) -> RecipientExchangeResponse:
     """Get information about an exchange, allowing a recipient to decide to respond."""
+    exchange, reply_count = exchange_with_reply_count
     if not exchange.started:
         raise HTTPException(status_code=404, detail="Exchange not found")
 
-    if exchange.type == ExchangeType.ONE_TO_ONE:
-        replies = await storage.get_replies(exchange.id)
-        if replies:
-            raise HTTPException(status_code=404, detail="Exchange not found")
+    if exchange.type == ExchangeType.ONE_TO_ONE and reply_count > 0:
+        raise HTTPException(status_code=404, detail="Exchange not found")
 
-    disclosure_request = DisclosureRequestJWT(
-        sprequest=ExtendedDisclosureRequest(
-            validity=settings.session_request_validity,
-            request=DisclosureRequest(
-                disclose=create_condiscon(exchange.attributes),
+    condiscon = create_condiscon(exchange.attributes)
+    disclosure_request = await request_jwt_cache.get_or_sign(
+        f"exchange:{exchange.id}:{fingerprint(condiscon, settings.session_request_validity)}",
+        lambda: DisclosureRequestJWT(
+            sprequest=ExtendedDisclosureRequest(
+                validity=settings.session_request_validity,
+                request=DisclosureRequest(disclose=condiscon),
             ),
         ),
-    ).signed_jwt()
+        redis=redis_client if settings.request_jwt_cache_redis else None,
+    )
 
     return RecipientExchangeResponse(
         attributes=exchange.attributes,
@@ -179,29 +212,32 @@ async def get_exchange_info(
     },
 )
 async def respond(
-    exchange: Annotated[Exchange, Depends(get_exchange)],
+    exchange_with_reply_count: Annotated[
+        tuple[Exchange, int], Depends(get_exchange_with_reply_count)
+    ],
     disclosure_result: Annotated[str, Body(title="Disclosure session result JWT", embed=True)],
     storage: Annotated[ExchangesStorage, Depends(get_exchanges_storage)],
+    redis_client: Annotated[redis.Redis, Depends(get_redis)],
     background_tasks: BackgroundTasks,
 ) -> RecipientResponseResponse:
     """Submit the session result JWT of a recipient's disclosure."""
+    exchange, reply_count = exchange_with_reply_count
     if not exchange.started:
         raise HTTPException(status_code=404, detail="Exchange not found")
 
-    if exchange.type == ExchangeType.ONE_TO_ONE:
-        # TODO: prevent race condition that could allow saving multiple replies.
-        replies = await storage.get_replies(exchange.id)
-        if replies:
-            raise HTTPException(status_code=404, detail="Exchange not found")
+    if exchange.type == ExchangeType.ONE_TO_ONE and reply_count > 0:
+        raise HTTPException(status_code=404, detail="Exchange not found")
 
     try:
-        result = DisclosureSessionResultJWT.parse_jwt(disclosure_result)
+        result = await jwt_service.parse_session_result(
+            DisclosureSessionResultJWT, disclosure_result
+        )
     except jwt.PyJWTError:
         raise HTTPException(status_code=400, detail="Invalid JWT")
     except ValidationError:
         raise HTTPException(status_code=400, detail="Invalid session result")
 
-    if not result.satisfies_condiscon(create_condiscon(exchange.attributes)):
+    if not result.satisfies_condiscon(compile_condiscon(exchange.attributes)):
         raise HTTPException(status_code=400, detail="Invalid session result")
 
     disclosed_values = {
@@ -216,10 +252,23 @@ async def respond(
             DisclosedValue(id=id, value=disclosed_values[id].value) for id in exchange.attributes
         ],
     )
-    await storage.push_reply(exchange, reply)
+    notify_initiator = bool(exchange.send_email and exchange.initiator_email_value)
+    digest = (
+        notify_initiator
+        and exchange.type == ExchangeType.ONE_TO_MANY
+        and settings.email_digest_window > 0
+    )
+    digest_at = time.time() + settings.email_digest_window if digest else None
+    if await storage.push_reply(exchange, reply, digest_at) != PushReplyStatus.ACCEPTED:
+        # Another reply was saved concurrently, while this one was being verified.
+        raise HTTPException(status_code=404, detail="Exchange not found")
 
-    if exchange.send_email and exchange.initiator_email_value:
-        background_tasks.add_task(send_initiator_exchange_result_email, exchange, reply)
+    if notify_initiator and not digest:
+        if settings.email_outbox == "redis":
+            # Make sure the email is stored before responding.
+            await send_initiator_exchange_result_email(exchange, reply, redis_client)
+        else:
+            background_tasks.add_task(send_initiator_exchange_result_email, exchange, reply)
 
     return RecipientResponseResponse(
         public_initiator_attribute_values=exchange.public_initiator_attribute_values,  # type: ignore
@@ -231,38 +280,92 @@ async def respond(
 
 @router.get(
     "/{exchange_id}/result/",
+    response_model=ExchangeResultResponse,
     responses={
         404: {"model": HTTPExceptionResponse},
     },
 )
 async def get_exchange_result(
-    exchange: Annotated[Exchange, Depends(get_exchange)],
-    secret: Annotated[str, Query(pattern="^[0-9a-f]{32}$", embed=True)],
-    storage: Annotated[ExchangesStorage, Depends(get_exchanges_storage)],
-) -> ExchangeResultResponse:
+    exchange_result_page: Annotated[
+        tuple[Exchange, list[ExchangeReply], int | None], Depends(get_exchange_result_page)
+    ],
+    compact: CompactTranslations = False,
+) -> ExchangeResultResponse | Response:
     """Get the result of an exchange.
 
     This can be used by the initiator to retrieve the response of the recipient(s).
     A recipient can also use this by providing their `recipient_secret`, although it
-    does not provide any new information for them.
+    does not provide any new information for them: they only get their own reply.
+
+    The replies are paginated: use `next_cursor` from the response as `cursor` to
+    get the next page.
     """
+    exchange, replies, next_cursor = exchange_result_page
     if not exchange.started:
         raise HTTPException(status_code=404, detail="Exchange not found")
 
-    replies = await storage.get_replies(exchange.id)
+    response = ExchangeResultResponse(
+        public_initiator_attribute_values=exchange.public_initiator_attribute_values,  # type: ignore
+        initiator_attribute_values=exchange.initiator_attribute_values,  # type: ignore
+        replies=[reply.attribute_values for reply in replies],
+        next_cursor=next_cursor,
+    )
+    if compact:
+        return ModelResponse(compact_translations(response.model_dump(mode="json", by_alias=True)))
+    return response
+
+
+_disclosed_values_adapter = TypeAdapter(DisclosedValues)
+
+
+def _ndjson_line(reply: ExchangeReply, compact: bool) -> bytes:
+    if compact:
+        values = _disclosed_values_adapter.dump_python(
+            reply.attribute_values, mode="json", by_alias=True
+        )
+        return to_json(compact_translations(values)) + b"\n"
+    return _disclosed_values_adapter.dump_json(reply.attribute_values, by_alias=True) + b"\n"
+
+
+@router.get(
+    "/{exchange_id}/result/stream/",
+    response_class=StreamingResponse,
+    responses={
+        200: {
+            "description": "Newline-delimited JSON, with the disclosed attributes of one reply "
+            "per line, in the order the replies were received in.",
+            "content": {"application/x-ndjson": {}},
+        },
+        404: {"model": HTTPExceptionResponse},
+    },
+)
+async def stream_exchange_result(
+    exchange: Annotated[Exchange, Depends(get_exchange)],
+    secret: Annotated[str, Query(pattern="^[0-9a-f]{32}$", embed=True)],
+    storage: Annotated[ExchangesStorage, Depends(get_exchanges_storage)],
+    compact: CompactTranslations = False,
+) -> StreamingResponse:
+    """Stream all replies of an exchange, for exchanges with many replies.
 
-    if secret != exchange.initiator_secret and secret not in [
-        reply.recipient_secret for reply in replies
-    ]:
+    This is the same as `/result/`, but without the initiator's attributes, and with
+    all replies streamed as newline-delimited JSON instead of paginated. Replies are
+    fetched from storage in batches, so memory usage does not grow with their number.
+    """
+    if not exchange.started:
         raise HTTPException(status_code=404, detail="Exchange not found")
 
-    if secret != exchange.initiator_secret and exchange.type == ExchangeType.ONE_TO_ONE:
-        visible_replies = [next(reply for reply in replies if secret == reply.recipient_secret)]
-    else:
-        visible_replies = replies
+    own_reply = None
+    if secret != exchange.initiator_secret:
+        own_reply = await storage.get_reply_by_secret(exchange.id, secret)
+        if own_reply is None:
+            raise HTTPException(status_code=404, detail="Exchange not found")
 
-    return ExchangeResultResponse(
-        public_initiator_attribute_values=exchange.public_initiator_attribute_values,  # type: ignore
-        initiator_attribute_values=exchange.initiator_attribute_values,  # type: ignore
-        replies=[reply.attribute_values for reply in visible_replies],
-    )
+    async def lines():
+        if own_reply is not None:
+            yield _ndjson_line(own_reply, compact)
+            return
+
+        async for reply in storage.iter_replies(exchange.id):
+            yield _ndjson_line(reply, compact)
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
@@ -1,52 +1,460 @@
+import weakref
+from collections.abc import AsyncIterator
+from enum import StrEnum
 from typing import Annotated
 
 import redis.asyncio as redis
-from fastapi import Depends, HTTPException, Path
+from fastapi import Depends, HTTPException, Path, Query
 
+from app.cache import RecordCache, record_cache
+from app.codecs import Codec, get_codec
+from app.config import settings
 from app.dependencies import get_redis
-from app.exchanges.models import Exchange, ExchangeReply
+from app.exchanges.models import Exchange, ExchangeReply, ExchangeType
+from app.metrics import instrument_storage
 
+# Sorted set of the IDs of exchanges with replies that are waiting for a digest email, by
+# the time at which the digest is due.
+DIGESTS_KEY = "email_digests"
 
+# Atomically append a reply, index it by its recipient secret, and set the expiry of the
+# replies list and index, unless only a single reply is allowed (ARGV[3] == "1") and there
+# already is one. If ARGV[5] is not empty, a digest of the exchange ARGV[6] is scheduled at
+# that time, unless one is scheduled already.
+_PUSH_REPLY_SCRIPT = """
+if ARGV[3] == "1" and redis.call("LLEN", KEYS[1]) > 0 then
+    return 0
+end
+local length = redis.call("RPUSH", KEYS[1], ARGV[1])
+redis.call("HSET", KEYS[2], ARGV[4], length - 1)
+redis.call("EXPIREAT", KEYS[1], ARGV[2])
+redis.call("EXPIREAT", KEYS[2], ARGV[2])
+if ARGV[5] ~= "" then
+    redis.call("ZADD", KEYS[3], "NX", ARGV[5], ARGV[6])
+end
+return 1
+"""
+
+# Get a single reply by its recipient secret, using the index. Returns 0 if the reply is
+# not in the index, but not all replies are indexed, as replies that were stored before
+# the index existed are not in it.
+_GET_REPLY_BY_SECRET_SCRIPT = """
+local index = redis.call("HGET", KEYS[2], ARGV[1])
+if index then
+    return redis.call("LINDEX", KEYS[1], index)
+end
+if redis.call("HLEN", KEYS[2]) < redis.call("LLEN", KEYS[1]) then
+    return 0
+end
+return false
+"""
+
+# Add the replies with recipient secrets ARGV[1], ARGV[2], ... at indices 0, 1, ... to the
+# index, which expires together with the replies.
+_INDEX_REPLIES_SCRIPT = """
+for i, secret in ipairs(ARGV) do
+    redis.call("HSETNX", KEYS[2], secret, i - 1)
+end
+local ttl = redis.call("PTTL", KEYS[1])
+if ttl > 0 then
+    redis.call("PEXPIRE", KEYS[2], ttl)
+end
+"""
+
+# Get an exchange together with either the reply with the given recipient secret, if there
+# is one, or the replies at indices ARGV[2] through ARGV[3]. The second element of the
+# result is 1 if the first reply is the one with the given recipient secret, and 2 if it
+# is not but not all replies are indexed, in which case the caller has to look for the
+# reply itself. If ARGV[4] is not "1", the exchange is cached by the caller, so only the
+# replies are fetched.
+_GET_EXCHANGE_RESULT_SCRIPT = """
+local exchange = 1
+if ARGV[4] == "1" then
+    exchange = redis.call("GET", KEYS[1])
+    if not exchange then
+        return {false, 0}
+    end
+end
+local index = redis.call("HGET", KEYS[3], ARGV[1])
+if index then
+    return {exchange, 1, redis.call("LINDEX", KEYS[2], index)}
+end
+local result = {exchange, 0}
+if redis.call("HLEN", KEYS[3]) < redis.call("LLEN", KEYS[2]) then
+    result[2] = 2
+end
+for _, reply in ipairs(redis.call("LRANGE", KEYS[2], ARGV[2], ARGV[3])) do
+    table.insert(result, reply)
+end
+return result
+"""
+
+# Claim at most ARGV[3] exchanges of which the digest is due at ARGV[1], by postponing
+# them to ARGV[2]. If the digest is not finished by then, it is claimed again.
+_CLAIM_DIGESTS_SCRIPT = """
+local ids = redis.call("ZRANGEBYSCORE", KEYS[1], "-inf", ARGV[1], "LIMIT", 0, ARGV[3])
+for _, id in ipairs(ids) do
+    redis.call("ZADD", KEYS[1], "XX", ARGV[2], id)
+end
+return ids
+"""
+
+# Get an exchange with the index of its first reply that is not in a digest yet, and at
+# most ARGV[1] replies from that index. If ARGV[2] is not "1", the exchange is cached by
+# the caller, so only the replies are fetched.
+_GET_DIGEST_SCRIPT = """
+local exchange = 1
+if ARGV[2] == "1" then
+    exchange = redis.call("GET", KEYS[1])
+    if not exchange then
+        return {false, 0}
+    end
+end
+local cursor = tonumber(redis.call("GET", KEYS[3]) or "0")
+local result = {exchange, cursor}
+for _, reply in ipairs(redis.call("LRANGE", KEYS[2], cursor, cursor + ARGV[1] - 1)) do
+    table.insert(result, reply)
+end
+return result
+"""
+
+# Mark the replies before index ARGV[1] as sent in a digest. If more replies were added
+# in the meantime, the next digest is scheduled at ARGV[4], and otherwise it is removed.
+_FINISH_DIGEST_SCRIPT = """
+redis.call("SET", KEYS[3], ARGV[1], "EXAT", ARGV[2])
+if redis.call("LLEN", KEYS[2]) > tonumber(ARGV[1]) then
+    redis.call("ZADD", KEYS[1], ARGV[4], ARGV[3])
+else
+    redis.call("ZREM", KEYS[1], ARGV[3])
+end
+"""
+
+
+class _Scripts:
+    """The Lua scripts of `ExchangesStorage`, registered with a Redis client."""
+
+    def __init__(self, redis: redis.Redis):
+        self.push_reply = redis.register_script(_PUSH_REPLY_SCRIPT)
+        self.get_reply_by_secret = redis.register_script(_GET_REPLY_BY_SECRET_SCRIPT)
+        self.get_exchange_result = redis.register_script(_GET_EXCHANGE_RESULT_SCRIPT)
+        self.index_replies = redis.register_script(_INDEX_REPLIES_SCRIPT)
+        self.claim_digests = redis.register_script(_CLAIM_DIGESTS_SCRIPT)
+        self.get_digest = redis.register_script(_GET_DIGEST_SCRIPT)
+        self.finish_digest = redis.register_script(_FINISH_DIGEST_SCRIPT)
+
+
+# Scripts by the client they are registered with, so that they are registered only once
+# per client rather than for every storage, which is created for every request.
+_scripts: weakref.WeakKeyDictionary[redis.Redis, _Scripts] = weakref.WeakKeyDictionary()
+
+
+def _get_scripts(redis: redis.Redis) -> _Scripts:
+    scripts = _scripts.get(redis)
+    if scripts is None:
+        scripts = _scripts[redis] = _Scripts(redis)
+    return scripts
+
+
+class PushReplyStatus(StrEnum):
+    """Result of an attempt to add a reply to an exchange."""
+
+    ACCEPTED = "accepted"
+    ALREADY_REPLIED = "already_replied"
+
+
+@instrument_storage("exchanges")
 class ExchangesStorage:
     """Storage backend using Redis.
 
-    This stores `Exchange` objects as JSON strings at `exchange:{id}`.
+    This stores `Exchange` objects, encoded by the configured codec, at `exchange:{id}`.
     The corresponding replies are stored in a list at `exchange_replies:{id}`,
-    in order of creation.
+    in order of creation. A hash at `exchange_reply_index:{id}` maps the recipient
+    secret of each reply to its index in that list, so a recipient's reply can be
+    found without scanning all replies. Replies that were stored before the index existed
+    are added to it the first time that they are looked for.
+
+    Exchanges that get digest emails are in the sorted set at `email_digests`, by the
+    time at which the next digest is due. The index of the first reply that has not been
+    in a digest yet is stored at `exchange_digest_cursor:{id}`.
+
+    Each method needs only a single round trip to Redis, using pipelines or Lua scripts
+    where multiple keys are involved. With a `cache`, exchanges that were read before are
+    not fetched again: `get_exchange` then needs no round trip at all, and the methods that
+    also get replies only fetch the replies.
     """
 
-    def __init__(self, redis: redis.Redis):
+    def __init__(
+        self, redis: redis.Redis, codec: Codec | None = None, cache: RecordCache | None = None
+    ):
         self._redis = redis
+        self._codec = codec or get_codec(settings.storage_codec)
+        self._cache = cache or record_cache
+        self._trusted_load = settings.storage_trusted_load
+        self._compact = settings.storage_compact_translations
+        self._scripts = _get_scripts(redis)
 
     async def save_exchange(self, exchange: Exchange) -> None:
         """Save or update an exchange."""
         await self._redis.set(
             f"exchange:{exchange.id}",
-            exchange.model_dump_json(),
+            self._codec.encode(exchange, trusted=self._trusted_load, compact=self._compact),
             exat=exchange.expire_at,
         )
+        if self._cache is not None:
+            self._cache.invalidate(f"exchange:{exchange.id}")
+
+    def _get_cached_exchange(self, id: str) -> tuple[Exchange | None, int]:
+        """Get an exchange from the cache, if it is cached.
+
+        The second element is the generation of the cache, to pass to `_load_exchange`
+        if the exchange has to be fetched from Redis.
+        """
+        if self._cache is None:
+            return None, 0
+        cached = self._cache.get(f"exchange:{id}")
+        exchange = (
+            self._codec.decode(Exchange, cached, trusted=self._trusted_load)
+            if cached is not None
+            else None
+        )
+        return exchange, self._cache.generation
+
+    def _load_exchange(self, id: str, data: bytes, generation: int) -> Exchange:
+        """Decode an exchange fetched from Redis, and cache it."""
+        exchange = self._codec.decode(Exchange, data, trusted=self._trusted_load)
+        if self._cache is not None:
+            self._cache.put(f"exchange:{id}", data, exchange.expire_at.timestamp(), generation)
+        return exchange
 
     async def get_exchange(self, id: str) -> Exchange | None:
         """Get an exchange by its ID, or None if it doesn't exist."""
+        exchange, generation = self._get_cached_exchange(id)
+        if exchange is not None:
+            return exchange
+
         data = await self._redis.get(f"exchange:{id}")
-        return Exchange.model_validate_json(data) if data else None
+        return self._load_exchange(id, data, generation) if data else None  # type: ignore[arg-type]
+
+    async def push_reply(
+        self, exchange: Exchange, reply: ExchangeReply, digest_at: float | None = None
+    ) -> PushReplyStatus:
+        """Add a new reply to an exchange, if the exchange allows it.
+
+        This is done atomically in a single round trip, so that a 1-to-1 exchange
+        can never get more than one reply, even with concurrent replies.
+
+        If `digest_at` is given, a digest email of the exchange is scheduled at that
+        timestamp, unless one is scheduled already.
+        """
+        accepted = await self._scripts.push_reply(
+            keys=[
+                f"exchange_replies:{reply.exchange_id}",
+                f"exchange_reply_index:{reply.exchange_id}",
+                DIGESTS_KEY,
+            ],
+            args=[
+                self._codec.encode(reply, trusted=self._trusted_load, compact=self._compact),
+                int(exchange.expire_at.timestamp()),
+                1 if exchange.type == ExchangeType.ONE_TO_ONE else 0,
+                reply.recipient_secret,
+                "" if digest_at is None else digest_at,
+                reply.exchange_id,
+            ],
+        )
+        return PushReplyStatus.ACCEPTED if accepted else PushReplyStatus.ALREADY_REPLIED
+
+    async def get_exchange_with_reply_count(self, id: str) -> tuple[Exchange | None, int]:
+        """Get an exchange by its ID together with its number of replies, in one round trip."""
+        exchange, generation = self._get_cached_exchange(id)
+        if exchange is not None:
+            return exchange, await self._redis.llen(f"exchange_replies:{id}")  # type: ignore
+
+        pipeline = self._redis.pipeline(transaction=False)
+        pipeline.get(f"exchange:{id}")
+        pipeline.llen(f"exchange_replies:{id}")
+        data, reply_count = await pipeline.execute()
+        return (self._load_exchange(id, data, generation) if data else None), reply_count
 
-    async def push_reply(self, exchange: Exchange, reply: ExchangeReply) -> None:
-        """Add a new reply to an exchange."""
-        await self._redis.rpush(f"exchange_replies:{reply.exchange_id}", reply.model_dump_json())  # type: ignore
-        await self._redis.expireat(f"exchange_replies:{reply.exchange_id}", exchange.expire_at)
+    async def get_exchange_with_replies(
+        self, id: str, start: int = 0, stop: int = -1
+    ) -> tuple[Exchange | None, list[ExchangeReply]]:
+        """Get an exchange by its ID together with its replies, in one round trip.
 
-    async def get_replies(self, exchange_id: str) -> list[ExchangeReply]:
-        """Get all replies for an exchange.
+        Only the replies at indices `start` through `stop` (inclusive, like `LRANGE`)
+        are returned. By default, all replies are returned.
+        """
+        exchange, generation = self._get_cached_exchange(id)
+        if exchange is not None:
+            return exchange, await self.get_replies(id, start, stop)
+
+        pipeline = self._redis.pipeline(transaction=False)
+        pipeline.get(f"exchange:{id}")
+        pipeline.lrange(f"exchange_replies:{id}", start, stop)
+        data, replies_data = await pipeline.execute()
+        if not data:
+            return None, []
+        return self._load_exchange(id, data, generation), [
+            self._codec.decode(ExchangeReply, reply) for reply in replies_data
+        ]
+
+    async def get_exchange_result(
+        self, id: str, secret: str, start: int = 0, stop: int = -1
+    ) -> tuple[Exchange | None, ExchangeReply | None, list[ExchangeReply]]:
+        """Get an exchange with either a recipient's own reply or a range of replies.
+
+        If `secret` is the recipient secret of a reply, that reply is returned as the second
+        element, and only that single reply is fetched. Otherwise, the replies at indices
+        `start` through `stop` (inclusive, like `LRANGE`) are returned as the third element.
+        This is done in one round trip, unless some replies are not in the index yet.
+        """
+        exchange, generation = self._get_cached_exchange(id)
+        data, is_own_reply, *replies_data = await self._scripts.get_exchange_result(
+            keys=[f"exchange:{id}", f"exchange_replies:{id}", f"exchange_reply_index:{id}"],
+            args=[secret, start, stop, 1 if exchange is None else 0],
+        )
+        if not data:
+            return None, None, []
+
+        if exchange is None:
+            exchange = self._load_exchange(id, data, generation)
+        replies = [self._codec.decode(ExchangeReply, reply) for reply in replies_data]
+        if is_own_reply == 1:
+            return exchange, replies[0], []
+        if is_own_reply == 2:
+            own_reply = await self._find_unindexed_reply(id, secret)
+            if own_reply is not None:
+                return exchange, own_reply, []
+        return exchange, None, replies
+
+    async def count_replies(self, exchange_id: str) -> int:
+        """Get the number of replies for an exchange, without fetching them."""
+        return await self._redis.llen(f"exchange_replies:{exchange_id}")  # type: ignore
+
+    async def has_replies(self, exchange_id: str) -> bool:
+        """Whether an exchange has any replies, without fetching them.
+
+        Redis removes empty lists, so the list exists if and only if there are replies.
+        """
+        return bool(await self._redis.exists(f"exchange_replies:{exchange_id}"))
 
+    async def get_replies(
+        self, exchange_id: str, start: int = 0, stop: int = -1
+    ) -> list[ExchangeReply]:
+        """Get the replies for an exchange.
+
+        Only the replies at indices `start` through `stop` (inclusive, like `LRANGE`)
+        are returned. By default, all replies are returned.
         Returns an empty list if the exchange doesn't exist.
         """
-        data = await self._redis.lrange(f"exchange_replies:{exchange_id}", 0, -1)  # type: ignore
-        return [ExchangeReply.model_validate_json(reply) for reply in data]
+        data = await self._redis.lrange(f"exchange_replies:{exchange_id}", start, stop)  # type: ignore
+        return [self._codec.decode(ExchangeReply, reply) for reply in data]
+
+    async def get_reply_by_secret(
+        self, exchange_id: str, recipient_secret: str
+    ) -> ExchangeReply | None:
+        """Get the reply with the given recipient secret, or None if there is none.
+
+        This fetches only that single reply, regardless of the number of replies, unless
+        some replies are not in the index yet.
+        """
+        data = await self._scripts.get_reply_by_secret(
+            keys=[f"exchange_replies:{exchange_id}", f"exchange_reply_index:{exchange_id}"],
+            args=[recipient_secret],
+        )
+        if data == 0:
+            return await self._find_unindexed_reply(exchange_id, recipient_secret)
+        return self._codec.decode(ExchangeReply, data) if data else None
+
+    async def _find_unindexed_reply(
+        self, exchange_id: str, recipient_secret: str
+    ) -> ExchangeReply | None:
+        """Find a reply by scanning all replies, and add them all to the index.
+
+        This is only needed for replies that were stored before the index existed.
+        """
+        replies = await self.get_replies(exchange_id)
+        if replies:
+            await self._scripts.index_replies(
+                keys=[f"exchange_replies:{exchange_id}", f"exchange_reply_index:{exchange_id}"],
+                args=[reply.recipient_secret for reply in replies],
+            )
+        return next(
+            (reply for reply in replies if reply.recipient_secret == recipient_secret), None
+        )
+
+    async def iter_replies(
+        self, exchange_id: str, start: int = 0, batch_size: int = 100
+    ) -> AsyncIterator[ExchangeReply]:
+        """Iterate over the replies for an exchange, fetching `batch_size` replies at a time.
+
+        This keeps memory usage flat regardless of the number of replies. Replies
+        that are added while iterating are included, as replies are only ever appended.
+        """
+        while True:
+            replies = await self.get_replies(exchange_id, start, start + batch_size - 1)
+            for reply in replies:
+                yield reply
+            if len(replies) < batch_size:
+                return
+            start += batch_size
+
+    async def claim_digests(self, now: float, until: float, count: int) -> list[str]:
+        """Claim at most `count` exchanges of which a digest email is due at `now`.
+
+        Claimed digests are postponed to `until`, so that other workers don't send them
+        as well. If a digest is not finished by then, it can be claimed again.
+        """
+        ids = await self._scripts.claim_digests(keys=[DIGESTS_KEY], args=[now, until, count])
+        return [id.decode() for id in ids]
+
+    async def get_digest(
+        self, id: str, limit: int
+    ) -> tuple[Exchange | None, int, list[ExchangeReply]]:
+        """Get an exchange with at most `limit` of the replies not in a digest yet.
+
+        The second element is the index of the first of those replies.
+        """
+        exchange, generation = self._get_cached_exchange(id)
+        data, cursor, *replies_data = await self._scripts.get_digest(
+            keys=[f"exchange:{id}", f"exchange_replies:{id}", f"exchange_digest_cursor:{id}"],
+            args=[limit, 1 if exchange is None else 0],
+        )
+        if not data:
+            return None, 0, []
+        return (
+            exchange or self._load_exchange(id, data, generation),
+            cursor,
+            [self._codec.decode(ExchangeReply, reply) for reply in replies_data],
+        )
+
+    async def finish_digest(self, exchange: Exchange, cursor: int, next_at: float) -> None:
+        """Mark the replies before index `cursor` as sent in a digest.
+
+        If there are more replies, the next digest is scheduled at `next_at`.
+        """
+        await self._scripts.finish_digest(
+            keys=[
+                DIGESTS_KEY,
+                f"exchange_replies:{exchange.id}",
+                f"exchange_digest_cursor:{exchange.id}",
+            ],
+            args=[cursor, int(exchange.expire_at.timestamp()), exchange.id, next_at],
+        )
+
+    async def cancel_digest(self, id: str) -> None:
+        """Stop sending digests for an exchange, for example after it was deleted."""
+        await self._redis.zrem(DIGESTS_KEY, id)
 
     async def delete_exchange(self, id: str) -> None:
         """Delete an exchange and any replies by its ID."""
-        await self._redis.delete(f"exchange:{id}", f"exchange_replies:{id}")
+        await self._redis.delete(
+            f"exchange:{id}",
+            f"exchange_replies:{id}",
+            f"exchange_reply_index:{id}",
+            f"exchange_digest_cursor:{id}",
+        )
+        if self._cache is not None:
+            self._cache.invalidate(f"exchange:{id}")
 
 
 async def get_exchanges_storage(redis: Annotated[redis.Redis, Depends(get_redis)]):
@@ -62,3 +470,43 @@ async def get_exchange(
         raise HTTPException(status_code=404, detail="Exchange not found")
 
     yield exchange
+
+
+async def get_exchange_with_reply_count(
+    storage: Annotated[ExchangesStorage, Depends(get_exchanges_storage)],
+    exchange_id: Annotated[str, Path(pattern="^[0-9a-f]{16}$")],
+):
+    exchange, reply_count = await storage.get_exchange_with_reply_count(exchange_id)
+    if exchange is None:
+        raise HTTPException(status_code=404, detail="Exchange not found")
+
+    yield exchange, reply_count
+
+
+async def get_exchange_result_page(
+    storage: Annotated[ExchangesStorage, Depends(get_exchanges_storage)],
+    exchange_id: Annotated[str, Path(pattern="^[0-9a-f]{16}$")],
+    secret: Annotated[str, Query(pattern="^[0-9a-f]{32}$")],
+    cursor: Annotated[int, Query(ge=0, description="Index of the first reply to return.")] = 0,
+    limit: Annotated[
+        int, Query(ge=1, le=1000, description="Maximum number of replies to return.")
+    ] = 100,
+):
+    """Get an exchange with the replies visible to the initiator or recipient with `secret`.
+
+    The initiator gets one page of replies and the cursor of the next page. One reply more
+    than `limit` is fetched, to know whether there is a next page. A recipient only gets
+    their own reply, which is looked up by its secret.
+    """
+    exchange, own_reply, replies = await storage.get_exchange_result(
+        exchange_id, secret, cursor, cursor + limit
+    )
+    if exchange is None:
+        raise HTTPException(status_code=404, detail="Exchange not found")
+
+    if own_reply is not None:
+        yield exchange, [own_reply], None
+    elif secret == exchange.initiator_secret:
+        yield exchange, replies[:limit], (cursor + limit if len(replies) > limit else None)
+    else:
+        raise HTTPException(status_code=404, detail="Exchange not found")
@@ -0,0 +1,90 @@
+"""Digest emails, that send the replies to an exchange in a window as a single email.
+
+The schedule is kept in Redis, so every API worker runs a scheduler. Due digests are
+claimed atomically, so each digest is sent by a single worker.
+"""
+
+import asyncio
+import contextlib
+import logging
+import time
+
+import redis.asyncio as redis
+
+from app.config import settings
+from app.utils import send_email
+
+from .dependencies import ExchangesStorage
+from .email import (
+    render_initiator_exchange_result_email,
+    render_initiator_exchange_results_digest_email,
+)
+
+logger = logging.getLogger(__name__)
+
+
+class DigestScheduler:
+    """Sends the digest emails that are due.
+
+    A claimed digest is postponed by `lease` seconds, after which it is claimed again if
+    it could not be sent. At most `max_replies` replies are sent in a single digest, the
+    remaining replies follow in the next one.
+    """
+
+    def __init__(
+        self,
+        redis: redis.Redis,
+        window: int,
+        lease: float = 60,
+        batch_size: int = 20,
+        max_replies: int = 1000,
+        poll_interval: float = 1,
+    ):
+        self._redis = redis
+        self._storage = ExchangesStorage(redis)
+        self._window = window
+        self._lease = lease
+        self._batch_size = batch_size
+        self._max_replies = max_replies
+        self._poll_interval = poll_interval
+        self.sent = 0
+
+    @classmethod
+    def from_settings(cls, redis: redis.Redis) -> "DigestScheduler":
+        return cls(redis, settings.email_digest_window)
+
+    async def _send(self, id: str, now: float) -> None:
+        exchange, cursor, replies = await self._storage.get_digest(id, self._max_replies)
+        if exchange is None:
+            await self._storage.cancel_digest(id)
+            return
+
+        if replies and exchange.initiator_email_value:
+            if len(replies) == 1:
+                message = render_initiator_exchange_result_email(exchange, replies[0])
+            else:
+                message = render_initiator_exchange_results_digest_email(exchange, replies)
+            await send_email(message, self._redis)
+            self.sent += 1
+        await self._storage.finish_digest(exchange, cursor + len(replies), now + self._window)
+
+    async def process(self, now: float | None = None) -> int:
+        """Send the digests that are due, and return how many were claimed."""
+        now = time.time() if now is None else now
+        ids = await self._storage.claim_digests(now, now + self._lease, self._batch_size)
+        results = await asyncio.gather(*(self._send(id, now) for id in ids), return_exceptions=True)
+        for id, result in zip(ids, results):
+            if isinstance(result, Exception):
+                logger.error("Failed to send digest of exchange %s", id, exc_info=result)
+        return len(ids)
+
+    async def run(self, stop: asyncio.Event) -> None:
+        """Send digests until `stop` is set."""
+        while not stop.is_set():
+            try:
+                if await self.process() == self._batch_size:
+                    continue
+            except Exception:
+                logger.exception("Unexpected error in digest scheduler")
+            with contextlib.suppress(TimeoutError):
+                await asyncio.wait_for(stop.wait(), self._poll_interval)
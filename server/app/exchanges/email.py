@@ -1,39 +1,66 @@
 import logging
+from collections.abc import Sequence
 from email.message import EmailMessage
 
+import redis.asyncio as redis
+
 from app.config import settings
 from app.exchanges.models import Exchange, ExchangeReply
-from app.utils import ATTRIBUTE_DISPLAY_OPTIONS, send_email
+from app.templates import (
+    EXCHANGE_RESULT_DIGEST_EMAIL,
+    EXCHANGE_RESULT_EMAIL,
+    Context,
+    Language,
+    attribute_display_renderer,
+)
+from app.utils import send_email
 
 logger = logging.getLogger(__name__)
 
+_REPLY_HEADING: dict[Language, str] = {"nl": "Antwoord", "en": "Reply"}
+
 
-async def send_initiator_exchange_result_email(exchange: Exchange, reply: ExchangeReply):
+def _message(exchange: Exchange, subject: str, body: str) -> EmailMessage:
     message = EmailMessage()
     message["From"] = f"noreply@{settings.email_from_domain}"
     message["To"] = exchange.initiator_email_value
-    message["Subject"] = "Antwoord via DIYivi"
+    message["Subject"] = subject
+    message.set_content(body)
+    return message
 
-    values = {dv.id: dv.value for dv in reply.attribute_values}
-    attributes = set(values.keys())
 
-    attributes_display = "\n".join(
-        f"- {option['label']}: {option['display'](values)}"  # type: ignore
-        for option in ATTRIBUTE_DISPLAY_OPTIONS
-        if option["required_attributes"].issubset(attributes)  # type: ignore
+def render_initiator_exchange_result_email(
+    exchange: Exchange, reply: ExchangeReply
+) -> EmailMessage:
+    attributes = attribute_display_renderer.render(
+        {dv.id: dv.value for dv in reply.attribute_values}, settings.email_languages
+    )
+    return _message(
+        exchange,
+        *EXCHANGE_RESULT_EMAIL.render({"attributes": attributes}, settings.email_languages),
     )
 
-    message.set_content(
-        f"""Beste gebruiker van DIYivi,
-
-Gefeliciteerd! Iemand heeft gereageerd op je verzoek om gegevens uit te wisselen.
-Dit zijn de gegevens die je hebt ontvangen:
-
-{attributes_display}
 
-Al deze gegevens worden vanzelf binnen 48 uur van DIYivi verwijderd.
-Dit is een automatisch gegenereerd bericht. U kunt hier niet op reageren.
-"""
+def render_initiator_exchange_results_digest_email(
+    exchange: Exchange, replies: Sequence[ExchangeReply]
+) -> EmailMessage:
+    """Render a single email with all of `replies`, for example those of the last hour."""
+    languages = settings.email_languages
+    rendered = attribute_display_renderer.render_many(
+        ({dv.id: dv.value for dv in reply.attribute_values} for reply in replies), languages
     )
+    replies_display = {
+        language: "\n\n".join(
+            f"{_REPLY_HEADING[language]} {i}:\n{text[language]}"
+            for i, text in enumerate(rendered, 1)
+        )
+        for language in languages
+    }
+    context: Context = {"count": str(len(replies)), "replies": replies_display}
+    return _message(exchange, *EXCHANGE_RESULT_DIGEST_EMAIL.render(context, languages))
+
 
-    await send_email(message)
+async def send_initiator_exchange_result_email(
+    exchange: Exchange, reply: ExchangeReply, redis: redis.Redis | None = None
+):
+    await send_email(render_initiator_exchange_result_email(exchange, reply), redis)
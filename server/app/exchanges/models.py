@@ -4,12 +4,12 @@ from typing import Self
 
 from pydantic import BaseModel, EmailStr, Field, model_validator
 
-from app.yivi.models import Attribute, Timestamp, TranslatedString
+from app.yivi.models import AllowedAttribute, Attribute, Timestamp, TranslatedString
 
 
 class ExchangeType(StrEnum):
     ONE_TO_ONE = "1-to-1"
-    # ONE_TO_MANY = "1-to-many"
+    ONE_TO_MANY = "1-to-many"
     # MANY_TO_MANY = "many-to-many"
 
 
@@ -153,10 +153,9 @@ class CreateExchangeRequest(BaseModel):
 
     send_email: bool
 
-    # TODO: whitelist for all attributes?
-    attributes: list[Attribute] = Field(min_length=1)
+    attributes: list[AllowedAttribute] = Field(min_length=1)
 
-    public_initiator_attributes: list[Attribute] = Field(
+    public_initiator_attributes: list[AllowedAttribute] = Field(
         description="""Attributes that the recipient already knows about the initiator.
 
         This is used to prevent a party B from becoming a man-in-the-middle by forwarding an
@@ -224,3 +223,10 @@ class ExchangeResultResponse(BaseModel):
         The replies are ordered in the order the replies were received in.
         """,
     )
+
+    next_cursor: int | None = Field(
+        description="""The cursor to request the next page of replies with.
+
+        This is null if there are no more replies (yet).
+        """,
+    )
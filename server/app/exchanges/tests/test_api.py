@@ -1,3 +1,5 @@
+import asyncio
+import time
 from datetime import UTC, datetime, timedelta
 
 import jwt
@@ -389,6 +391,33 @@ class TestGetExchangeInfo:
             }
         ]
 
+    @pytest.mark.anyio
+    async def test_request_jwt_reused(self, storage):
+        exchange = self.exchange.model_copy()
+        exchange.public_initiator_attribute_values = [
+            DisclosedValue(
+                id="pbdf.sidn-pbdf.mobilenumber.mobilenumber",
+                value=TranslatedString(default="31612345678", en="31612345678", nl="31612345678"),
+            )
+        ]
+        exchange.initiator_attribute_values = [
+            DisclosedValue(
+                id="pbdf.sidn-pbdf.email.email",
+                value=TranslatedString(
+                    default="foo@example.com", en="foo@example.com", nl="foo@example.com"
+                ),
+            )
+        ]
+        await storage.save_exchange(exchange)
+
+        async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as ac:
+            first_response = await ac.get(f"/api/exchanges/{self.exchange.id}/")
+            second_response = await ac.get(f"/api/exchanges/{self.exchange.id}/")
+
+        assert first_response.status_code == 200
+        assert second_response.status_code == 200
+        assert first_response.json()["request_jwt"] == second_response.json()["request_jwt"]
+
     @pytest.mark.anyio
     async def test_already_responded(self, storage):
         reply = ExchangeReply(
@@ -585,6 +614,144 @@ class TestRespond:
         # Adding a second reply to a 1-to-1 exchange is not allowed.
         assert response.status_code == 404
 
+    @pytest.mark.anyio
+    async def test_concurrent_responses(self, storage):
+        exchange = self.exchange.model_copy()
+        exchange.public_initiator_attribute_values = [
+            DisclosedValue(id=self.phonenumber.id, value=self.phonenumber.value)
+        ]
+        exchange.initiator_attribute_values = [
+            DisclosedValue(id=self.email.id, value=self.email.value)
+        ]
+        # Remove replies from other tests.
+        await storage.delete_exchange(exchange.id)
+        await storage.save_exchange(exchange)
+
+        result = jwt.encode(
+            {
+                **_common_result_jwt_fields,
+                "disclosed": [
+                    [self.email.model_dump(mode="json")],
+                ],
+            },
+            key=_irmaserver_jwt_private_key,
+            algorithm="RS256",
+        )
+
+        async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as ac:
+            responses = await asyncio.gather(
+                *(
+                    ac.post(
+                        f"/api/exchanges/{self.exchange.id}/respond/",
+                        json={"disclosure_result": result},
+                    )
+                    for _ in range(200)
+                )
+            )
+
+        # Only a single reply can be accepted for a 1-to-1 exchange.
+        status_codes = [response.status_code for response in responses]
+        assert status_codes.count(200) == 1
+        assert status_codes.count(404) == 199
+        assert len(await storage.get_replies(exchange.id)) == 1
+
+    @pytest.mark.anyio
+    async def test_one_to_many(self, storage):
+        exchange = self.exchange.model_copy(
+            update={"id": "2" * 16, "type": ExchangeType.ONE_TO_MANY}
+        )
+        exchange.public_initiator_attribute_values = [
+            DisclosedValue(id=self.phonenumber.id, value=self.phonenumber.value)
+        ]
+        exchange.initiator_attribute_values = [
+            DisclosedValue(id=self.email.id, value=self.email.value)
+        ]
+        await storage.delete_exchange(exchange.id)
+        await storage.save_exchange(exchange)
+
+        result = jwt.encode(
+            {
+                **_common_result_jwt_fields,
+                "disclosed": [
+                    [self.email.model_dump(mode="json")],
+                ],
+            },
+            key=_irmaserver_jwt_private_key,
+            algorithm="RS256",
+        )
+
+        async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as ac:
+            responses = await asyncio.gather(
+                *(
+                    ac.post(
+                        f"/api/exchanges/{exchange.id}/respond/",
+                        json={"disclosure_result": result},
+                    )
+                    for _ in range(100)
+                )
+            )
+            recipient_secret = responses[42].json()["recipient_secret"]
+            result_response = await ac.get(
+                f"/api/exchanges/{exchange.id}/result/",
+                params={"secret": recipient_secret},
+            )
+
+        # All replies are accepted, and each recipient only gets to see their own reply.
+        assert [response.status_code for response in responses] == [200] * 100
+        assert await storage.count_replies(exchange.id) == 100
+        assert result_response.status_code == 200
+        assert len(result_response.json()["replies"]) == 1
+
+    @pytest.mark.anyio
+    async def test_digest(self, storage, monkeypatch):
+        monkeypatch.setattr(settings, "email_digest_window", 3600)
+        sent = []
+
+        async def send_email(exchange, reply, redis=None):
+            sent.append(reply)
+
+        monkeypatch.setattr("app.exchanges.api.send_initiator_exchange_result_email", send_email)
+        exchange = self.exchange.model_copy(
+            update={
+                "id": "3" * 16,
+                "type": ExchangeType.ONE_TO_MANY,
+                "initiator_email_value": "initiator@example.com",
+            }
+        )
+        exchange.public_initiator_attribute_values = [
+            DisclosedValue(id=self.phonenumber.id, value=self.phonenumber.value)
+        ]
+        exchange.initiator_attribute_values = [
+            DisclosedValue(id=self.email.id, value=self.email.value)
+        ]
+        await storage.delete_exchange(exchange.id)
+        await storage.save_exchange(exchange)
+
+        result = jwt.encode(
+            {
+                **_common_result_jwt_fields,
+                "disclosed": [
+                    [self.email.model_dump(mode="json")],
+                ],
+            },
+            key=_irmaserver_jwt_private_key,
+            algorithm="RS256",
+        )
+
+        async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as ac:
+            for _ in range(3):
+                response = await ac.post(
+                    f"/api/exchanges/{exchange.id}/respond/",
+                    json={"disclosure_result": result},
+                )
+                assert response.status_code == 200
+
+        # Instead of an email for each reply, a single digest is scheduled.
+        assert sent == []
+        assert await storage.claim_digests(now=time.time() + 3600, until=0, count=10) == [
+            exchange.id
+        ]
+
 
 class TestGetExchangeResult:
     phonenumber = DisclosedAttribute(
@@ -703,3 +870,110 @@ class TestGetExchangeResult:
 
         assert response.status_code == 404
         assert response.json() == {"detail": "Exchange not found"}
+
+    @pytest.mark.anyio
+    async def test_pagination(self, storage):
+        exchange = self.exchange.model_copy(
+            update={"id": "1" * 16, "type": ExchangeType.ONE_TO_MANY}
+        )
+        replies = [
+            ExchangeReply(
+                exchange_id=exchange.id, attribute_values=[self.reply.attribute_values[0]]
+            )
+            for _ in range(5)
+        ]
+        await storage.delete_exchange(exchange.id)
+        await storage.save_exchange(exchange)
+        for reply in replies:
+            await storage.push_reply(exchange, reply)
+
+        pages = []
+        cursor = 0
+        async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as ac:
+            while cursor is not None:
+                response = await ac.get(
+                    f"/api/exchanges/{exchange.id}/result/",
+                    params={"secret": exchange.initiator_secret, "cursor": cursor, "limit": 2},
+                )
+                assert response.status_code == 200
+                pages.append(len(response.json()["replies"]))
+                cursor = response.json()["next_cursor"]
+
+            # A recipient only sees their own reply, even if it is not on the first page.
+            response = await ac.get(
+                f"/api/exchanges/{exchange.id}/result/",
+                params={"secret": replies[4].recipient_secret, "limit": 2},
+            )
+
+        assert pages == [2, 2, 1]
+        assert response.status_code == 200
+        assert len(response.json()["replies"]) == 1
+        assert response.json()["next_cursor"] is None
+
+    @pytest.mark.anyio
+    async def test_stream(self, storage):
+        await storage.delete_exchange(self.exchange.id)
+        await storage.save_exchange(self.exchange)
+        await storage.push_reply(self.exchange, self.reply)
+
+        async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as ac:
+            response = await ac.get(
+                f"/api/exchanges/{self.exchange.id}/result/stream/",
+                params={"secret": self.exchange.initiator_secret},
+            )
+            recipient_response = await ac.get(
+                f"/api/exchanges/{self.exchange.id}/result/stream/",
+                params={"secret": self.reply.recipient_secret},
+            )
+
+        assert response.status_code == 200
+        assert response.headers["content-type"] == "application/x-ndjson"
+        assert response.text == (
+            '[{"id":"pbdf.sidn-pbdf.email.email",'
+            '"value":{"":"bar@example.com","nl":"bar@example.com","en":"bar@example.com"}}]\n'
+        )
+        assert recipient_response.text == response.text
+
+    @pytest.mark.anyio
+    async def test_stream_invalid_secret(self, storage):
+        await storage.save_exchange(self.exchange)
+
+        async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as ac:
+            response = await ac.get(
+                f"/api/exchanges/{self.exchange.id}/result/stream/",
+                params={"secret": "b" * 32},
+            )
+
+        assert response.status_code == 404
+        assert response.json() == {"detail": "Exchange not found"}
+
+    @pytest.mark.anyio
+    async def test_compact(self, storage):
+        await storage.delete_exchange(self.exchange.id)
+        await storage.save_exchange(self.exchange)
+        await storage.push_reply(self.exchange, self.reply)
+
+        async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as ac:
+            response = await ac.get(
+                f"/api/exchanges/{self.exchange.id}/result/",
+                params={"secret": self.exchange.initiator_secret, "compact": True},
+            )
+            stream_response = await ac.get(
+                f"/api/exchanges/{self.exchange.id}/result/stream/",
+                params={"secret": self.exchange.initiator_secret, "compact": True},
+            )
+
+        assert response.status_code == 200
+        assert response.json() == {
+            "public_initiator_attribute_values": [
+                {"id": "pbdf.sidn-pbdf.mobilenumber.mobilenumber", "value": "31612345678"},
+            ],
+            "initiator_attribute_values": [
+                {"id": "pbdf.sidn-pbdf.email.email", "value": "foo@example.com"},
+            ],
+            "replies": [[{"id": "pbdf.sidn-pbdf.email.email", "value": "bar@example.com"}]],
+            "next_cursor": None,
+        }
+        assert stream_response.text == (
+            '[{"id":"pbdf.sidn-pbdf.email.email","value":"bar@example.com"}]\n'
+        )
@@ -0,0 +1,358 @@
+import asyncio
+
+import pytest
+import pytest_asyncio
+from fakeredis import FakeAsyncRedis
+
+from app.exchanges.dependencies import (
+    _CLAIM_DIGESTS_SCRIPT,
+    _FINISH_DIGEST_SCRIPT,
+    _GET_DIGEST_SCRIPT,
+    _GET_EXCHANGE_RESULT_SCRIPT,
+    _GET_REPLY_BY_SECRET_SCRIPT,
+    _INDEX_REPLIES_SCRIPT,
+    _PUSH_REPLY_SCRIPT,
+    ExchangesStorage,
+    PushReplyStatus,
+)
+from app.exchanges.models import Exchange, ExchangeReply, ExchangeType
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+@pytest_asyncio.fixture(scope="function")
+async def storage():
+    async with FakeAsyncRedis() as client:
+        yield ExchangesStorage(client)
+
+
+class RoundTripCounter:
+    """Counts round trips to Redis, by counting connections taken from the pool.
+
+    Both a single command and a pipeline take one connection from the pool.
+    """
+
+    def __init__(self, redis: FakeAsyncRedis, monkeypatch: pytest.MonkeyPatch):
+        self.count = 0
+        get_connection = redis.connection_pool.get_connection
+
+        async def counting_get_connection(*args, **kwargs):
+            self.count += 1
+            return await get_connection(*args, **kwargs)
+
+        monkeypatch.setattr(redis.connection_pool, "get_connection", counting_get_connection)
+
+
+@pytest_asyncio.fixture(scope="function")
+async def round_trips(storage, monkeypatch):
+    # Make sure that Lua scripts are already loaded, as they would be in a running server.
+    await storage._redis.script_load(_PUSH_REPLY_SCRIPT)
+    await storage._redis.script_load(_GET_REPLY_BY_SECRET_SCRIPT)
+    await storage._redis.script_load(_GET_EXCHANGE_RESULT_SCRIPT)
+    await storage._redis.script_load(_INDEX_REPLIES_SCRIPT)
+    await storage._redis.script_load(_CLAIM_DIGESTS_SCRIPT)
+    await storage._redis.script_load(_GET_DIGEST_SCRIPT)
+    await storage._redis.script_load(_FINISH_DIGEST_SCRIPT)
+    return RoundTripCounter(storage._redis, monkeypatch)
+
+
+class TestReplyCount:
+    @pytest.mark.anyio
+    async def test_no_replies(self, storage, make_exchange):
+        exchange = make_exchange()
+        await storage.save_exchange(exchange)
+
+        assert await storage.count_replies(exchange.id) == 0
+        assert not await storage.has_replies(exchange.id)
+        saved_exchange, reply_count = await storage.get_exchange_with_reply_count(exchange.id)
+        assert saved_exchange.id == exchange.id
+        assert reply_count == 0
+
+    @pytest.mark.anyio
+    async def test_with_reply(self, storage, make_exchange, make_reply):
+        exchange = make_exchange()
+        await storage.save_exchange(exchange)
+        await storage.push_reply(exchange, make_reply(exchange))
+
+        assert await storage.count_replies(exchange.id) == 1
+        assert await storage.has_replies(exchange.id)
+        saved_exchange, reply_count = await storage.get_exchange_with_reply_count(exchange.id)
+        assert saved_exchange.id == exchange.id
+        assert reply_count == 1
+
+    @pytest.mark.anyio
+    async def test_exchange_not_found(self, storage):
+        assert await storage.get_exchange_with_reply_count("0" * 16) == (None, 0)
+
+
+@pytest.fixture
+def push_replies(storage, make_reply):
+    """Push `count` replies to an exchange, and get their recipient secrets."""
+
+    async def push_replies(exchange: Exchange, count: int) -> list[str]:
+        replies = [make_reply(exchange) for _ in range(count)]
+        for reply in replies:
+            await storage.push_reply(exchange, reply)
+        return [reply.recipient_secret for reply in replies]
+
+    return push_replies
+
+
+class TestReplyPages:
+    @pytest.mark.anyio
+    async def test_get_replies_window(self, storage, make_exchange, push_replies):
+        exchange = make_exchange(ExchangeType.ONE_TO_MANY)
+        await storage.save_exchange(exchange)
+        secrets = await push_replies(exchange, 5)
+
+        replies = await storage.get_replies(exchange.id, 1, 2)
+        assert [reply.recipient_secret for reply in replies] == secrets[1:3]
+
+        _, replies = await storage.get_exchange_with_replies(exchange.id, 3, 10)
+        assert [reply.recipient_secret for reply in replies] == secrets[3:]
+
+    @pytest.mark.anyio
+    async def test_iter_replies(self, storage, round_trips, make_exchange, push_replies):
+        exchange = make_exchange(ExchangeType.ONE_TO_MANY)
+        secrets = await push_replies(exchange, 5)
+        round_trips.count = 0
+
+        replies = [reply async for reply in storage.iter_replies(exchange.id, batch_size=2)]
+
+        assert [reply.recipient_secret for reply in replies] == secrets
+        assert round_trips.count == 3
+
+    @pytest.mark.anyio
+    async def test_iter_replies_empty(self, storage):
+        assert [reply async for reply in storage.iter_replies("0" * 16)] == []
+
+
+class TestOneToMany:
+    @pytest.mark.anyio
+    async def test_one_to_one_allows_single_reply(self, storage, make_exchange, make_reply):
+        exchange = make_exchange()
+        assert await storage.push_reply(exchange, make_reply(exchange)) == PushReplyStatus.ACCEPTED
+        assert (
+            await storage.push_reply(exchange, make_reply(exchange))
+            == PushReplyStatus.ALREADY_REPLIED
+        )
+
+    @pytest.mark.anyio
+    async def test_get_reply_by_secret(self, storage, make_exchange, push_replies):
+        exchange = make_exchange(ExchangeType.ONE_TO_MANY)
+        secrets = await push_replies(exchange, 3)
+
+        reply = await storage.get_reply_by_secret(exchange.id, secrets[1])
+        assert reply.recipient_secret == secrets[1]
+        assert await storage.get_reply_by_secret(exchange.id, "b" * 32) is None
+        assert await storage.get_reply_by_secret("0" * 16, secrets[1]) is None
+
+    @pytest.mark.anyio
+    async def test_get_exchange_result(self, storage, make_exchange, push_replies):
+        exchange = make_exchange(ExchangeType.ONE_TO_MANY)
+        await storage.save_exchange(exchange)
+        secrets = await push_replies(exchange, 3)
+
+        saved_exchange, own_reply, replies = await storage.get_exchange_result(
+            exchange.id, secrets[2]
+        )
+        assert saved_exchange.id == exchange.id
+        assert own_reply.recipient_secret == secrets[2]
+        assert replies == []
+
+        saved_exchange, own_reply, replies = await storage.get_exchange_result(
+            exchange.id, exchange.initiator_secret, 0, 1
+        )
+        assert saved_exchange.id == exchange.id
+        assert own_reply is None
+        assert [reply.recipient_secret for reply in replies] == secrets[:2]
+
+        assert await storage.get_exchange_result("0" * 16, secrets[0]) == (None, None, [])
+
+    @pytest.mark.anyio
+    async def test_index_expires_with_replies(self, storage, make_exchange, push_replies):
+        exchange = make_exchange(ExchangeType.ONE_TO_MANY)
+        await push_replies(exchange, 1)
+
+        replies_ttl = await storage._redis.ttl(f"exchange_replies:{exchange.id}")
+        assert 0 < replies_ttl <= 600
+        assert await storage._redis.ttl(f"exchange_reply_index:{exchange.id}") == replies_ttl
+
+        await storage.delete_exchange(exchange.id)
+        assert not await storage._redis.exists(f"exchange_reply_index:{exchange.id}")
+
+    @pytest.mark.anyio
+    async def test_many_concurrent_replies(self, make_exchange, make_reply):
+        exchange = make_exchange(ExchangeType.ONE_TO_MANY)
+        replies = [make_reply(exchange) for _ in range(1000)]
+
+        # Allow a connection per responder, like the unbounded pool of the real server.
+        async with FakeAsyncRedis(max_connections=len(replies)) as client:
+            storage = ExchangesStorage(client)
+            statuses = await asyncio.gather(
+                *(storage.push_reply(exchange, reply) for reply in replies)
+            )
+
+            assert set(statuses) == {PushReplyStatus.ACCEPTED}
+            assert await storage.count_replies(exchange.id) == len(replies)
+            # Every reply can be found by its secret, whatever order they were added in.
+            for reply in replies[::100]:
+                found = await storage.get_reply_by_secret(exchange.id, reply.recipient_secret)
+                assert found.recipient_secret == reply.recipient_secret
+
+
+class TestUnindexedReplies:
+    """Replies that were stored before the index existed are found as well."""
+
+    async def _push_unindexed_reply(self, storage, exchange: Exchange, reply: ExchangeReply):
+        key = f"exchange_replies:{exchange.id}"
+        await storage._redis.rpush(key, storage._codec.encode(reply))
+        await storage._redis.expireat(key, exchange.expire_at)
+
+    @pytest.mark.anyio
+    async def test_get_reply_by_secret(self, storage, make_exchange, make_reply, push_replies):
+        exchange = make_exchange(ExchangeType.ONE_TO_MANY)
+        reply = make_reply(exchange)
+        await self._push_unindexed_reply(storage, exchange, reply)
+        secrets = await push_replies(exchange, 1)
+
+        found = await storage.get_reply_by_secret(exchange.id, reply.recipient_secret)
+        assert found.recipient_secret == reply.recipient_secret
+        assert await storage.get_reply_by_secret(exchange.id, "b" * 32) is None
+
+        # The index is backfilled, and expires together with the replies.
+        index = await storage._redis.hgetall(f"exchange_reply_index:{exchange.id}")
+        assert index == {reply.recipient_secret.encode(): b"0", secrets[0].encode(): b"1"}
+        assert await storage._redis.ttl(f"exchange_reply_index:{exchange.id}") > 0
+
+    @pytest.mark.anyio
+    async def test_get_exchange_result(self, storage, round_trips, make_exchange, make_reply):
+        exchange = make_exchange(ExchangeType.ONE_TO_MANY)
+        await storage.save_exchange(exchange)
+        reply = make_reply(exchange)
+        await self._push_unindexed_reply(storage, exchange, reply)
+        round_trips.count = 0
+
+        _, own_reply, replies = await storage.get_exchange_result(
+            exchange.id, reply.recipient_secret
+        )
+        assert own_reply.recipient_secret == reply.recipient_secret
+        assert replies == []
+
+        _, own_reply, replies = await storage.get_exchange_result(
+            exchange.id, exchange.initiator_secret
+        )
+        assert own_reply is None
+        assert [r.recipient_secret for r in replies] == [reply.recipient_secret]
+        # Only the first lookup scans the replies.
+        assert round_trips.count == 4
+
+
+class TestRoundTrips:
+    """Every storage method should need only a single round trip to Redis."""
+
+    @pytest.mark.anyio
+    async def test_save_exchange(self, storage, round_trips, make_exchange):
+        await storage.save_exchange(make_exchange())
+        assert round_trips.count == 1
+
+    @pytest.mark.anyio
+    async def test_get_exchange(self, storage, round_trips):
+        await storage.get_exchange("0" * 16)
+        assert round_trips.count == 1
+
+    @pytest.mark.anyio
+    async def test_push_reply(self, storage, round_trips, make_exchange, make_reply):
+        exchange = make_exchange()
+        await storage.push_reply(exchange, make_reply(exchange))
+        await storage.push_reply(exchange, make_reply(exchange))
+        assert round_trips.count == 2
+
+    @pytest.mark.anyio
+    async def test_get_replies(self, storage, round_trips):
+        await storage.get_replies("0" * 16)
+        assert round_trips.count == 1
+
+    @pytest.mark.anyio
+    async def test_get_reply_by_secret(self, storage, round_trips):
+        await storage.get_reply_by_secret("0" * 16, "0" * 32)
+        assert round_trips.count == 1
+
+    @pytest.mark.anyio
+    async def test_get_exchange_result(self, storage, round_trips, make_exchange, make_reply):
+        exchange = make_exchange()
+        await storage.save_exchange(exchange)
+        await storage.push_reply(exchange, make_reply(exchange))
+        round_trips.count = 0
+
+        await storage.get_exchange_result(exchange.id, exchange.initiator_secret)
+        assert round_trips.count == 1
+
+    @pytest.mark.anyio
+    async def test_count_replies(self, storage, round_trips):
+        await storage.count_replies("0" * 16)
+        await storage.has_replies("0" * 16)
+        assert round_trips.count == 2
+
+    @pytest.mark.anyio
+    async def test_get_exchange_with_reply_count(
+        self, storage, round_trips, make_exchange, make_reply
+    ):
+        exchange = make_exchange()
+        await storage.save_exchange(exchange)
+        await storage.push_reply(exchange, make_reply(exchange))
+        round_trips.count = 0
+
+        await storage.get_exchange_with_reply_count(exchange.id)
+        assert round_trips.count == 1
+
+    @pytest.mark.anyio
+    async def test_get_exchange_with_replies(self, storage, round_trips, make_exchange, make_reply):
+        exchange = make_exchange()
+        await storage.save_exchange(exchange)
+        await storage.push_reply(exchange, make_reply(exchange))
+        round_trips.count = 0
+
+        saved_exchange, replies = await storage.get_exchange_with_replies(exchange.id)
+        assert saved_exchange.id == exchange.id
+        assert len(replies) == 1
+        assert round_trips.count == 1
+
+    @pytest.mark.anyio
+    async def test_claim_digests(self, storage, round_trips):
+        await storage.claim_digests(0, 60, 10)
+        assert round_trips.count == 1
+
+    @pytest.mark.anyio
+    async def test_get_digest(self, storage, round_trips, make_exchange, push_replies):
+        exchange = make_exchange(ExchangeType.ONE_TO_MANY)
+        await storage.save_exchange(exchange)
+        await push_replies(exchange, 3)
+        round_trips.count = 0
+
+        saved_exchange, cursor, replies = await storage.get_digest(exchange.id, 2)
+        assert saved_exchange.id == exchange.id
+        assert cursor == 0
+        assert len(replies) == 2
+        assert round_trips.count == 1
+
+    @pytest.mark.anyio
+    async def test_finish_digest(self, storage, round_trips, make_exchange):
+        exchange = make_exchange(ExchangeType.ONE_TO_MANY)
+        await storage.finish_digest(exchange, 0, 60)
+        assert round_trips.count == 1
+
+    @pytest.mark.anyio
+    async def test_delete_exchange(self, storage, round_trips):
+        await storage.delete_exchange("0" * 16)
+        assert round_trips.count == 1
+
+    @pytest.mark.anyio
+    async def test_scripts_are_registered_once(self, storage):
+        """Storages are created for every request, but share the scripts of their client."""
+        assert ExchangesStorage(storage._redis)._scripts is storage._scripts
+        async with FakeAsyncRedis() as other:
+            assert ExchangesStorage(other)._scripts is not storage._scripts
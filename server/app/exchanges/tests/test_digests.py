@@ -0,0 +1,103 @@
+import pytest
+from fakeredis import FakeAsyncRedis
+
+from app.exchanges.dependencies import DIGESTS_KEY, ExchangesStorage
+from app.exchanges.digests import DigestScheduler
+from app.exchanges.models import ExchangeType
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+@pytest.fixture
+def sent(monkeypatch):
+    """Collect the emails that would be sent."""
+    messages = []
+
+    async def send_email(message, redis=None):
+        messages.append(message)
+
+    monkeypatch.setattr("app.exchanges.digests.send_email", send_email)
+    return messages
+
+
+@pytest.mark.anyio
+async def test_digest(sent, make_exchange, make_reply):
+    async with FakeAsyncRedis() as redis:
+        storage = ExchangesStorage(redis)
+        scheduler = DigestScheduler(redis, window=60)
+        exchange = make_exchange(ExchangeType.ONE_TO_MANY)
+        await storage.save_exchange(exchange)
+
+        # The first reply starts the window.
+        for i in range(3):
+            await storage.push_reply(exchange, make_reply(exchange, f"{i}@example.com"), 1060 + i)
+        assert await redis.zscore(DIGESTS_KEY, exchange.id) == 1060
+
+        assert await scheduler.process(now=1059) == 0
+        assert await scheduler.process(now=1060) == 1
+        assert len(sent) == 1
+        assert sent[0]["Subject"] == "3 antwoorden via DIYivi"
+        for i in range(3):
+            assert f"- E-mailadres: {i}@example.com" in sent[0].get_content()
+        assert await redis.zscore(DIGESTS_KEY, exchange.id) is None
+
+        # A reply after the digest starts a new window, with only the new reply.
+        await storage.push_reply(exchange, make_reply(exchange, "3@example.com"), 1200)
+        assert await scheduler.process(now=1200) == 1
+        assert len(sent) == 2
+        assert sent[1]["Subject"] == "Antwoord via DIYivi"
+        assert "- E-mailadres: 3@example.com" in sent[1].get_content()
+        assert "0@example.com" not in sent[1].get_content()
+
+
+@pytest.mark.anyio
+async def test_digest_claimed_once(sent, make_exchange, make_reply):
+    async with FakeAsyncRedis() as redis:
+        storage = ExchangesStorage(redis)
+        exchange = make_exchange(ExchangeType.ONE_TO_MANY)
+        await storage.save_exchange(exchange)
+        await storage.push_reply(exchange, make_reply(exchange, "foo@example.com"), 1000)
+
+        # Schedulers in different workers share the schedule in Redis.
+        assert await storage.claim_digests(now=1000, until=1060, count=10) == [exchange.id]
+        assert await storage.claim_digests(now=1000, until=1060, count=10) == []
+        # A digest that is not finished in time is claimed again.
+        assert await storage.claim_digests(now=1060, until=1120, count=10) == [exchange.id]
+
+
+@pytest.mark.anyio
+async def test_reply_during_digest(sent, make_exchange, make_reply):
+    async with FakeAsyncRedis() as redis:
+        storage = ExchangesStorage(redis)
+        exchange = make_exchange(ExchangeType.ONE_TO_MANY)
+        await storage.save_exchange(exchange)
+        await storage.push_reply(exchange, make_reply(exchange, "0@example.com"), 1000)
+
+        assert await storage.claim_digests(now=1000, until=1060, count=10) == [exchange.id]
+        _, cursor, replies = await storage.get_digest(exchange.id, limit=100)
+        # This reply arrives while the digest is being sent, when it's already scheduled.
+        await storage.push_reply(exchange, make_reply(exchange, "1@example.com"), 1010)
+        await storage.finish_digest(exchange, cursor + len(replies), next_at=1070)
+
+        assert await redis.zscore(DIGESTS_KEY, exchange.id) == 1070
+        _, cursor, replies = await storage.get_digest(exchange.id, limit=100)
+        assert cursor == 1
+        assert [reply.attribute_values[0].value.nl for reply in replies] == ["1@example.com"]
+
+
+@pytest.mark.anyio
+async def test_deleted_exchange(sent, make_exchange, make_reply):
+    async with FakeAsyncRedis() as redis:
+        storage = ExchangesStorage(redis)
+        scheduler = DigestScheduler(redis, window=60)
+        exchange = make_exchange(ExchangeType.ONE_TO_MANY)
+        await storage.save_exchange(exchange)
+        await storage.push_reply(exchange, make_reply(exchange, "foo@example.com"), 1000)
+        await storage.delete_exchange(exchange.id)
+
+        assert await scheduler.process(now=1000) == 1
+        assert sent == []
+        assert await redis.zcard(DIGESTS_KEY) == 0
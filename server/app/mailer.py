@@ -0,0 +1,214 @@
+"""Durable email outbox in a Redis Stream, and the mailer that sends the emails in it.
+
+API workers add emails to the `email_outbox` stream in a single round trip, and don't
+hold on to them. One or more mailers, run with `python -m app.mailer`, read the stream as
+consumers in the `mailers` group, and send the emails over pooled SMTP connections.
+
+An email is acknowledged and removed from the stream once it is sent. Emails that failed
+with a temporary error, or that were being sent by a mailer that stopped, stay pending,
+and are claimed again after `retry_after` seconds. After `max_deliveries` attempts, or
+after a permanent error, an email is moved to the `email_outbox:dead` stream.
+"""
+
+import asyncio
+import email
+import email.policy
+import logging
+import os
+import signal
+import socket
+from email.message import EmailMessage
+
+import redis.asyncio as redis
+
+from app.config import MailerSettings, SMTPSettings, settings
+from app.smtp import SMTPPool, is_permanent_error
+
+logger = logging.getLogger(__name__)
+
+EMAIL_STREAM = "email_outbox"
+DEAD_LETTER_STREAM = "email_outbox:dead"
+MAILER_GROUP = "mailers"
+
+
+class RedisEmailOutbox:
+    """Adds emails to the outbox stream in Redis."""
+
+    def __init__(self, redis: redis.Redis):
+        self._redis = redis
+
+    async def put(self, message: EmailMessage) -> None:
+        await self._redis.xadd(EMAIL_STREAM, {"message": message.as_bytes()})
+
+
+def _parse(fields: dict[bytes, bytes]) -> EmailMessage:
+    message = email.message_from_bytes(fields[b"message"], policy=email.policy.default)
+    return message  # type: ignore[return-value]
+
+
+class Mailer:
+    """Consumer of the outbox stream, which sends the emails in it.
+
+    `concurrency` loops each claim or read a batch of emails and send them over a
+    connection from the pool, so at most that many batches are being sent at once.
+    """
+
+    def __init__(
+        self,
+        redis: redis.Redis,
+        pool: SMTPPool,
+        smtp_settings: SMTPSettings,
+        mailer_settings: MailerSettings,
+        consumer: str | None = None,
+    ):
+        self._redis = redis
+        self._pool = pool
+        self._batch_size = smtp_settings.batch_size
+        self._settings = mailer_settings
+        self.consumer = consumer or f"{socket.gethostname()}-{os.getpid()}"
+        self.sent = 0
+        self.dead_lettered = 0
+
+    @classmethod
+    def from_settings(cls, redis: redis.Redis, smtp_settings: SMTPSettings) -> "Mailer":
+        return cls(redis, SMTPPool(smtp_settings), smtp_settings, settings.mailer)
+
+    async def setup(self) -> None:
+        """Create the stream and consumer group, if they don't exist yet."""
+        try:
+            await self._redis.xgroup_create(EMAIL_STREAM, MAILER_GROUP, id="0", mkstream=True)
+        except redis.ResponseError as e:
+            if "BUSYGROUP" not in str(e):
+                raise
+
+    async def _claim(self) -> list[tuple[bytes, dict[bytes, bytes]]]:
+        """Claim emails that have been pending for too long.
+
+        Emails that have been tried too often already are dead-lettered instead.
+        """
+        _, entries, _ = await self._redis.xautoclaim(
+            EMAIL_STREAM,
+            MAILER_GROUP,
+            self.consumer,
+            min_idle_time=int(self._settings.retry_after * 1000),
+            start_id="0-0",
+            count=self._batch_size,
+        )
+        if not entries:
+            return []
+
+        pending = await self._redis.xpending_range(
+            EMAIL_STREAM,
+            MAILER_GROUP,
+            min=entries[0][0],
+            max=entries[-1][0],
+            count=len(entries),
+            consumername=self.consumer,
+        )
+        deliveries = {entry["message_id"]: int(entry["times_delivered"]) for entry in pending}
+
+        retry, dead = [], []
+        for entry in entries:
+            if deliveries.get(entry[0], 0) > self._settings.max_deliveries:
+                dead.append((entry, "Too many delivery attempts"))
+            else:
+                retry.append(entry)
+        if dead:
+            await self._finish([], dead)
+        return retry
+
+    async def _read(self, block: int | None) -> list[tuple[bytes, dict[bytes, bytes]]]:
+        response = await self._redis.xreadgroup(
+            MAILER_GROUP,
+            self.consumer,
+            {EMAIL_STREAM: ">"},
+            count=self._batch_size,
+            block=block,
+        )
+        return response[0][1] if response else []  # type: ignore
+
+    async def _finish(
+        self,
+        done: list[tuple[bytes, dict[bytes, bytes]]],
+        dead: list[tuple[tuple[bytes, dict[bytes, bytes]], str]],
+    ) -> None:
+        """Acknowledge and remove sent and dead-lettered emails, in a single round trip."""
+        pipeline = self._redis.pipeline(transaction=False)
+        for (id, fields), reason in dead:
+            logger.error("Dead-lettering email %s: %s", id, reason)
+            pipeline.xadd(
+                DEAD_LETTER_STREAM,
+                {**fields, "id": id, "reason": reason},  # type: ignore[dict-item]
+                maxlen=self._settings.dead_letter_max_length,
+                approximate=True,
+            )
+        ids = [id for id, _ in done] + [id for (id, _), _ in dead]
+        pipeline.xack(EMAIL_STREAM, MAILER_GROUP, *ids)
+        pipeline.xdel(EMAIL_STREAM, *ids)
+        await pipeline.execute()
+
+        self.sent += len(done)
+        self.dead_lettered += len(dead)
+
+    async def _send(self, entries: list[tuple[bytes, dict[bytes, bytes]]]) -> None:
+        errors = await self._pool.send_batch([_parse(fields) for _, fields in entries])
+
+        done, dead = [], []
+        for entry, error in zip(entries, errors):
+            if error is None:
+                done.append(entry)
+            elif is_permanent_error(error):
+                dead.append((entry, str(error)))
+            else:
+                # Leave it pending, to be claimed again after `retry_after`.
+                logger.warning("Failed to send email %s: %s", entry[0], error)
+        if done or dead:
+            await self._finish(done, dead)
+
+    async def process(self, block: int | None = None) -> int:
+        """Send a single batch of emails, and return how many were in it."""
+        entries = await self._claim() or await self._read(block)
+        if entries:
+            await self._send(entries)
+        return len(entries)
+
+    async def _work(self, stop: asyncio.Event) -> None:
+        while not stop.is_set():
+            try:
+                await self.process(block=1000)
+            except Exception:
+                logger.exception("Unexpected error in mailer")
+                await asyncio.sleep(1)
+
+    async def run(self, stop: asyncio.Event) -> None:
+        """Send emails until `stop` is set, and then finish the batches being sent."""
+        await self.setup()
+        await asyncio.gather(*(self._work(stop) for _ in range(self._settings.concurrency)))
+        await self._pool.close()
+
+
+async def _run(redis_client: redis.Redis, smtp_settings: SMTPSettings) -> None:
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+
+    mailer = Mailer.from_settings(redis_client, smtp_settings)
+    logger.info("Mailer %s started", mailer.consumer)
+    try:
+        await mailer.run(stop)
+    finally:
+        await redis_client.aclose()
+    logger.info("Mailer %s stopped after sending %d emails", mailer.consumer, mailer.sent)
+
+
+def main() -> None:
+    logging.basicConfig(level=logging.INFO)
+    if settings.redis_url is None or settings.smtp is None:
+        raise SystemExit("The mailer requires `redis_url` and `smtp` to be configured.")
+
+    asyncio.run(_run(redis.Redis.from_url(settings.redis_url), settings.smtp))
+
+
+if __name__ == "__main__":
+    main()
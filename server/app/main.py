@@ -1,13 +1,67 @@
+import asyncio
 import json
+from contextlib import asynccontextmanager
 
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
+from fastapi.exception_handlers import http_exception_handler
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, Response
+from starlette.exceptions import HTTPException
 
+from app.cache import record_cache
 from app.config import settings
+from app.dependencies import redis_manager
 from app.exchanges.api import router as exchanges_router
+from app.exchanges.digests import DigestScheduler
+from app.metrics import (
+    OUTCOMES,
+    MetricsMiddleware,
+    mark_worker_dead,
+    record_outcome,
+    render_metrics,
+    update_worker_stats_periodically,
+)
+from app.responses import ModelResponse
 from app.signatures.api import router as signatures_router
+from app.smtp import email_outbox
+from app.timing import ServerTimingMiddleware
+from app.yivi.service import JWTServiceOverloadedError, jwt_service
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await redis_manager.start()
+    if email_outbox is not None:
+        email_outbox.open()
+    if record_cache is not None:
+        await record_cache.start(redis_manager.client)
+    stop = asyncio.Event()
+    digests = None
+    if settings.email_digest_window > 0:
+        scheduler = DigestScheduler.from_settings(redis_manager.client)
+        digests = asyncio.create_task(scheduler.run(stop))
+    stats = asyncio.create_task(
+        update_worker_stats_periodically(settings.metrics_update_interval, stop)
+    )
+
+    yield
+
+    stop.set()
+    if digests is not None:
+        await digests
+    await stats
+    jwt_service.shutdown()
+    if email_outbox is not None and settings.smtp is not None:
+        await email_outbox.drain(settings.smtp.drain_timeout)
+    if record_cache is not None:
+        await record_cache.close()
+    await redis_manager.close()
+    mark_worker_dead()
+
 
 app = FastAPI(
+    lifespan=lifespan,
+    default_response_class=ModelResponse,
     title="DIYivi",
     summary="Backend for DIYivi, a DIY tool for exchanging Yivi attributes.",
     openapi_url="/api/openapi.json",
@@ -22,10 +76,38 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(MetricsMiddleware)
+if settings.server_timing:
+    app.add_middleware(ServerTimingMiddleware, allow_origin=settings.client_origin)
+
+
+@app.exception_handler(HTTPException)
+async def http_exception_metrics_handler(request: Request, exc: HTTPException):
+    record_outcome(exc)
+    return await http_exception_handler(request, exc)
+
+
+@app.exception_handler(JWTServiceOverloadedError)
+async def jwt_service_overloaded_handler(request: Request, exc: JWTServiceOverloadedError):
+    OUTCOMES.labels("overloaded").inc()
+    return JSONResponse(
+        status_code=503,
+        content={"detail": "Server is busy, please try again later"},
+        headers={"Retry-After": "1"},
+    )
+
+
 app.include_router(exchanges_router, prefix="/api/exchanges")
 app.include_router(signatures_router, prefix="/api/signatures/requests")
 
 
+@app.get("/api/metrics", include_in_schema=False)
+async def metrics():
+    """Metrics of all workers, in the Prometheus text format."""
+    content, media_type = render_metrics()
+    return Response(content, media_type=media_type)
+
+
 def output_schema():
     schema = app.openapi()
     print(json.dumps(schema, indent=2))  # noqa: T201
@@ -0,0 +1,279 @@
+"""Prometheus metrics of this server, exposed at `/api/metrics`.
+
+There are latency histograms of the API routes, of the methods of the storage classes,
+of JWT signing and verification and of sending emails, and counters of the outcomes of
+requests that failed, such as invalid JWTs. Statistics of the Redis connection pool
+and the record cache are published every `metrics_update_interval`.
+
+With multiple workers, set `PROMETHEUS_MULTIPROC_DIR` to an empty directory that all
+workers can write to. Each worker then writes its metrics to files in that directory,
+and whichever worker handles a scrape aggregates the metrics of all workers.
+"""
+
+import asyncio
+import functools
+import inspect
+import os
+import time
+from collections.abc import Awaitable, Callable
+from typing import Any, TypeVar
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+from starlette.exceptions import HTTPException
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.cache import record_cache
+from app.dependencies import redis_manager
+from app.timing import timed
+
+C = TypeVar("C", bound=type)
+
+# Buckets for operations that take from well below a millisecond (cached reads) up to
+# seconds (JWT verification under load).
+_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+REQUEST_DURATION = Histogram(
+    "diyivi_request_duration_seconds",
+    "Time to handle an API request.",
+    ["method", "route", "status"],
+    buckets=_BUCKETS,
+)
+STORAGE_DURATION = Histogram(
+    "diyivi_storage_duration_seconds",
+    "Time taken by a method of a storage class, mostly spent on Redis.",
+    ["storage", "method"],
+    buckets=_BUCKETS,
+)
+JWT_DURATION = Histogram(
+    "diyivi_jwt_duration_seconds",
+    "Time to sign or verify a JWT in a JWT worker, without waiting for the worker.",
+    ["operation"],
+    buckets=_BUCKETS,
+)
+JWT_WAIT_DURATION = Histogram(
+    "diyivi_jwt_wait_duration_seconds",
+    "Time that a JWT operation waited for a JWT worker.",
+    ["operation"],
+    buckets=_BUCKETS,
+)
+EMAIL_DURATION = Histogram(
+    "diyivi_email_duration_seconds",
+    "Time to add an email to the outbox, or to send a batch of emails over SMTP.",
+    ["stage"],
+    buckets=_BUCKETS,
+)
+OUTCOMES = Counter(
+    "diyivi_outcomes",
+    "Requests that failed, by the reason they failed.",
+    ["outcome"],
+)
+
+JWT_REJECTED = Counter(
+    "diyivi_jwt_rejected",
+    "JWT operations rejected because too many were pending.",
+    ["operation"],
+)
+JWT_PENDING = Gauge(
+    "diyivi_jwt_pending",
+    "JWT operations that are queued or running.",
+    multiprocess_mode="livesum",
+)
+REDIS_CONNECTIONS = Gauge(
+    "diyivi_redis_connections",
+    "Connections in the Redis connection pools.",
+    ["state"],
+    multiprocess_mode="livesum",
+)
+REDIS_CONNECTIONS_ACQUIRED = Counter(
+    "diyivi_redis_connections_acquired",
+    "Times a connection was taken from a Redis connection pool.",
+)
+REDIS_CONNECTION_WAIT = Counter(
+    "diyivi_redis_connection_wait_seconds",
+    "Time spent waiting for a connection from a Redis connection pool.",
+)
+REDIS_HEALTHY = Gauge(
+    "diyivi_redis_healthy",
+    "Whether the last Redis health check of every worker succeeded.",
+    multiprocess_mode="livemin",
+)
+CACHE_REQUESTS = Counter(
+    "diyivi_cache_requests",
+    "Lookups in the record cache.",
+    ["result"],
+)
+CACHE_INVALIDATIONS = Counter(
+    "diyivi_cache_invalidations",
+    "Records invalidated in the record cache.",
+)
+CACHE_ENTRIES = Gauge(
+    "diyivi_cache_entries",
+    "Records in the record cache.",
+    multiprocess_mode="livesum",
+)
+CACHE_BYTES = Gauge(
+    "diyivi_cache_bytes",
+    "Total size of the records in the record cache.",
+    multiprocess_mode="livesum",
+)
+
+# Reasons of failed requests, by the detail of the `HTTPException` that they raised.
+_OUTCOMES = {
+    "Exchange not found": "not_found",
+    "Signature request not found": "not_found",
+    "Exchange already started": "already_started",
+    "Signature request already started": "already_started",
+    "Incorrect initiator secret": "incorrect_secret",
+    "Invalid JWT": "invalid_jwt",
+    "Invalid session result": "invalid_session_result",
+}
+
+
+def record_outcome(exc: HTTPException) -> None:
+    """Count a failed request by its reason, or by its status code for other reasons."""
+    OUTCOMES.labels(_OUTCOMES.get(str(exc.detail), str(exc.status_code))).inc()
+
+
+def instrument_storage(name: str) -> Callable[[C], C]:
+    """Time the public async methods of a storage class, labelled with `name`.
+
+    The time is also reported as Redis I/O in the `Server-Timing` header. Async generators,
+    such as `iter_replies`, are not timed themselves, but the methods they call are.
+    """
+
+    def decorate(cls: C) -> C:
+        for method_name, method in list(vars(cls).items()):
+            if not method_name.startswith("_") and inspect.iscoroutinefunction(method):
+                setattr(
+                    cls, method_name, _timed(STORAGE_DURATION.labels(name, method_name))(method)
+                )
+        return cls
+
+    return decorate
+
+
+def _timed(
+    histogram: Histogram,
+) -> Callable[[Callable[..., Awaitable[Any]]], Callable[..., Awaitable[Any]]]:
+    def decorate(func: Callable[..., Awaitable[Any]]) -> Callable[..., Awaitable[Any]]:
+        @functools.wraps(func)
+        async def wrapper(*args: Any, **kwargs: Any) -> Any:
+            start = time.perf_counter()
+            try:
+                with timed("redis"):
+                    return await func(*args, **kwargs)
+            finally:
+                histogram.observe(time.perf_counter() - start)
+
+        return wrapper
+
+    return decorate
+
+
+class MetricsMiddleware:
+    """Times every request, labelled with the path of the route that handled it.
+
+    The path of the route, such as `/api/exchanges/{exchange_id}`, is used rather than
+    the path of the request, so that there is a bounded number of label values.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            REQUEST_DURATION.labels(scope["method"], _route_path(scope), str(status)).observe(
+                time.perf_counter() - start
+            )
+
+
+def _route_path(scope: Scope) -> str:
+    route = scope.get("route")
+    return route.path if route is not None else "unmatched"
+
+
+class _CounterSync:
+    """Increments a counter by how much a cumulative statistic grew since the last sync."""
+
+    def __init__(self, counter: Counter):
+        self._counter = counter
+        self._last: float = 0
+
+    def sync(self, value: float) -> None:
+        if value > self._last:
+            self._counter.inc(value - self._last)
+        self._last = value
+
+
+_redis_acquired = _CounterSync(REDIS_CONNECTIONS_ACQUIRED)
+_redis_wait = _CounterSync(REDIS_CONNECTION_WAIT)
+_cache_hits = _CounterSync(CACHE_REQUESTS.labels("hit"))
+_cache_misses = _CounterSync(CACHE_REQUESTS.labels("miss"))
+_cache_invalidations = _CounterSync(CACHE_INVALIDATIONS)
+
+
+def update_worker_stats() -> None:
+    """Publish the statistics of the Redis connection pool and cache of this worker."""
+    redis_stats = redis_manager.stats()
+    if redis_stats is not None:
+        REDIS_CONNECTIONS.labels("in_use").set(redis_stats.in_use)
+        REDIS_CONNECTIONS.labels("idle").set(redis_stats.idle)
+        REDIS_HEALTHY.set(redis_stats.healthy)
+        _redis_acquired.sync(redis_stats.acquired)
+        _redis_wait.sync(redis_stats.wait_time)
+
+    if record_cache is not None:
+        cache_stats = record_cache.stats()
+        CACHE_ENTRIES.set(cache_stats.entries)
+        CACHE_BYTES.set(cache_stats.bytes)
+        _cache_hits.sync(cache_stats.hits)
+        _cache_misses.sync(cache_stats.misses)
+        _cache_invalidations.sync(cache_stats.invalidations)
+
+
+async def update_worker_stats_periodically(interval: float, stop: asyncio.Event) -> None:
+    while not stop.is_set():
+        update_worker_stats()
+        try:
+            await asyncio.wait_for(stop.wait(), interval)
+        except TimeoutError:
+            pass
+
+
+def render_metrics() -> tuple[bytes, str]:
+    """Render the metrics of all workers, and get their content type."""
+    update_worker_stats()
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(), CONTENT_TYPE_LATEST
+
+
+def mark_worker_dead() -> None:
+    """Remove the live gauges of this worker, when it stops."""
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        multiprocess.mark_process_dead(os.getpid())
@@ -0,0 +1,85 @@
+"""Responses that serialize the models returned by endpoints once, straight to bytes.
+
+For an endpoint that returns a model, FastAPI dumps the model to Python objects,
+validates those against the response model, and serializes them again to JSON. The
+models returned by our endpoints are built and validated in the endpoint itself, so
+routes of `ModelRoute` serialize them with `model_dump_json` instead.
+"""
+
+import functools
+import inspect
+from collections.abc import Callable, Mapping
+from typing import Any
+
+import pydantic_core
+from fastapi.responses import JSONResponse
+from fastapi.routing import APIRoute
+from pydantic import BaseModel
+from starlette.background import BackgroundTask
+
+from app.timing import timed
+
+
+class ModelResponse(JSONResponse):
+    """JSON response that serializes models with `model_dump_json`.
+
+    Other content is serialized by pydantic-core as well, which is faster than `json`.
+    """
+
+    def __init__(
+        self,
+        content: Any,
+        status_code: int = 200,
+        headers: Mapping[str, str] | None = None,
+        media_type: str | None = None,
+        background: BackgroundTask | None = None,
+        context: dict[str, Any] | None = None,
+    ):
+        self._context = context
+        super().__init__(content, status_code, headers, media_type, background)
+
+    def render(self, content: Any) -> bytes:
+        with timed("serialization"):
+            if isinstance(content, BaseModel):
+                return content.model_dump_json(by_alias=True, context=self._context).encode()
+            return pydantic_core.to_json(content, by_alias=True)
+
+
+class ModelRoute(APIRoute):
+    """Route that responds with a `ModelResponse` if its endpoint returns its response model.
+
+    Only instances of exactly the response model are serialized directly, and only when
+    no options such as `response_model_exclude` are used, so that the response is the
+    same as FastAPI would give. Anything else is handled by FastAPI as usual. The
+    response model is still used for the OpenAPI schema.
+    """
+
+    def __init__(self, path: str, endpoint: Callable[..., Any], **kwargs: Any):
+        # Routes are copied with their endpoint when their router is included.
+        endpoint = getattr(endpoint, "_model_route_endpoint", endpoint)
+        if inspect.iscoroutinefunction(endpoint):
+            endpoint = self._respond_with_model(endpoint)
+        super().__init__(path, endpoint, **kwargs)
+        self._serialize_directly = (
+            isinstance(self.response_model, type)
+            and issubclass(self.response_model, BaseModel)
+            and self.response_model_include is None
+            and self.response_model_exclude is None
+            and self.response_model_by_alias
+            and not self.response_model_exclude_unset
+            and not self.response_model_exclude_defaults
+            and not self.response_model_exclude_none
+        )
+
+    def _respond_with_model(self, endpoint: Callable[..., Any]) -> Callable[..., Any]:
+        # The wrapper has the signature of the endpoint, which FastAPI uses for the
+        # dependencies and the response model.
+        @functools.wraps(endpoint)
+        async def wrapper(*args: Any, **kwargs: Any) -> Any:
+            result = await endpoint(*args, **kwargs)
+            if self._serialize_directly and type(result) is self.response_model:
+                return ModelResponse(result, status_code=self.status_code or 200)
+            return result
+
+        wrapper._model_route_endpoint = endpoint  # type: ignore[attr-defined]
+        return wrapper
@@ -2,12 +2,15 @@ from datetime import UTC, datetime, timedelta
 from typing import Annotated
 
 import jwt
+import redis.asyncio as redis
 from fastapi import APIRouter, BackgroundTasks, Body, Depends, HTTPException
 from pydantic import ValidationError
 
 from app.config import settings
+from app.dependencies import get_redis
 from app.models import HTTPExceptionResponse
-from app.utils import create_condiscon
+from app.responses import ModelRoute
+from app.utils import compile_condiscon, create_condiscon
 from app.yivi.models import (
     DisclosureRequest,
     DisclosureRequestJWT,
@@ -18,6 +21,7 @@ from app.yivi.models import (
     IRMASignatureRequestJWT,
     SignatureSessionResultJWT,
 )
+from app.yivi.service import jwt_service
 
 from .dependencies import (
     SignaturesStorage,
@@ -32,7 +36,7 @@ from .models import (
     SignatureRequestResponse,
 )
 
-router = APIRouter()
+router = APIRouter(route_class=ModelRoute)
 
 
 @router.post("/create/")
@@ -48,12 +52,14 @@ async def create(
     )
     await storage.save_request(request)
 
-    disclosure_request = DisclosureRequestJWT(
-        sprequest=ExtendedDisclosureRequest(
-            validity=settings.session_request_validity,
-            request=DisclosureRequest(disclose=[[[settings.email_attribute]]]),
-        ),
-    ).signed_jwt()
+    disclosure_request = await jwt_service.sign(
+        DisclosureRequestJWT(
+            sprequest=ExtendedDisclosureRequest(
+                validity=settings.session_request_validity,
+                request=DisclosureRequest(disclose=[[[settings.email_attribute]]]),
+            ),
+        )
+    )
 
     return SignatureRequestResponse(
         id=request.id,
@@ -79,13 +85,15 @@ async def start(
         raise HTTPException(status_code=400, detail="Signature request already started")
 
     try:
-        result = DisclosureSessionResultJWT.parse_jwt(disclosure_result)
+        result = await jwt_service.parse_session_result(
+            DisclosureSessionResultJWT, disclosure_result
+        )
     except jwt.PyJWTError:
         raise HTTPException(status_code=400, detail="Invalid JWT")
     except ValidationError:
         raise HTTPException(status_code=400, detail="Invalid session result")
 
-    if not result.satisfies_condiscon([[[settings.email_attribute]]]):
+    if not result.satisfies_condiscon(compile_condiscon([settings.email_attribute])):
         raise HTTPException(status_code=400, detail="Invalid session result")
 
     disclosed_values = {
@@ -111,22 +119,24 @@ async def start(
         404: {"model": HTTPExceptionResponse},
     },
 )
-def get_signature_request_info(
+async def get_signature_request_info(
     signature_request: Annotated[SignatureRequest, Depends(get_signature_request)],
 ) -> RecipientSignatureRequestResponse:
     """Get information about a request to sign a message."""
     if not signature_request.initiator_email_value:
         raise HTTPException(status_code=404, detail="Signature request not found")
 
-    signature_session_request = IRMASignatureRequestJWT(
-        absrequest=ExtendedIRMASignatureRequest(
-            validity=settings.session_request_validity,
-            request=IRMASignatureRequest(
-                message=signature_request.message,
-                disclose=create_condiscon(signature_request.attributes),
-            ),
+    signature_session_request = await jwt_service.sign(
+        IRMASignatureRequestJWT(
+            absrequest=ExtendedIRMASignatureRequest(
+                validity=settings.session_request_validity,
+                request=IRMASignatureRequest(
+                    message=signature_request.message,
+                    disclose=create_condiscon(signature_request.attributes),
+                ),
+            )
         )
-    ).signed_jwt()
+    )
 
     return RecipientSignatureRequestResponse(
         attributes=signature_request.attributes,
@@ -148,6 +158,7 @@ async def submit_signature(
     signature_request: Annotated[SignatureRequest, Depends(get_signature_request)],
     signature_result: Annotated[str, Body(title="Signature session result JWT", embed=True)],
     storage: Annotated[SignaturesStorage, Depends(get_signatures_storage)],
+    redis_client: Annotated[redis.Redis, Depends(get_redis)],
     background_tasks: BackgroundTasks,
 ) -> None:
     """Submit the signature that someone requested."""
@@ -155,7 +166,7 @@ async def submit_signature(
         raise HTTPException(status_code=404, detail="Signature request not found")
 
     try:
-        result = SignatureSessionResultJWT.parse_jwt(signature_result)
+        result = await jwt_service.parse_session_result(SignatureSessionResultJWT, signature_result)
     except jwt.PyJWTError:
         raise HTTPException(status_code=400, detail="Invalid JWT")
     except ValidationError:
@@ -163,11 +174,15 @@ async def submit_signature(
 
     if not (
         result.signature.message == signature_request.message
-        and result.satisfies_condiscon(create_condiscon(signature_request.attributes))
+        and result.satisfies_condiscon(compile_condiscon(signature_request.attributes))
     ):
         raise HTTPException(status_code=400, detail="Invalid session result")
 
-    background_tasks.add_task(send_initiator_signature_result_email, signature_request, result)
+    if settings.email_outbox == "redis":
+        # Make sure the email is stored before responding.
+        await send_initiator_signature_result_email(signature_request, result, redis_client)
+    else:
+        background_tasks.add_task(send_initiator_signature_result_email, signature_request, result)
 
     await storage.delete_request(signature_request.id)
 
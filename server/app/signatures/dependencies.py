@@ -3,30 +3,59 @@ from typing import Annotated
 import redis.asyncio as redis
 from fastapi import Depends, HTTPException, Path
 
+from app.cache import RecordCache, record_cache
+from app.codecs import Codec, get_codec
+from app.config import settings
 from app.dependencies import get_redis
+from app.metrics import instrument_storage
 from app.signatures.models import SignatureRequest
 
 
+@instrument_storage("signatures")
 class SignaturesStorage:
-    def __init__(self, redis: redis.Redis):
+    def __init__(
+        self, redis: redis.Redis, codec: Codec | None = None, cache: RecordCache | None = None
+    ):
         self._redis = redis
+        self._codec = codec or get_codec(settings.storage_codec)
+        self._cache = cache or record_cache
+        self._trusted_load = settings.storage_trusted_load
+        self._compact = settings.storage_compact_translations
+        self._compress_above = settings.signature_request_compression_threshold
 
     async def save_request(self, request: SignatureRequest) -> None:
         """Save or update a signature request."""
         await self._redis.set(
             f"signature_request:{request.id}",
-            request.model_dump_json(),
+            self._codec.encode(
+                request, self._compress_above, trusted=self._trusted_load, compact=self._compact
+            ),
             exat=request.expire_at,
         )
+        if self._cache is not None:
+            self._cache.invalidate(f"signature_request:{request.id}")
 
     async def get_request(self, id: str) -> SignatureRequest | None:
         """Get a signature request by its ID, or None if it doesn't exist."""
-        data = await self._redis.get(f"signature_request:{id}")
-        return SignatureRequest.model_validate_json(data) if data else None
+        key = f"signature_request:{id}"
+        cached = self._cache.get(key) if self._cache is not None else None
+        if cached is not None:
+            return self._codec.decode(SignatureRequest, cached, trusted=self._trusted_load)
+
+        generation = self._cache.generation if self._cache is not None else 0
+        data = await self._redis.get(key)
+        if not data:
+            return None
+        request = self._codec.decode(SignatureRequest, data, trusted=self._trusted_load)
+        if self._cache is not None:
+            self._cache.put(key, data, request.expire_at.timestamp(), generation)  # type: ignore[arg-type]
+        return request
 
     async def delete_request(self, id: str) -> None:
         """Delete a signature request and by its ID."""
         await self._redis.delete(f"signature_request:{id}")
+        if self._cache is not None:
+            self._cache.invalidate(f"signature_request:{id}")
 
 
 async def get_signatures_storage(redis: Annotated[redis.Redis, Depends(get_redis)]):
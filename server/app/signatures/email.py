@@ -1,40 +1,50 @@
 import base64
 import logging
+import zlib
 from email.message import EmailMessage
 
+import redis.asyncio as redis
+
 from app.config import settings
 from app.signatures.models import SignatureRequest
+from app.templates import SIGNATURE_RESULT_EMAIL
 from app.utils import send_email
-from app.yivi.models import SignatureSessionResultJWT
+from app.yivi.models import SignatureSessionResultJWT, SignedMessage
 
 logger = logging.getLogger(__name__)
 
+# Prefix of compressed signatures in verify links. Plain base64 never contains a '.'.
+COMPRESSED_LINK_PREFIX = "z."
+
+
+def encode_signature_link_fragment(signature: SignedMessage) -> str:
+    """Encode a signature for the URL fragment of a verify link."""
+    data = signature.model_dump_json(by_alias=True).encode()
+    if settings.signature_link_encoding == "zlib":
+        compressed = zlib.compress(data, 9)
+        return COMPRESSED_LINK_PREFIX + base64.urlsafe_b64encode(compressed).decode().rstrip("=")
+    return base64.b64encode(data).decode()
+
 
 async def send_initiator_signature_result_email(
-    signature_request: SignatureRequest, result: SignatureSessionResultJWT
+    signature_request: SignatureRequest,
+    result: SignatureSessionResultJWT,
+    redis: redis.Redis | None = None,
 ):
+    signature_content = encode_signature_link_fragment(result.signature)
+
+    subject, body = SIGNATURE_RESULT_EMAIL.render(
+        {
+            "verify_url": f"{settings.client_origin}/signature/verify/",
+            "signature_url": f"{settings.client_origin}/signature/verify/#{signature_content}",
+        },
+        settings.email_languages,
+    )
+
     message = EmailMessage()
     message["From"] = f"noreply@{settings.email_from_domain}"
     message["To"] = signature_request.initiator_email_value
-    message["Subject"] = "Antwoord via DIYivi"
-
-    signature_content = base64.b64encode(
-        result.signature.model_dump_json(by_alias=True).encode()
-    ).decode()
-
-    signature = f"{settings.client_origin}/signature/verify/#{signature_content}"
-
-    message.set_content(
-        f"""Beste gebruiker van DIYivi,
-
-Gefeliciteerd! Iemand heeft gereageerd op je verzoek om een afspraak te ondertekenen.
-Hier is het ondertekende bericht. Open de lange link hieronder of kopieer hem en vul hem
-in op {settings.client_origin}/signature/verify/ om de handtekening te bekijken.
-
-{signature}
-
-Dit is een automatisch gegenereerd bericht. U kunt hier niet op reageren.
-"""
-    )
+    message["Subject"] = subject
+    message.set_content(body)
 
-    await send_email(message)
+    await send_email(message, redis)
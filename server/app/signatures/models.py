@@ -2,7 +2,7 @@ import secrets
 
 from pydantic import BaseModel, EmailStr, Field
 
-from app.yivi.models import Attribute, Timestamp
+from app.yivi.models import AllowedAttribute, Attribute, Timestamp
 
 
 class SignatureRequest(BaseModel):
@@ -29,7 +29,7 @@ class SignatureRequest(BaseModel):
 
 class CreateSignatureRequestRequest(BaseModel):
     message: str = Field(min_length=1, max_length=64_000)
-    attributes: list[Attribute] = Field(min_length=1)
+    attributes: list[AllowedAttribute] = Field(min_length=1)
 
 
 class SignatureRequestResponse(BaseModel):
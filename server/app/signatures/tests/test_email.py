@@ -0,0 +1,47 @@
+import base64
+import json
+import zlib
+
+import pytest
+
+from app.config import settings
+from app.signatures.email import COMPRESSED_LINK_PREFIX, encode_signature_link_fragment
+from app.yivi.models import SignedMessage
+
+_signature = SignedMessage.model_validate(
+    {
+        "@context": "https://irma.app/ld/signature/v2",
+        "signature": [],
+        "indices": [],
+        "nonce": "nonce",
+        "context": "context",
+        "message": "Ik ga akkoord met de voorwaarden. " * 100,
+        "timestamp": {"Time": 1720051200},
+    }
+)
+
+
+def test_compressed_link(monkeypatch):
+    monkeypatch.setattr(settings, "signature_link_encoding", "zlib")
+
+    fragment = encode_signature_link_fragment(_signature)
+
+    assert fragment.startswith(COMPRESSED_LINK_PREFIX)
+    encoded = fragment.removeprefix(COMPRESSED_LINK_PREFIX)
+    # The fragment is URL-safe, without padding.
+    assert set(encoded) <= set("ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789-_")
+    data = zlib.decompress(base64.urlsafe_b64decode(encoded + "=" * (-len(encoded) % 4)))
+    assert json.loads(data)["message"] == _signature.message
+    assert len(fragment) < len(_signature.message) / 5
+
+
+@pytest.mark.parametrize("encoding", ["base64", "zlib"])
+def test_link_encodings(monkeypatch, encoding):
+    monkeypatch.setattr(settings, "signature_link_encoding", encoding)
+
+    fragment = encode_signature_link_fragment(_signature)
+
+    # Clients tell the encodings apart by the prefix.
+    assert fragment.startswith(COMPRESSED_LINK_PREFIX) == (encoding == "zlib")
+    if encoding == "base64":
+        assert json.loads(base64.b64decode(fragment))["@context"] == _signature.ldcontext
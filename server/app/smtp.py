@@ -0,0 +1,220 @@
+"""Sending emails over pooled SMTP connections, from a bounded outbox.
+
+Opening a connection, STARTTLS and authenticating for every single email is slow, and
+during bursts it makes the mail relay throttle us. Instead, emails are put in an outbox,
+from which a few workers send them in batches over connections that are kept open.
+"""
+
+import asyncio
+import logging
+import time
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager
+from email.message import EmailMessage
+
+import aiosmtplib
+
+from app.config import SMTPSettings, settings
+from app.metrics import EMAIL_DURATION
+
+logger = logging.getLogger(__name__)
+
+
+class SMTPPool:
+    """Pool of authenticated connections to an SMTP server, which are reused."""
+
+    def __init__(self, smtp_settings: SMTPSettings):
+        self._settings = smtp_settings
+        self._semaphore = asyncio.Semaphore(smtp_settings.pool_size)
+        self._idle: list[aiosmtplib.SMTP] = []
+        self.connections_opened = 0
+
+    async def _connect(self) -> aiosmtplib.SMTP:
+        client = aiosmtplib.SMTP(
+            hostname=self._settings.hostname,
+            port=self._settings.port,
+            username=self._settings.username,
+            password=self._settings.password,
+            start_tls=self._settings.start_tls,
+        )
+        await client.connect()
+        self.connections_opened += 1
+        return client
+
+    @asynccontextmanager
+    async def connection(self) -> AsyncIterator[aiosmtplib.SMTP]:
+        """Get a connection from the pool, or open one if there is no idle connection.
+
+        The connection is closed instead of returned to the pool if an error occurs.
+        """
+        async with self._semaphore:
+            client = None
+            while self._idle and client is None:
+                client = self._idle.pop()
+                if not client.is_connected:
+                    client = None
+            if client is None:
+                client = await self._connect()
+
+            try:
+                yield client
+            except BaseException:
+                client.close()
+                raise
+            self._idle.append(client)
+
+    async def send_batch(self, messages: list[EmailMessage]) -> list[Exception | None]:
+        """Send messages over a single connection, and return the error for each message.
+
+        Idle connections may have been closed by the server in the meantime, so after a
+        disconnect, the remaining messages are sent over a new connection once. Messages
+        that could not be sent at all get the error that stopped them.
+        """
+        start = time.perf_counter()
+        errors: list[Exception | None] = []
+        reconnected = False
+        while len(errors) < len(messages):
+            try:
+                async with self.connection() as client:
+                    for message in messages[len(errors) :]:
+                        try:
+                            await client.send_message(message)
+                        except (
+                            aiosmtplib.SMTPResponseException,
+                            aiosmtplib.SMTPRecipientsRefused,
+                        ) as e:
+                            errors.append(e)
+                            # Keep using the connection for the next message.
+                            await client.rset()
+                        else:
+                            errors.append(None)
+            except aiosmtplib.SMTPServerDisconnected as e:
+                if reconnected:
+                    errors.extend([e] * (len(messages) - len(errors)))
+                reconnected = True
+            except (aiosmtplib.SMTPException, OSError) as e:
+                errors.extend([e] * (len(messages) - len(errors)))
+        EMAIL_DURATION.labels("smtp").observe(time.perf_counter() - start)
+        return errors
+
+    async def close(self) -> None:
+        """Close all idle connections.
+
+        The pool can be used again afterwards, also from another event loop.
+        """
+        self._semaphore = asyncio.Semaphore(self._settings.pool_size)
+        idle, self._idle = self._idle, []
+        for client in idle:
+            try:
+                await client.quit()
+            except aiosmtplib.SMTPException:
+                client.close()
+
+
+def is_permanent_error(error: Exception) -> bool:
+    """Return whether an error means that retrying to send an email won't help."""
+    if isinstance(error, aiosmtplib.SMTPRecipientsRefused):
+        return all(recipient.code >= 500 for recipient in error.recipients)
+    return isinstance(error, aiosmtplib.SMTPResponseException) and error.code >= 500
+
+
+class EmailOutboxClosedError(Exception):
+    """Raised when adding an email to an outbox that is being drained."""
+
+
+class EmailOutbox:
+    """Bounded queue of emails that are sent by background workers.
+
+    Each worker takes a batch of at most `batch_size` emails from the queue, and sends them
+    over a connection from the pool. Emails that fail with a temporary error are retried
+    up to `max_attempts` times, with an exponential backoff that also holds off the worker,
+    so that a throttling server gets some rest. Workers are started on first use, and
+    `drain` waits for all emails to be sent, for example on shutdown. After that, `open`
+    accepts emails again.
+    """
+
+    def __init__(self, pool: SMTPPool, smtp_settings: SMTPSettings):
+        self._pool = pool
+        self._settings = smtp_settings
+        self._queue: asyncio.Queue[EmailMessage] = asyncio.Queue(smtp_settings.outbox_size)
+        self._workers: list[asyncio.Task] = []
+        self._closed = False
+        self.sent = 0
+        self.failed = 0
+
+    @classmethod
+    def from_settings(cls, smtp_settings: SMTPSettings) -> "EmailOutbox":
+        return cls(SMTPPool(smtp_settings), smtp_settings)
+
+    def _start(self) -> None:
+        if not self._workers:
+            self._workers = [
+                asyncio.create_task(self._work()) for _ in range(self._settings.pool_size)
+            ]
+
+    async def put(self, message: EmailMessage) -> None:
+        """Add an email to the outbox, waiting for room if the outbox is full.
+
+        :raises EmailOutboxClosedError: If the outbox is being drained.
+        """
+        if self._closed:
+            raise EmailOutboxClosedError("The outbox no longer accepts emails")
+        self._start()
+        await self._queue.put(message)
+
+    async def _work(self) -> None:
+        while True:
+            batch = [await self._queue.get()]
+            while len(batch) < self._settings.batch_size and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+
+            try:
+                await self._send(batch)
+            except Exception:
+                logger.exception("Unexpected error while sending emails")
+                self.failed += len(batch)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    async def _send(self, batch: list[EmailMessage]) -> None:
+        for attempt in range(1, self._settings.max_attempts + 1):
+            errors = await self._pool.send_batch(batch)
+            retry = []
+            for message, error in zip(batch, errors):
+                if error is None:
+                    self.sent += 1
+                elif is_permanent_error(error) or attempt == self._settings.max_attempts:
+                    logger.error("Failed to send email to %s: %s", message["To"], error)
+                    self.failed += 1
+                else:
+                    retry.append(message)
+
+            if not retry:
+                return
+            batch = retry
+            await asyncio.sleep(self._settings.retry_delay * 2 ** (attempt - 1))
+
+    def open(self) -> None:
+        """Accept emails again after `drain`, for example when the app is started again."""
+        if self._closed:
+            # Emails left after a drain that timed out are lost, and the queue may belong
+            # to the event loop of the previous run.
+            self._queue = asyncio.Queue(self._settings.outbox_size)
+            self._closed = False
+
+    async def drain(self, timeout: float | None = None) -> None:
+        """Stop accepting emails, and wait for all emails in the outbox to be sent."""
+        self._closed = True
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout)
+        except TimeoutError:
+            logger.warning("Outbox not drained in time, %d emails are lost", self._queue.qsize())
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        await self._pool.close()
+
+
+email_outbox = EmailOutbox.from_settings(settings.smtp) if settings.smtp is not None else None
@@ -0,0 +1,278 @@
+"""Templates for the emails that are sent, compiled once when this module is imported.
+
+Emails can contain the same text in multiple languages, as set by `email_languages`.
+Values in the context of a template are either plain strings, or `TranslatedString`s or
+mappings of which the translation for each language is used.
+"""
+
+import functools
+import string
+from collections.abc import Callable, Iterable, Mapping, Sequence
+from dataclasses import dataclass
+from typing import Literal
+
+from app.yivi.attributes import attribute_registry
+from app.yivi.models import TranslatedString
+
+Language = Literal["nl", "en"]
+
+# Text in multiple languages, as rendered by this module.
+Translations = Mapping[Language, str]
+
+Context = Mapping[str, str | TranslatedString | Translations]
+
+
+def translated(nl: str, en: str) -> TranslatedString:
+    return TranslatedString(default=nl, nl=nl, en=en)
+
+
+class Template:
+    """A template with `{name}` fields, parsed once, that can be rendered quickly.
+
+    Unlike `str.format`, format specs and conversions are not supported, and the values
+    are inserted as is, so values containing braces are never interpreted.
+    """
+
+    __slots__ = ("_fields", "_literals")
+
+    def __init__(self, source: str):
+        # There is always one more literal than there are fields, which may be empty.
+        self._literals = [""]
+        self._fields: list[str] = []
+        for literal, field, spec, conversion in string.Formatter().parse(source):
+            self._literals[-1] += literal
+            if field is None:
+                continue
+            if spec or conversion or not field.isidentifier():
+                raise ValueError(f"Unsupported template field: {field!r}")
+            self._fields.append(field)
+            self._literals.append("")
+
+    @property
+    def fields(self) -> frozenset[str]:
+        return frozenset(self._fields)
+
+    def render(self, context: Context, language: Language) -> str:
+        parts = [self._literals[0]]
+        for field, literal in zip(self._fields, self._literals[1:]):
+            value = context[field]
+            if isinstance(value, TranslatedString):
+                parts.append(getattr(value, language))
+            else:
+                parts.append(value if isinstance(value, str) else value[language])
+            parts.append(literal)
+        return "".join(parts)
+
+
+class EmailTemplate:
+    """A subject and body template in each language."""
+
+    def __init__(self, subject: Mapping[Language, str], body: Mapping[Language, str]):
+        self._subject = {language: Template(source) for language, source in subject.items()}
+        self._body = {language: Template(source) for language, source in body.items()}
+
+    def render(self, context: Context, languages: Sequence[Language]) -> tuple[str, str]:
+        """Render the subject and body, with the body in each of the languages.
+
+        The subject is in the first language only, to keep it short.
+        """
+        subject = self._subject[languages[0]].render(context, languages[0])
+        body = "\n---\n\n".join(
+            self._body[language].render(context, language) for language in languages
+        )
+        return subject, body
+
+
+@dataclass(frozen=True, slots=True)
+class DisplayOption:
+    """A way to display the values of one or more attributes in an email."""
+
+    label: TranslatedString
+    required_attributes: frozenset[str]
+    display: Callable[[Mapping[str, TranslatedString], Language], str]
+
+
+def _single(attribute: str) -> Callable[[Mapping[str, TranslatedString], Language], str]:
+    return lambda values, language: getattr(values[attribute], language)
+
+
+_address = Template("{street} {house_number}, {zipcode} {city}")
+
+ATTRIBUTE_DISPLAY_OPTIONS = [
+    DisplayOption(
+        label=translated("Volledige naam", "Full name"),
+        required_attributes=frozenset({"pbdf.gemeente.personalData.fullname"}),
+        display=_single("pbdf.gemeente.personalData.fullname"),
+    ),
+    DisplayOption(
+        label=translated("E-mailadres", "Email address"),
+        required_attributes=frozenset({"pbdf.sidn-pbdf.email.email"}),
+        display=_single("pbdf.sidn-pbdf.email.email"),
+    ),
+    DisplayOption(
+        label=translated("Mobiel telefoonnummer", "Mobile phone number"),
+        required_attributes=frozenset({"pbdf.sidn-pbdf.mobilenumber.mobilenumber"}),
+        display=_single("pbdf.sidn-pbdf.mobilenumber.mobilenumber"),
+    ),
+    DisplayOption(
+        label=translated("Geboortedatum", "Date of birth"),
+        required_attributes=frozenset({"pbdf.gemeente.personalData.dateofbirth"}),
+        display=_single("pbdf.gemeente.personalData.dateofbirth"),
+    ),
+    DisplayOption(
+        label=translated("Woonadres", "Home address"),
+        required_attributes=frozenset(
+            {
+                "pbdf.gemeente.address.street",
+                "pbdf.gemeente.address.houseNumber",
+                "pbdf.gemeente.address.zipcode",
+                "pbdf.gemeente.address.city",
+            }
+        ),
+        display=lambda values, language: _address.render(
+            {
+                "street": values["pbdf.gemeente.address.street"],
+                "house_number": values["pbdf.gemeente.address.houseNumber"],
+                "zipcode": values["pbdf.gemeente.address.zipcode"],
+                "city": values["pbdf.gemeente.address.city"],
+            },
+            language,
+        ),
+    ),
+]
+
+
+class AttributeDisplayRenderer:
+    """Renders disclosed values as a list, with the display options that apply to them.
+
+    An index from each attribute to the options that require it is built once, so only
+    the options for the disclosed attributes are considered. Which options apply only
+    depends on the set of attributes, and is cached, as all replies to an exchange have
+    the same attributes.
+    """
+
+    def __init__(self, options: Sequence[DisplayOption]):
+        self._options = tuple(options)
+        self._index: dict[str, list[int]] = {}
+        for position, option in enumerate(self._options):
+            attribute_registry.register(option.required_attributes)
+            for attribute in option.required_attributes:
+                self._index.setdefault(attribute, []).append(position)
+        self.options_for = functools.lru_cache(maxsize=256)(self._options_for)
+
+    def _options_for(self, attributes: frozenset[str]) -> tuple[DisplayOption, ...]:
+        """Get the options of which all required attributes are in `attributes`."""
+        candidates = sorted(
+            {position for attribute in attributes for position in self._index.get(attribute, ())}
+        )
+        return tuple(
+            self._options[position]
+            for position in candidates
+            if self._options[position].required_attributes <= attributes
+        )
+
+    def render(
+        self, values: Mapping[str, TranslatedString], languages: Sequence[Language]
+    ) -> Translations:
+        """Render disclosed values in each of the languages."""
+        return self.render_many([values], languages)[0]
+
+    def render_many(
+        self,
+        values_list: Iterable[Mapping[str, TranslatedString]],
+        languages: Sequence[Language],
+    ) -> list[Translations]:
+        """Render many sets of disclosed values, such as all replies to an exchange."""
+        return [
+            {
+                language: "\n".join(
+                    f"- {getattr(option.label, language)}: {option.display(values, language)}"
+                    for option in options
+                )
+                for language in languages
+            }
+            for values in values_list
+            for options in (self.options_for(frozenset(values)),)
+        ]
+
+
+attribute_display_renderer = AttributeDisplayRenderer(ATTRIBUTE_DISPLAY_OPTIONS)
+
+
+EXCHANGE_RESULT_EMAIL = EmailTemplate(
+    subject={"nl": "Antwoord via DIYivi", "en": "Reply via DIYivi"},
+    body={
+        "nl": """Beste gebruiker van DIYivi,
+
+Gefeliciteerd! Iemand heeft gereageerd op je verzoek om gegevens uit te wisselen.
+Dit zijn de gegevens die je hebt ontvangen:
+
+{attributes}
+
+Al deze gegevens worden vanzelf binnen 48 uur van DIYivi verwijderd.
+Dit is een automatisch gegenereerd bericht. U kunt hier niet op reageren.
+""",
+        "en": """Dear DIYivi user,
+
+Congratulations! Someone has replied to your request to exchange data.
+This is the data that you have received:
+
+{attributes}
+
+All of this data is automatically removed from DIYivi within 48 hours.
+This is an automatically generated message. You cannot reply to it.
+""",
+    },
+)
+
+EXCHANGE_RESULT_DIGEST_EMAIL = EmailTemplate(
+    subject={"nl": "{count} antwoorden via DIYivi", "en": "{count} replies via DIYivi"},
+    body={
+        "nl": """Beste gebruiker van DIYivi,
+
+Er hebben {count} mensen gereageerd op je verzoek om gegevens uit te wisselen.
+Dit zijn de gegevens die je hebt ontvangen:
+
+{replies}
+
+Al deze gegevens worden vanzelf binnen 48 uur van DIYivi verwijderd.
+Dit is een automatisch gegenereerd bericht. U kunt hier niet op reageren.
+""",
+        "en": """Dear DIYivi user,
+
+{count} people have replied to your request to exchange data.
+This is the data that you have received:
+
+{replies}
+
+All of this data is automatically removed from DIYivi within 48 hours.
+This is an automatically generated message. You cannot reply to it.
+""",
+    },
+)
+
+SIGNATURE_RESULT_EMAIL = EmailTemplate(
+    subject={"nl": "Antwoord via DIYivi", "en": "Reply via DIYivi"},
+    body={
+        "nl": """Beste gebruiker van DIYivi,
+
+Gefeliciteerd! Iemand heeft gereageerd op je verzoek om een afspraak te ondertekenen.
+Hier is het ondertekende bericht. Open de lange link hieronder of kopieer hem en vul hem
+in op {verify_url} om de handtekening te bekijken.
+
+{signature_url}
+
+Dit is een automatisch gegenereerd bericht. U kunt hier niet op reageren.
+""",
+        "en": """Dear DIYivi user,
+
+Congratulations! Someone has replied to your request to sign an agreement.
+Here is the signed message. Open the long link below, or copy it and enter it
+at {verify_url} to view the signature.
+
+{signature_url}
+
+This is an automatically generated message. You cannot reply to it.
+""",
+    },
+)
@@ -0,0 +1,20 @@
+import pytest
+from aiosmtpd.controller import Controller
+
+from app.tests.smtp_server import Handler, authenticate, free_port
+
+
+@pytest.fixture
+def handler():
+    handler = Handler()
+    handler.port = free_port()
+    controller = Controller(
+        handler,
+        hostname="127.0.0.1",
+        port=handler.port,
+        authenticator=authenticate,
+        auth_require_tls=False,
+    )
+    controller.start()
+    yield handler
+    controller.stop()
@@ -0,0 +1,61 @@
+"""Local stand-in SMTP server for tests, based on aiosmtpd."""
+
+import socket
+from email.message import EmailMessage
+
+from aiosmtpd.smtp import AuthResult
+
+from app.config import SMTPSettings
+
+
+class Handler:
+    """Stand-in SMTP server handler that records the emails and connections it receives."""
+
+    def __init__(self):
+        self.messages: list[str] = []
+        self.connections = 0
+        # Responses to give instead of accepting the next emails.
+        self.responses: list[str] = []
+        self.port = 0
+
+    async def handle_EHLO(self, server, session, envelope, hostname, responses):  # noqa: N802
+        self.connections += 1
+        session.host_name = hostname
+        return responses
+
+    async def handle_DATA(self, server, session, envelope):  # noqa: N802
+        if self.responses:
+            return self.responses.pop(0)
+        self.messages.append(envelope.rcpt_tos[0])
+        return "250 OK"
+
+
+def authenticate(server, session, envelope, mechanism, auth_data):
+    return AuthResult(success=auth_data.login == b"user" and auth_data.password == b"password")
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def smtp_settings(handler, **kwargs) -> SMTPSettings:
+    defaults = {
+        "hostname": "127.0.0.1",
+        "port": handler.port,
+        "username": "user",
+        "password": "password",
+        "start_tls": False,
+        "retry_delay": 0.01,
+    }
+    return SMTPSettings(**{**defaults, **kwargs})
+
+
+def smtp_message(to: str) -> EmailMessage:
+    message = EmailMessage()
+    message["From"] = "noreply@example.com"
+    message["To"] = to
+    message["Subject"] = "Test"
+    message.set_content("Hello, world!")
+    return message
@@ -0,0 +1,278 @@
+import asyncio
+import time
+from datetime import UTC, datetime
+
+import pytest
+import redis.asyncio as redis
+from fakeredis import FakeAsyncRedis, FakeServer
+
+from app.cache import RecordCache
+from app.config import StorageCacheSettings
+from app.exchanges.dependencies import ExchangesStorage
+from app.signatures.dependencies import SignaturesStorage
+from app.signatures.models import SignatureRequest
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+@pytest.fixture
+def server():
+    return FakeServer()
+
+
+@pytest.fixture
+async def redis_client(server):
+    client = FakeAsyncRedis(server=server)
+    # fakeredis always publishes keyspace notifications, but doesn't support `CONFIG`.
+    config = {"notify-keyspace-events": ""}
+
+    async def config_get(name):
+        return {name: config[name]}
+
+    async def config_set(name, value):
+        config[name] = value
+        return True
+
+    client.config_get = config_get  # type: ignore[method-assign]
+    client.config_set = config_set  # type: ignore[method-assign]
+    return client
+
+
+@pytest.fixture
+async def cache(redis_client):
+    cache = RecordCache(("exchange:", "signature_request:"), StorageCacheSettings(enabled=True))
+    await cache.start(redis_client)
+    yield cache
+    await cache.close()
+
+
+async def _notified():
+    """Give the listener a chance to handle pending keyspace notifications."""
+    for _ in range(10):
+        await asyncio.sleep(0)
+
+
+def _expire_at() -> datetime:
+    # Timestamps are stored in whole seconds.
+    return datetime.fromtimestamp(int(time.time()) + 600, tz=UTC)
+
+
+@pytest.mark.anyio
+async def test_get_exchange_is_cached(redis_client, cache, make_exchange):
+    storage = ExchangesStorage(redis_client, cache=cache)
+    exchange = make_exchange()
+    await storage.save_exchange(exchange)
+    await _notified()
+
+    assert await storage.get_exchange(exchange.id) == exchange
+    assert (cache.hits, cache.misses) == (0, 1)
+
+    # Served from the cache, even if Redis is no longer reachable.
+    await redis_client.aclose()
+    storage._redis = None  # type: ignore[assignment]
+    assert await storage.get_exchange(exchange.id) == exchange
+    assert (cache.hits, cache.misses) == (1, 1)
+
+    stats = cache.stats()
+    assert stats.entries == 1
+    assert stats.bytes > len(f"exchange:{exchange.id}")
+
+
+@pytest.mark.anyio
+async def test_exchange_with_replies_is_cached(redis_client, cache, make_exchange, make_reply):
+    storage = ExchangesStorage(redis_client, cache=cache)
+    exchange = make_exchange()
+    reply = make_reply(exchange)
+    await storage.save_exchange(exchange)
+    await storage.push_reply(exchange, reply, digest_at=time.time())
+    await _notified()
+
+    # The first read fetches the exchange from Redis, and caches it.
+    assert await storage.get_exchange_with_reply_count(exchange.id) == (exchange, 1)
+    assert (cache.hits, cache.misses) == (0, 1)
+
+    # Later reads only fetch the replies.
+    assert await storage.get_exchange_with_reply_count(exchange.id) == (exchange, 1)
+    assert cache.hits == 1
+    assert await storage.get_exchange_with_replies(exchange.id) == (exchange, [reply])
+    assert cache.hits == 2
+    assert await storage.get_exchange_result(exchange.id, reply.recipient_secret) == (
+        exchange,
+        reply,
+        [],
+    )
+    assert cache.hits == 3
+    assert await storage.get_exchange_result(exchange.id, exchange.initiator_secret) == (
+        exchange,
+        None,
+        [reply],
+    )
+    assert cache.hits == 4
+    assert await storage.get_digest(exchange.id, 10) == (exchange, 0, [reply])
+    assert (cache.hits, cache.misses) == (5, 1)
+
+
+@pytest.mark.anyio
+async def test_exchange_is_cached_by_any_read(redis_client, cache, make_exchange):
+    storage = ExchangesStorage(redis_client, cache=cache)
+    exchange = make_exchange()
+    await storage.save_exchange(exchange)
+    await _notified()
+
+    assert await storage.get_exchange_result(exchange.id, exchange.initiator_secret) == (
+        exchange,
+        None,
+        [],
+    )
+    assert await storage.get_digest(exchange.id, 10) == (exchange, 0, [])
+    assert await storage.get_exchange(exchange.id) == exchange
+    assert (cache.hits, cache.misses) == (2, 1)
+
+    await storage.delete_exchange(exchange.id)
+    assert await storage.get_exchange_result(exchange.id, exchange.initiator_secret) == (
+        None,
+        None,
+        [],
+    )
+    assert await storage.get_digest(exchange.id, 10) == (None, 0, [])
+
+
+@pytest.mark.anyio
+async def test_invalidated_by_other_workers(server, redis_client, cache, make_exchange):
+    storage = ExchangesStorage(redis_client, cache=cache)
+    exchange = make_exchange()
+    await storage.save_exchange(exchange)
+    await storage.get_exchange(exchange.id)
+
+    # Another worker, without the cache, updates the exchange.
+    other = ExchangesStorage(FakeAsyncRedis(server=server))
+    updated = exchange.model_copy(update={"initiator_email_value": "other@example.com"})
+    await other.save_exchange(updated)
+    await _notified()
+
+    assert cache.stats().entries == 0
+    assert await storage.get_exchange(exchange.id) == updated
+
+    await other.delete_exchange(exchange.id)
+    await _notified()
+    assert await storage.get_exchange(exchange.id) is None
+
+
+@pytest.mark.anyio
+async def test_signature_requests(redis_client, cache):
+    storage = SignaturesStorage(redis_client, cache=cache)
+    request = SignatureRequest(
+        message="Hello", attributes=["pbdf.sidn-pbdf.email.email"], expire_at=_expire_at()
+    )
+    await storage.save_request(request)
+    await _notified()
+
+    assert await storage.get_request(request.id) == request
+    assert await storage.get_request(request.id) == request
+    assert cache.hits == 1
+
+    await storage.delete_request(request.id)
+    assert await storage.get_request(request.id) is None
+
+
+@pytest.mark.anyio
+async def test_stale_reads_are_not_cached(cache):
+    generation = cache.generation
+    cache.invalidate("exchange:a")
+    cache.put("exchange:a", b"old", time.time() + 60, generation)
+    assert cache.get("exchange:a") is None
+
+    cache.put("exchange:a", b"new", time.time() + 60, cache.generation)
+    assert cache.get("exchange:a") == b"new"
+
+
+@pytest.mark.anyio
+async def test_expired_records_are_not_served(cache):
+    cache.put("exchange:a", b"data", time.time() - 1, cache.generation)
+    assert cache.get("exchange:a") is None
+
+
+@pytest.mark.anyio
+async def test_bounds(redis_client):
+    cache = RecordCache(
+        ("exchange:",), StorageCacheSettings(enabled=True, max_entries=2, max_bytes=100)
+    )
+    await cache.start(redis_client)
+    expire_at = time.time() + 60
+
+    cache.put("exchange:a", b"a", expire_at, cache.generation)
+    cache.put("exchange:b", b"b", expire_at, cache.generation)
+    cache.get("exchange:a")
+    cache.put("exchange:c", b"c", expire_at, cache.generation)
+    # The least recently used record is evicted.
+    assert cache.get("exchange:b") is None
+    assert cache.get("exchange:a") == b"a"
+
+    cache.put("exchange:d", b"d" * 80, expire_at, cache.generation)
+    assert cache.stats().entries == 1
+    assert cache.stats().bytes == len("exchange:d") + 80
+
+    # Records that don't fit at all are not cached.
+    cache.put("exchange:e", b"e" * 100, expire_at, cache.generation)
+    assert cache.get("exchange:e") is None
+    assert cache.get("exchange:d") is not None
+
+    await cache.close()
+    # Without notifications, the cache is not used.
+    assert not cache.active
+    assert cache.get("exchange:d") is None
+
+
+@pytest.mark.anyio
+async def test_notifications_are_configured(redis_client):
+    cache = RecordCache(("exchange:",), StorageCacheSettings(enabled=True))
+    await cache.start(redis_client)
+    assert cache.active
+    assert set(await _notify_keyspace_events(redis_client)) == set("Kg$xe")
+    await cache.close()
+
+
+@pytest.mark.anyio
+@pytest.mark.parametrize("current", ["Kg$xe", "KA", "AKE"])
+async def test_notifications_already_enabled(redis_client, current):
+    await redis_client.config_set("notify-keyspace-events", current)
+    cache = RecordCache(
+        ("exchange:",), StorageCacheSettings(enabled=True, configure_notifications=False)
+    )
+    await cache.start(redis_client)
+    assert cache.active
+    await cache.close()
+
+
+@pytest.mark.anyio
+async def test_inactive_without_notifications(redis_client):
+    await redis_client.config_set("notify-keyspace-events", "Kg$")
+    cache = RecordCache(
+        ("exchange:",), StorageCacheSettings(enabled=True, configure_notifications=False)
+    )
+    await cache.start(redis_client)
+    assert not cache.active
+    cache.put("exchange:a", b"a", time.time() + 60, cache.generation)
+    assert cache.get("exchange:a") is None
+    await cache.close()
+
+
+@pytest.mark.anyio
+@pytest.mark.parametrize("command", ["config_get", "config_set"])
+async def test_inactive_if_config_fails(redis_client, command):
+    async def fail(*args):
+        raise redis.ResponseError("unknown command")
+
+    setattr(redis_client, command, fail)
+    cache = RecordCache(("exchange:",), StorageCacheSettings(enabled=True))
+    await cache.start(redis_client)
+    assert not cache.active
+    await cache.close()
+
+
+async def _notify_keyspace_events(redis_client) -> str:
+    config = await redis_client.config_get("notify-keyspace-events")
+    return config["notify-keyspace-events"]
@@ -0,0 +1,160 @@
+from datetime import UTC, datetime
+
+import pytest
+from pydantic import ValidationError
+
+from app.codecs import _TRUSTED_HEADER_SIZE, CODECS, CompactCodec, JSONCodec
+from app.exchanges.models import DisclosedValue, Exchange, ExchangeReply, ExchangeType
+from app.signatures.models import SignatureRequest
+from app.yivi.models import TranslatedString
+
+_values = [
+    DisclosedValue(
+        id="pbdf.sidn-pbdf.email.email",
+        value=TranslatedString(
+            default="foo@example.com", en="foo@example.com", nl="foo@example.com"
+        ),
+    ),
+    DisclosedValue(
+        id="irma-demo.MijnOverheid.root.BSN",
+        value=TranslatedString(default="999999990", en="999999990", nl="999999990"),
+    ),
+]
+
+_exchange = Exchange(
+    type=ExchangeType.ONE_TO_MANY,
+    send_email=True,
+    attributes=["pbdf.sidn-pbdf.email.email", "irma-demo.MijnOverheid.root.BSN"],
+    public_initiator_attributes=["pbdf.sidn-pbdf.mobilenumber.mobilenumber"],
+    initiator_attribute_values=_values,
+    initiator_email_value="foo@example.com",
+    expire_at=datetime.fromtimestamp(1720051200, tz=UTC),
+)
+
+_reply = ExchangeReply(exchange_id=_exchange.id, attribute_values=_values)
+
+_signature_request = SignatureRequest(
+    message="Hello, world!",
+    attributes=["pbdf.gemeente.personalData.fullname"],
+    expire_at=datetime.fromtimestamp(1720051200, tz=UTC),
+)
+
+
+@pytest.mark.parametrize("codec", CODECS.values(), ids=CODECS.keys())
+@pytest.mark.parametrize("model", [_exchange, _reply, _signature_request])
+def test_round_trip(codec, model):
+    assert codec.decode(type(model), codec.encode(model)) == model
+
+
+@pytest.mark.parametrize("codec", CODECS.values(), ids=CODECS.keys())
+@pytest.mark.parametrize("model", [_exchange, _reply, _signature_request])
+def test_round_trip_trusted(codec, model):
+    encoded = codec.encode(model, trusted=True, compact=True)
+    assert codec.decode(type(model), encoded) == model
+    assert codec.decode(type(model), encoded, trusted=True) == model
+
+
+@pytest.mark.parametrize("model", [_exchange, _reply, _signature_request])
+def test_untrusted_json_is_plain(model):
+    """Without the trusted envelope, JSON records are the same as before codecs existed."""
+    assert JSONCodec().encode(model) == model.model_dump_json().encode()
+
+
+@pytest.mark.parametrize("model", [_exchange, _reply, _signature_request])
+def test_read_any_format(model):
+    """Records can be read regardless of the codec they were written with."""
+    old_json = model.model_dump_json()
+    assert CompactCodec().decode(type(model), old_json.encode()) == model
+    assert CompactCodec().decode(type(model), old_json) == model
+    assert JSONCodec().decode(type(model), CompactCodec().encode(model)) == model
+    assert JSONCodec().decode(type(model), CompactCodec().encode(model, trusted=True)) == model
+
+
+def test_interned_attribute_ids():
+    encoded = CompactCodec().encode(_reply)
+
+    assert b"pbdf.sidn-pbdf.email.email" not in encoded
+    # Attribute IDs that are not interned are stored as is.
+    assert b"irma-demo.MijnOverheid.root.BSN" in encoded
+    assert len(encoded) < len(JSONCodec().encode(_reply))
+
+
+def test_unsupported_version():
+    encoded = CompactCodec().encode(_reply, trusted=True)
+
+    version = _TRUSTED_HEADER_SIZE + 1
+    with pytest.raises(ValueError, match="Unsupported compact record version"):
+        CompactCodec().decode(ExchangeReply, encoded[:version] + b"\xff" + encoded[version + 1 :])
+
+
+@pytest.mark.parametrize("codec", CODECS.values(), ids=CODECS.keys())
+def test_trusted_load(codec):
+    decoded = codec.decode(Exchange, codec.encode(_exchange, trusted=True), trusted=True)
+
+    assert decoded == _exchange
+    assert decoded.expire_at == _exchange.expire_at
+    assert isinstance(decoded.type, ExchangeType)
+    assert isinstance(decoded.initiator_attribute_values[0], DisclosedValue)
+    assert isinstance(decoded.initiator_attribute_values[0].value, TranslatedString)
+
+
+@pytest.mark.parametrize("codec", CODECS.values(), ids=CODECS.keys())
+def test_untrusted_records_are_validated(codec):
+    """Only records with a matching schema fingerprint and checksum skip validation."""
+    invalid = _signature_request.model_construct(
+        **{**dict(_signature_request), "attributes": ["invalid"]}
+    )
+    encoded = codec.encode(invalid, trusted=True)
+    assert codec.decode(SignatureRequest, encoded, trusted=True).attributes == ["invalid"]
+
+    with pytest.raises(ValidationError):
+        codec.decode(SignatureRequest, encoded)
+
+    # A record with a different checksum, or one written for another schema.
+    tampered = encoded[:-2] + b"\x00" + encoded[-1:]
+    with pytest.raises(ValidationError):
+        codec.decode(SignatureRequest, tampered, trusted=True)
+    other_schema = encoded[:1] + b"\x00\x00\x00\x00" + encoded[5:]
+    with pytest.raises(ValidationError):
+        codec.decode(SignatureRequest, other_schema, trusted=True)
+    # A record written without the trusted envelope.
+    with pytest.raises(ValidationError):
+        codec.decode(SignatureRequest, codec.encode(invalid), trusted=True)
+
+
+@pytest.mark.parametrize("codec", CODECS.values(), ids=CODECS.keys())
+def test_compression(codec):
+    request = _signature_request.model_copy(update={"message": "Hello, world! " * 1000})
+
+    encoded = codec.encode(request, compress_above=1024)
+    assert len(encoded) < len(codec.encode(request)) / 10
+    assert codec.decode(SignatureRequest, encoded) == request
+    assert codec.decode(SignatureRequest, encoded, trusted=True) == request
+    # Small records are not compressed.
+    assert codec.encode(_signature_request, compress_above=1024) == codec.encode(_signature_request)
+
+
+def test_compact_translations():
+    encoded = JSONCodec().encode(_reply, compact=True)
+
+    assert b'"value":"foo@example.com"' in encoded
+    assert encoded.count(b"foo@example.com") == 1
+    # Translations are only collapsed when asked to, regardless of the trusted envelope.
+    assert JSONCodec().encode(_reply).count(b"foo@example.com") == 3
+    assert JSONCodec().encode(_reply, trusted=True).count(b"foo@example.com") == 3
+    assert JSONCodec().decode(ExchangeReply, encoded) == _reply
+    assert CompactCodec().decode(ExchangeReply, CompactCodec().encode(_reply, compact=True)) == (
+        _reply
+    )
+    # Translations that differ are stored in full.
+    reply = _reply.model_copy(
+        update={
+            "attribute_values": [
+                DisclosedValue(
+                    id="pbdf.gemeente.personalData.dateofbirth",
+                    value=TranslatedString(default="1 jan 2000", nl="1 jan 2000", en="Jan 1 2000"),
+                )
+            ]
+        }
+    )
+    assert JSONCodec().decode(ExchangeReply, JSONCodec().encode(reply, compact=True)) == reply
@@ -0,0 +1,82 @@
+import asyncio
+
+import pytest
+from fakeredis import FakeServer
+from fakeredis.aioredis import FakeAsyncRedisConnection
+
+from app.config import RedisPoolSettings
+from app.dependencies import RedisManager
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+def _manager(server: FakeServer, **kwargs) -> RedisManager:
+    """Get a manager of a real connection pool, with connections to a fake server."""
+    manager = RedisManager("redis://localhost:6379/0", RedisPoolSettings(**kwargs))
+    pool = manager.client.connection_pool
+    pool.connection_class = FakeAsyncRedisConnection
+    pool.connection_kwargs.update(server=server, version=(7,), server_type="redis")
+    # Fake connections don't answer the health checks of idle connections.
+    del pool.connection_kwargs["health_check_interval"]
+    return manager
+
+
+@pytest.mark.anyio
+async def test_warmup_and_stats():
+    manager = _manager(FakeServer(), min_connections=3, max_connections=5)
+    await manager.start()
+
+    stats = manager.stats()
+    assert stats is not None
+    assert (stats.in_use, stats.idle, stats.max_connections) == (0, 3, 5)
+    assert stats.acquired == 3
+    assert stats.healthy
+
+    # The same client and pool are used for all requests.
+    assert manager.client is manager.client
+    await manager.client.set("foo", "bar")
+    assert await manager.client.get("foo") == b"bar"
+    assert manager.stats().idle == 3  # type: ignore[union-attr]
+
+    pool = manager.client.connection_pool
+    connection = await pool.get_connection()
+    assert (manager.stats().in_use, manager.stats().idle) == (1, 2)  # type: ignore[union-attr]
+    await pool.release(connection)
+    assert (manager.stats().in_use, manager.stats().idle) == (0, 3)  # type: ignore[union-attr]
+
+    await manager.close()
+    assert manager.stats() is None
+
+
+@pytest.mark.anyio
+async def test_wait_for_connection():
+    manager = _manager(FakeServer(), min_connections=1, max_connections=2, timeout=1)
+    await manager.start()
+
+    await asyncio.gather(*(manager.client.ping() for _ in range(20)))
+
+    stats = manager.stats()
+    assert stats is not None
+    assert stats.in_use == 0
+    assert stats.idle <= 2
+    assert stats.acquired == 21
+    assert stats.mean_wait_time > 0
+    await manager.close()
+
+
+@pytest.mark.anyio
+async def test_health_check():
+    server = FakeServer()
+    manager = _manager(server)
+    assert await manager.check_health()
+
+    server.connected = False
+    assert not await manager.check_health()
+    assert not manager.stats().healthy  # type: ignore[union-attr]
+
+    server.connected = True
+    assert await manager.check_health()
+    await manager.close()
@@ -0,0 +1,125 @@
+import asyncio
+
+import pytest
+from fakeredis import FakeAsyncRedis
+
+from app.config import MailerSettings, settings
+from app.mailer import DEAD_LETTER_STREAM, EMAIL_STREAM, Mailer, RedisEmailOutbox
+from app.smtp import SMTPPool
+from app.tests.smtp_server import smtp_message, smtp_settings
+from app.utils import send_email
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+def _mailer(redis, handler, consumer="mailer", **kwargs) -> Mailer:
+    smtp = smtp_settings(handler)
+    return Mailer(
+        redis,
+        SMTPPool(smtp),
+        smtp,
+        MailerSettings(**{"retry_after": 0, **kwargs}),
+        consumer=consumer,
+    )
+
+
+async def _process_all(mailer: Mailer) -> None:
+    while await mailer.process():
+        pass
+
+
+@pytest.mark.anyio
+async def test_send_from_stream(handler):
+    async with FakeAsyncRedis() as redis:
+        mailer = _mailer(redis, handler)
+        await mailer.setup()
+        outbox = RedisEmailOutbox(redis)
+        for i in range(30):
+            await outbox.put(smtp_message(f"{i}@example.com"))
+
+        await _process_all(mailer)
+
+        assert sorted(handler.messages) == sorted(f"{i}@example.com" for i in range(30))
+        assert mailer.sent == 30
+        assert await redis.xlen(EMAIL_STREAM) == 0
+        assert (await redis.xpending(EMAIL_STREAM, "mailers"))["pending"] == 0
+
+
+@pytest.mark.anyio
+async def test_retry_temporary_errors(handler):
+    async with FakeAsyncRedis() as redis:
+        mailer = _mailer(redis, handler)
+        await mailer.setup()
+        handler.responses = ["451 Try again later"]
+
+        await RedisEmailOutbox(redis).put(smtp_message("a@example.com"))
+        await mailer.process()
+        assert handler.messages == []
+
+        await mailer.process()
+        assert handler.messages == ["a@example.com"]
+        assert await redis.xlen(EMAIL_STREAM) == 0
+
+
+@pytest.mark.anyio
+async def test_dead_letter(handler):
+    async with FakeAsyncRedis() as redis:
+        mailer = _mailer(redis, handler, max_deliveries=2)
+        await mailer.setup()
+        handler.responses = ["550 No such user", *["451 Try again later"] * 10]
+
+        await RedisEmailOutbox(redis).put(smtp_message("a@example.com"))
+        await RedisEmailOutbox(redis).put(smtp_message("b@example.com"))
+        await _process_all(mailer)
+
+        # One email is rejected permanently, the other one failed too often.
+        dead = await redis.xrange(DEAD_LETTER_STREAM)
+        assert len(dead) == 2
+        assert dead[0][1][b"reason"].startswith(b"(550")
+        assert dead[1][1][b"reason"] == b"Too many delivery attempts"
+        assert mailer.dead_lettered == 2
+        assert handler.messages == []
+        assert await redis.xlen(EMAIL_STREAM) == 0
+
+
+@pytest.mark.anyio
+async def test_take_over_from_stopped_mailer(handler):
+    async with FakeAsyncRedis() as redis:
+        stopped = _mailer(redis, handler, consumer="stopped")
+        await stopped.setup()
+        await RedisEmailOutbox(redis).put(smtp_message("a@example.com"))
+        # The mailer stops after reading the email, before it is sent.
+        assert len(await stopped._read(block=None)) == 1
+
+        await _process_all(_mailer(redis, handler, consumer="other"))
+
+        assert handler.messages == ["a@example.com"]
+
+
+@pytest.mark.anyio
+async def test_run_until_stopped(handler):
+    async with FakeAsyncRedis() as redis:
+        mailer = _mailer(redis, handler, concurrency=2, retry_after=60)
+        stop = asyncio.Event()
+        task = asyncio.create_task(mailer.run(stop))
+
+        for i in range(10):
+            await RedisEmailOutbox(redis).put(smtp_message(f"{i}@example.com"))
+        while mailer.sent < 10:
+            await asyncio.sleep(0.01)
+        stop.set()
+        await task
+
+        assert len(handler.messages) == 10
+
+
+@pytest.mark.anyio
+async def test_send_email_to_redis(monkeypatch):
+    monkeypatch.setattr(settings, "email_outbox", "redis")
+    async with FakeAsyncRedis() as redis:
+        await send_email(smtp_message("a@example.com"), redis)
+
+        assert await redis.xlen(EMAIL_STREAM) == 1
@@ -0,0 +1,54 @@
+from fastapi.testclient import TestClient
+
+from app.cache import RecordCache
+from app.config import StorageCacheSettings, settings
+from app.dependencies import redis_manager
+from app.exchanges.digests import DigestScheduler
+from app.main import app
+from app.smtp import EmailOutbox
+from app.tests.smtp_server import smtp_message, smtp_settings
+from app.yivi.models import DisclosureRequest, DisclosureRequestJWT, ExtendedDisclosureRequest
+from app.yivi.service import jwt_service
+
+_request = DisclosureRequestJWT(
+    sprequest=ExtendedDisclosureRequest(
+        request=DisclosureRequest(disclose=[[["pbdf.sidn-pbdf.email.email"]]]),
+    ),
+)
+
+
+def test_lifespan(handler, monkeypatch):
+    """The app can be started and stopped more than once, like the tests do."""
+    cache = RecordCache(("exchange:",), StorageCacheSettings(enabled=True))
+    outbox = EmailOutbox.from_settings(smtp_settings(handler))
+    monkeypatch.setattr("app.main.record_cache", cache)
+    monkeypatch.setattr("app.main.email_outbox", outbox)
+    monkeypatch.setattr(settings, "smtp", smtp_settings(handler))
+    monkeypatch.setattr(settings, "email_digest_window", 3600)
+
+    # fakeredis always publishes keyspace notifications, but doesn't support `CONFIG`.
+    async def get_notify_keyspace_events(redis_client):
+        return "KA"
+
+    monkeypatch.setattr("app.cache._get_notify_keyspace_events", get_notify_keyspace_events)
+
+    digests = 0
+
+    async def process(self, now=None):
+        nonlocal digests
+        digests += 1
+        return 0
+
+    monkeypatch.setattr(DigestScheduler, "process", process)
+
+    for run in range(1, 3):
+        with TestClient(app) as client:
+            assert redis_manager.healthy
+            assert cache.active
+            assert client.portal.call(jwt_service.sign, _request) == _request.signed_jwt()
+            client.portal.call(outbox.put, smtp_message(f"{run}@example.com"))
+
+        # On shutdown, the digest scheduler and cache are stopped and the outbox is drained.
+        assert digests == run
+        assert not cache.active
+        assert len(handler.messages) == run
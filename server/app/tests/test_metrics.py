@@ -0,0 +1,101 @@
+import os
+import subprocess
+import sys
+import textwrap
+from pathlib import Path
+
+import pytest
+from fakeredis import FakeAsyncRedis
+from fastapi.testclient import TestClient
+from prometheus_client import REGISTRY
+
+from app.exchanges.dependencies import ExchangesStorage
+from app.main import app
+
+client = TestClient(app)
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+def _value(name: str, **labels: str) -> float:
+    return REGISTRY.get_sample_value(name, labels) or 0.0
+
+
+def _route_count(route_suffix: str, status: str) -> float:
+    """Count requests to a route, regardless of the router prefix in the label."""
+    return sum(
+        sample.value
+        for metric in REGISTRY.collect()
+        for sample in metric.samples
+        if sample.name == "diyivi_request_duration_seconds_count"
+        and sample.labels["route"].endswith(route_suffix)
+        and sample.labels["status"] == status
+    )
+
+
+def test_metrics_endpoint():
+    count = _route_count("/{exchange_id}/", "404")
+    not_found = _value("diyivi_outcomes_total", outcome="not_found")
+
+    response = client.get("/api/exchanges/0123456789abcdef/")
+    assert response.status_code == 404
+
+    response = client.get("/api/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    assert "diyivi_request_duration_seconds_bucket" in response.text
+    assert _route_count("/{exchange_id}/", "404") == count + 1
+    assert _value("diyivi_outcomes_total", outcome="not_found") == not_found + 1
+
+    # The metrics are not part of the API schema.
+    assert "/api/metrics" not in client.get("/api/openapi.json").json()["paths"]
+
+
+@pytest.mark.anyio
+async def test_storage_methods_are_timed():
+    count = _value(
+        "diyivi_storage_duration_seconds_count", storage="exchanges", method="count_replies"
+    )
+    storage = ExchangesStorage(FakeAsyncRedis())
+    assert await storage.count_replies("0123456789abcdef") == 0
+    assert (
+        _value("diyivi_storage_duration_seconds_count", storage="exchanges", method="count_replies")
+        == count + 1
+    )
+
+
+def _run(code: str, multiproc_dir: Path) -> str:
+    return subprocess.run(
+        [sys.executable, "-c", textwrap.dedent(code)],
+        env={**os.environ, "PROMETHEUS_MULTIPROC_DIR": str(multiproc_dir)},
+        cwd=Path(__file__).parents[2],
+        capture_output=True,
+        check=True,
+        text=True,
+    ).stdout
+
+
+def test_metrics_of_workers_are_aggregated(tmp_path):
+    # Each process records some metrics, like each of the workers would.
+    for _ in range(2):
+        _run(
+            """
+            from app.metrics import EMAIL_DURATION, OUTCOMES
+            OUTCOMES.labels("invalid_jwt").inc()
+            EMAIL_DURATION.labels("outbox").observe(0.01)
+            """,
+            tmp_path,
+        )
+
+    output = _run(
+        """
+        from app.metrics import render_metrics
+        print(render_metrics()[0].decode())
+        """,
+        tmp_path,
+    )
+    assert 'diyivi_outcomes_total{outcome="invalid_jwt"} 2.0' in output
+    assert 'diyivi_email_duration_seconds_count{stage="outbox"} 2.0' in output
@@ -0,0 +1,76 @@
+from fastapi import APIRouter, BackgroundTasks, FastAPI
+from fastapi.routing import APIRoute
+from fastapi.testclient import TestClient
+from pydantic import BaseModel, Field
+
+from app.responses import ModelResponse, ModelRoute
+from app.yivi.models import TranslatedString
+
+
+class Item(BaseModel):
+    name: str = Field(alias="itemName", min_length=1)
+    tags: list[str] = []
+
+
+class DetailedItem(Item):
+    secret: str
+
+
+def _app(route_class: type) -> FastAPI:
+    router = APIRouter(route_class=route_class)
+    tasks: list[str] = []
+
+    @router.get("/item/")
+    async def item() -> Item:
+        return Item(itemName="foo", tags=["a", "b"])
+
+    @router.get("/invalid/")
+    async def invalid() -> Item:
+        # Not validated again when serialized directly.
+        return Item.model_construct(name="")
+
+    @router.get("/detailed/", response_model=Item)
+    async def detailed() -> DetailedItem:
+        return DetailedItem(itemName="foo", secret="bar")
+
+    @router.post("/background/", status_code=201)
+    async def background(background_tasks: BackgroundTasks) -> Item:
+        background_tasks.add_task(tasks.append, "done")
+        return Item(itemName="foo")
+
+    app = FastAPI(default_response_class=ModelResponse)
+    app.include_router(router)
+    app.state.tasks = tasks
+    return app
+
+
+def test_same_responses():
+    fast, default = TestClient(_app(ModelRoute)), TestClient(_app(APIRoute))
+
+    for path in ("/item/", "/detailed/"):
+        assert fast.get(path).json() == default.get(path).json()
+    # Models of another type than the response model are filtered by FastAPI as usual.
+    assert "secret" not in fast.get("/detailed/").json()
+    assert fast.app.openapi() == default.app.openapi()  # type: ignore[attr-defined]
+
+
+def test_serialize_directly():
+    client = TestClient(_app(ModelRoute))
+
+    assert client.get("/invalid/").json() == {"itemName": "", "tags": []}
+
+
+def test_background_tasks():
+    app = _app(ModelRoute)
+
+    response = TestClient(app).post("/background/")
+
+    assert response.status_code == 201
+    assert app.state.tasks == ["done"]
+
+
+def test_model_response():
+    value = TranslatedString(default="foo", nl="foo", en="foo")
+
+    assert ModelResponse({"a": [1, None]}).body == b'{"a":[1,null]}'
+    assert ModelResponse(value).body == b'{"":"foo","nl":"foo","en":"foo"}'
@@ -0,0 +1,93 @@
+import asyncio
+
+import pytest
+
+from app.smtp import EmailOutbox, EmailOutboxClosedError, SMTPPool
+from app.tests.smtp_server import free_port, smtp_message, smtp_settings
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+@pytest.mark.anyio
+async def test_reuse_connections(handler):
+    outbox = EmailOutbox.from_settings(smtp_settings(handler, pool_size=2))
+
+    for i in range(50):
+        await outbox.put(smtp_message(f"{i}@example.com"))
+    await outbox.drain()
+
+    assert sorted(handler.messages) == sorted(f"{i}@example.com" for i in range(50))
+    assert outbox.sent == 50
+    assert handler.connections <= 2
+
+
+@pytest.mark.anyio
+async def test_reconnect_after_disconnect(handler):
+    pool = SMTPPool(smtp_settings(handler))
+
+    assert await pool.send_batch([smtp_message("a@example.com")]) == [None]
+    async with pool.connection() as client:
+        # The server closes idle connections.
+        client.close()
+    assert await pool.send_batch([smtp_message("b@example.com")]) == [None]
+
+    assert handler.messages == ["a@example.com", "b@example.com"]
+    assert pool.connections_opened == 2
+    await pool.close()
+
+
+@pytest.mark.anyio
+async def test_retry_temporary_errors(handler):
+    outbox = EmailOutbox.from_settings(smtp_settings(handler, max_attempts=3))
+    handler.responses = ["451 Try again later", "550 No such user", "451 Try again later"]
+
+    await outbox.put(smtp_message("a@example.com"))
+    await outbox.put(smtp_message("b@example.com"))
+    await outbox.drain()
+
+    # One email is rejected permanently, the other is sent on the third attempt.
+    assert len(handler.messages) == 1
+    assert outbox.sent == 1
+    assert outbox.failed == 1
+
+
+@pytest.mark.anyio
+async def test_give_up_after_max_attempts(handler):
+    outbox = EmailOutbox.from_settings(smtp_settings(handler, max_attempts=2))
+    handler.responses = ["451 Try again later"] * 2
+
+    await outbox.put(smtp_message("a@example.com"))
+    await outbox.drain()
+
+    assert handler.messages == []
+    assert outbox.failed == 1
+
+
+@pytest.mark.anyio
+async def test_unreachable_server(handler):
+    outbox = EmailOutbox.from_settings(smtp_settings(handler, max_attempts=2, port=free_port()))
+
+    await outbox.put(smtp_message("a@example.com"))
+    await outbox.drain()
+
+    assert outbox.failed == 1
+
+
+@pytest.mark.anyio
+async def test_drain(handler):
+    outbox = EmailOutbox.from_settings(smtp_settings(handler, outbox_size=1))
+
+    await asyncio.gather(*(outbox.put(smtp_message(f"{i}@example.com")) for i in range(5)))
+    await outbox.drain()
+
+    assert len(handler.messages) == 5
+    with pytest.raises(EmailOutboxClosedError):
+        await outbox.put(smtp_message("a@example.com"))
+
+    outbox.open()
+    await outbox.put(smtp_message("a@example.com"))
+    await outbox.drain()
+    assert len(handler.messages) == 6
@@ -0,0 +1,122 @@
+import pytest
+
+from app.exchanges.email import (
+    render_initiator_exchange_result_email,
+    render_initiator_exchange_results_digest_email,
+)
+from app.exchanges.models import DisclosedValue
+from app.templates import (
+    ATTRIBUTE_DISPLAY_OPTIONS,
+    AttributeDisplayRenderer,
+    Template,
+    translated,
+)
+from app.yivi.models import TranslatedString
+
+
+def _value(value: str) -> TranslatedString:
+    return TranslatedString(default=value, nl=value, en=value)
+
+
+_address = {
+    "pbdf.gemeente.address.street": _value("Toernooiveld"),
+    "pbdf.gemeente.address.houseNumber": _value("212"),
+    "pbdf.gemeente.address.zipcode": _value("6525 EC"),
+    "pbdf.gemeente.address.city": _value("Nijmegen"),
+}
+
+_date_of_birth = DisclosedValue(
+    id="pbdf.gemeente.personalData.dateofbirth",
+    value=translated("1 januari 2000", "January 1 2000"),
+)
+
+
+@pytest.fixture
+def exchange(make_exchange):
+    return make_exchange(
+        attributes=["pbdf.sidn-pbdf.email.email", "pbdf.gemeente.personalData.dateofbirth"]
+    )
+
+
+def test_template():
+    template = Template("Hello {name}, {{escaped}} {greeting}")
+
+    assert template.fields == {"name", "greeting"}
+    assert template.render({"name": "{greeting}", "greeting": "!"}, "nl") == (
+        "Hello {greeting}, {escaped} !"
+    )
+    assert template.render({"name": translated("wereld", "world"), "greeting": ""}, "en") == (
+        "Hello world, {escaped} "
+    )
+    assert template.render({"name": {"en": "world"}, "greeting": "."}, "en") == (
+        "Hello world, {escaped} ."
+    )
+    with pytest.raises(ValueError, match="Unsupported template field"):
+        Template("{name!r}")
+    with pytest.raises(ValueError, match="Unsupported template field"):
+        Template("{name.attribute}")
+
+
+def test_display_options():
+    renderer = AttributeDisplayRenderer(ATTRIBUTE_DISPLAY_OPTIONS)
+
+    assert renderer.render(_address, ["nl", "en"]) == {
+        "nl": "- Woonadres: Toernooiveld 212, 6525 EC Nijmegen",
+        "en": "- Home address: Toernooiveld 212, 6525 EC Nijmegen",
+    }
+    # The address is only displayed if all its attributes are disclosed.
+    partial = {**_address}
+    del partial["pbdf.gemeente.address.city"]
+    assert renderer.render(partial, ["nl"]) == {"nl": ""}
+    assert renderer.options_for(frozenset(_address)) is renderer.options_for(frozenset(_address))
+
+
+def test_exchange_result_email(make_reply, exchange):
+    message = render_initiator_exchange_result_email(
+        exchange, make_reply(exchange, "foo@example.com", _date_of_birth)
+    )
+
+    assert message["To"] == "initiator@example.com"
+    assert message["Subject"] == "Antwoord via DIYivi"
+    assert message.get_content() == (
+        """Beste gebruiker van DIYivi,
+
+Gefeliciteerd! Iemand heeft gereageerd op je verzoek om gegevens uit te wisselen.
+Dit zijn de gegevens die je hebt ontvangen:
+
+- E-mailadres: foo@example.com
+- Geboortedatum: 1 januari 2000
+
+Al deze gegevens worden vanzelf binnen 48 uur van DIYivi verwijderd.
+Dit is een automatisch gegenereerd bericht. U kunt hier niet op reageren.
+"""
+    )
+
+
+def test_multiple_languages(monkeypatch, make_reply, exchange):
+    monkeypatch.setattr("app.exchanges.email.settings.email_languages", ["en", "nl"])
+
+    message = render_initiator_exchange_result_email(
+        exchange, make_reply(exchange, "foo@example.com", _date_of_birth)
+    )
+
+    assert message["Subject"] == "Reply via DIYivi"
+    content = message.get_content()
+    assert content.index("- Date of birth: January 1 2000") < content.index(
+        "- Geboortedatum: 1 januari 2000"
+    )
+
+
+def test_digest_email(make_reply, exchange):
+    message = render_initiator_exchange_results_digest_email(
+        exchange,
+        [
+            make_reply(exchange, "foo@example.com", _date_of_birth),
+            make_reply(exchange, "bar@example.com", _date_of_birth),
+        ],
+    )
+
+    assert message["Subject"] == "2 antwoorden via DIYivi"
+    content = message.get_content()
+    assert "Antwoord 1:\n- E-mailadres: foo@example.com\n" in content
+    assert "Antwoord 2:\n- E-mailadres: bar@example.com\n" in content
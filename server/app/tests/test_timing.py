@@ -0,0 +1,58 @@
+import time
+
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app.timing import RequestTiming, ServerTimingMiddleware, _current, timed
+
+client = TestClient(ServerTimingMiddleware(app, allow_origin="https://example.com"))
+
+
+def test_not_timed_without_request():
+    assert timed("redis") is timed("validation")
+    with timed("redis"):
+        pass
+
+
+def test_nested_phases():
+    timing = RequestTiming()
+    token = _current.set(timing)
+    try:
+        with timed("redis"):
+            time.sleep(0.01)
+            with timed("validation"):
+                time.sleep(0.02)
+        with timed("validation"):
+            time.sleep(0.01)
+    finally:
+        _current.reset(token)
+
+    # The time of the nested phase is not counted for the outer phase.
+    assert 0.01 <= timing.durations["redis"] < 0.02
+    assert 0.03 <= timing.durations["validation"] < 0.04
+
+
+def test_header():
+    timing = RequestTiming()
+    timing.durations["redis"] = 0.0012345
+    assert timing.header(0.01) == "redis;dur=1.23, total;dur=10.00"
+
+
+def test_server_timing_header():
+    response = client.post(
+        "/api/exchanges/create/",
+        json={
+            "attributes": ["pbdf.sidn-pbdf.email.email"],
+            "type": "1-to-1",
+            "send_email": True,
+            "public_initiator_attributes": ["pbdf.sidn-pbdf.mobilenumber.mobilenumber"],
+        },
+    )
+    assert response.status_code == 200
+    phases = [metric.split(";")[0] for metric in response.headers["Server-Timing"].split(", ")]
+    assert set(phases) == {"jwt", "serialization", "redis", "total"}
+    assert response.headers["Timing-Allow-Origin"] == "https://example.com"
+
+    # Without the middleware, as by default, there is no such header.
+    response = TestClient(app).get("/api/exchanges/0123456789abcdef/")
+    assert "Server-Timing" not in response.headers
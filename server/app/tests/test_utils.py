@@ -0,0 +1,26 @@
+from app.utils import compile_condiscon, create_condiscon
+
+
+def test_create_condiscon():
+    condiscon = create_condiscon(
+        [
+            "pbdf.sidn-pbdf.email.email",
+            "pbdf.gemeente.address.street",
+            "pbdf.gemeente.address.city",
+            "pbdf.sidn-pbdf.email.email",
+        ]
+    )
+
+    assert condiscon == (
+        (("pbdf.sidn-pbdf.email.email",),),
+        (("pbdf.gemeente.address.street", "pbdf.gemeente.address.city"),),
+    )
+
+
+def test_create_condiscon_is_cached():
+    attributes = ["pbdf.sidn-pbdf.email.email", "pbdf.gemeente.address.street"]
+
+    assert create_condiscon(attributes) is create_condiscon(iter(attributes))
+    assert create_condiscon(attributes) is create_condiscon([*attributes, *attributes])
+    assert create_condiscon(attributes) is compile_condiscon(attributes).condiscon
+    assert create_condiscon(attributes) is not create_condiscon(attributes[:1])
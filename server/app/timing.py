@@ -0,0 +1,103 @@
+"""Timing of the phases of a request, reported in its `Server-Timing` header.
+
+Code that does something worth reporting, such as Redis I/O or JWT verification, runs
+it in `timed(phase)`, which adds the time it took to the timing of the current request.
+Phases can be nested, in which case the time of the inner phase is not counted for the
+outer phase, so that a slow decode is not reported as slow Redis I/O.
+
+Requests are only timed with `server_timing` enabled. Otherwise there is no timing of
+the current request, and `timed` returns a context manager that does nothing.
+"""
+
+import contextlib
+import time
+from contextlib import AbstractContextManager
+from contextvars import ContextVar
+from typing import Any
+
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+
+class RequestTiming:
+    """Total time spent in each phase of a request."""
+
+    __slots__ = ("_nested", "durations")
+
+    def __init__(self) -> None:
+        self.durations: dict[str, float] = {}
+        # Time spent in phases nested in the phase that is currently being timed.
+        self._nested = 0.0
+
+    def header(self, total: float) -> str:
+        """Get the value of the `Server-Timing` header, with durations in milliseconds."""
+        metrics = [
+            f"{phase};dur={duration * 1000:.2f}" for phase, duration in self.durations.items()
+        ]
+        metrics.append(f"total;dur={total * 1000:.2f}")
+        return ", ".join(metrics)
+
+
+class _Phase:
+    __slots__ = ("_outer_nested", "_phase", "_start", "_timing")
+
+    def __init__(self, timing: RequestTiming, phase: str):
+        self._timing = timing
+        self._phase = phase
+
+    def __enter__(self) -> None:
+        self._outer_nested = self._timing._nested
+        self._timing._nested = 0.0
+        self._start = time.perf_counter()
+
+    def __exit__(self, *exc_info: Any) -> None:
+        elapsed = time.perf_counter() - self._start
+        timing = self._timing
+        durations = timing.durations
+        durations[self._phase] = durations.get(self._phase, 0.0) + elapsed - timing._nested
+        timing._nested = self._outer_nested + elapsed
+
+
+_NOT_TIMED = contextlib.nullcontext()
+
+_current: ContextVar[RequestTiming | None] = ContextVar("request_timing", default=None)
+
+
+def timed(phase: str) -> AbstractContextManager[None]:
+    """Add the time spent in the `with` block to `phase` of the current request."""
+    timing = _current.get()
+    return _NOT_TIMED if timing is None else _Phase(timing, phase)
+
+
+class ServerTimingMiddleware:
+    """Times the phases of every request, and adds them in a `Server-Timing` header.
+
+    The header is added when the response starts, so phases after that are not included.
+    """
+
+    def __init__(self, app: ASGIApp, allow_origin: str | None = None):
+        self.app = app
+        self.allow_origin = allow_origin
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        timing = RequestTiming()
+        start = time.perf_counter()
+
+        async def send_wrapper(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                headers = MutableHeaders(scope=message)
+                headers.append("Server-Timing", timing.header(time.perf_counter() - start))
+                if self.allow_origin is not None:
+                    # Let the client read the timing of cross-origin requests.
+                    headers.append("Timing-Allow-Origin", self.allow_origin)
+            await send(message)
+
+        token = _current.set(timing)
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _current.reset(token)
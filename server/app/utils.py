@@ -1,86 +1,69 @@
+import functools
 import logging
-from collections import defaultdict
+import time
 from collections.abc import Iterable
 from email.message import EmailMessage
 
-import aiosmtplib
+import redis.asyncio as redis
 
 from app.config import settings
-from app.yivi.models import Attribute
+from app.mailer import RedisEmailOutbox
+from app.metrics import EMAIL_DURATION
+from app.smtp import email_outbox
+from app.yivi.attributes import attribute_registry
+from app.yivi.models import Attribute, CompiledConDisCon
 
 logger = logging.getLogger(__name__)
 
 
-async def send_email(message: EmailMessage):
-    if settings.smtp is None:
+async def send_email(message: EmailMessage, redis: redis.Redis | None = None):
+    """Add an email to the outbox, from which it is sent in the background.
+
+    With the `redis` email outbox, the email is stored in Redis before this returns.
+    """
+    start = time.perf_counter()
+    if settings.email_outbox == "redis" and redis is not None:
+        await RedisEmailOutbox(redis).put(message)
+    elif email_outbox is None:
         logger.warning("No SMTP server is configured, but an email would have been sent.")
         return
+    else:
+        await email_outbox.put(message)
+    EMAIL_DURATION.labels("outbox").observe(time.perf_counter() - start)
 
-    await aiosmtplib.send(
-        message,
-        hostname=settings.smtp.hostname,
-        username=settings.smtp.username,
-        password=settings.smtp.password,
-        start_tls=True,
-    )
+
+ConDisCon = tuple[tuple[tuple[Attribute, ...], ...], ...]
 
 
-def create_condiscon(
-    attributes: Iterable[Attribute],
-) -> list[list[list[Attribute]]]:
+def create_condiscon(attributes: Iterable[Attribute]) -> ConDisCon:
     """Create a ConDisCon where attributes are grouped into conjunctions by their credential.
 
     This prevents issues with the requirement that each inner conjunction can consist of
     attributes of at most one non-singleton credential, while still guaranteeing that all
     the disclosed values of all attributes of a credential come from the same single instance
     of that credential.
+
+    Credentials and their attributes are in the order in which they first occur in
+    `attributes`, which is also the order in which Yivi shows them. The result is cached.
     """
-    credentials: defaultdict[str, set[Attribute]] = defaultdict(set)
-    for attribute in attributes:
-        credential = attribute[: attribute.rfind(".")]
-        credentials[credential].add(attribute)
-
-    condiscon: list[list[list[Attribute]]] = []
-    for key in credentials:
-        condiscon.append([list(credentials[key])])
-
-    return condiscon
-
-
-ATTRIBUTE_DISPLAY_OPTIONS = [
-    {
-        "label": "Volledige naam",
-        "required_attributes": {"pbdf.gemeente.personalData.fullname"},
-        "display": lambda values: values["pbdf.gemeente.personalData.fullname"].nl,
-    },
-    {
-        "label": "E-mailadres",
-        "required_attributes": {"pbdf.sidn-pbdf.email.email"},
-        "display": lambda values: values["pbdf.sidn-pbdf.email.email"].nl,
-    },
-    {
-        "label": "Mobiel telefoonnummer",
-        "required_attributes": {"pbdf.sidn-pbdf.mobilenumber.mobilenumber"},
-        "display": lambda values: values["pbdf.sidn-pbdf.mobilenumber.mobilenumber"].nl,
-    },
-    {
-        "label": "Geboortedatum",
-        "required_attributes": {"pbdf.gemeente.personalData.dateofbirth"},
-        "display": lambda values: values["pbdf.gemeente.personalData.dateofbirth"].nl,
-    },
-    {
-        "label": "Woonadres",
-        "required_attributes": {
-            "pbdf.gemeente.address.street",
-            "pbdf.gemeente.address.houseNumber",
-            "pbdf.gemeente.address.zipcode",
-            "pbdf.gemeente.address.city",
-        },
-        "display": lambda values: "{address} {house_number}, {zipcode} {city}".format(
-            address=values["pbdf.gemeente.address.street"].nl,
-            house_number=values["pbdf.gemeente.address.houseNumber"].nl,
-            zipcode=values["pbdf.gemeente.address.zipcode"].nl,
-            city=values["pbdf.gemeente.address.city"].nl,
-        ),
-    },
-]
+    return compile_condiscon(attributes).condiscon  # type: ignore[return-value]
+
+
+def compile_condiscon(attributes: Iterable[Attribute]) -> CompiledConDisCon:
+    """Get the compiled form of the ConDisCon created by `create_condiscon`.
+
+    ConDisCons are cached together with their compiled form, so that all requests and
+    disclosures for the same exchange or signature request share them.
+    """
+    return _compile_condiscon(tuple(dict.fromkeys(attributes)))
+
+
+@functools.lru_cache(maxsize=1024)
+def _compile_condiscon(attributes: tuple[Attribute, ...]) -> CompiledConDisCon:
+    credentials: dict[str, list[Attribute]] = {}
+    for attribute in map(attribute_registry.get, attributes):
+        credentials.setdefault(attribute.credential, []).append(attribute.id)
+
+    return CompiledConDisCon(
+        tuple((tuple(credential_attributes),) for credential_attributes in credentials.values())
+    )
@@ -0,0 +1,108 @@
+import re
+from collections.abc import Iterable
+from dataclasses import dataclass
+
+from app.config import settings
+
+ATTRIBUTE_PATTERN = r"^([a-zA-Z0-9_-]+\.){3}[a-zA-Z0-9_-]+$"
+
+_attribute_re = re.compile(ATTRIBUTE_PATTERN)
+
+
+@dataclass(frozen=True, slots=True)
+class AttributeInfo:
+    """An attribute ID, split into its credential ID and attribute name."""
+
+    id: str
+    credential: str
+    name: str
+
+
+class _AttributeIds(dict[str, str]):
+    """Registered attribute IDs by themselves, which validates IDs that are not registered."""
+
+    def __missing__(self, id: str) -> str:
+        if not _attribute_re.fullmatch(id):
+            raise ValueError(f"Invalid attribute ID: {id!r}")
+        return id
+
+
+class AttributeRegistry:
+    """Registry of validated attribute IDs.
+
+    The same few attribute IDs are used over and over again. The registry keeps a single
+    instance of each known ID, together with its credential and name. Models with
+    `Attribute` fields store that instance, so that the IDs in requests, disclosures and
+    ConDisCons are the same objects, and are compared by identity.
+
+    Only IDs that are registered, such as those in the allowlist and in templates, are
+    kept, so that arbitrary input can't fill the registry. Registered IDs are validated
+    with a single dict lookup, which is faster than matching them against the pattern.
+    Other IDs are still matched against the pattern, but not kept.
+
+    If an `allowlist` of attribute and credential IDs is given, only those attributes
+    can be requested in exchanges and signature requests.
+    """
+
+    def __init__(self, allowlist: Iterable[str] | None = None):
+        self._allowlist = frozenset(allowlist) if allowlist is not None else None
+        self._entries: dict[str, AttributeInfo] = {}
+        self._ids = _AttributeIds()
+        # Validate an attribute ID, and get its single instance if it is registered. This
+        # is the lookup itself rather than a method, as that is called for every ID.
+        self.validate = self._ids.__getitem__
+        if allowlist is not None:
+            self.register(id for id in allowlist if _attribute_re.match(id))
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, id: str) -> AttributeInfo:
+        """Get an attribute by its ID.
+
+        :raises ValueError: If `id` is not a valid attribute ID.
+        """
+        info = self._entries.get(id)
+        if info is not None:
+            return info
+
+        credential, _, name = self.validate(id).rpartition(".")
+        return AttributeInfo(id=id, credential=credential, name=name)
+
+    def register(self, ids: Iterable[str]) -> None:
+        """Add known attribute IDs to the registry.
+
+        :raises ValueError: If any of `ids` is not a valid attribute ID.
+        """
+        for id in ids:
+            if id not in self._entries:
+                self._entries[id] = self.get(id)
+                self._ids[id] = id
+
+    def intern(self, id: str) -> str:
+        """Get the single instance of a valid attribute ID, or the ID if it is not registered."""
+        return self._ids.get(id, id)
+
+    def credential(self, id: str) -> str:
+        """Get the ID of the credential an attribute belongs to."""
+        return self.get(id).credential
+
+    def is_allowed(self, id: str) -> bool:
+        """Return whether an attribute may be requested according to the allowlist."""
+        if self._allowlist is None:
+            return True
+        info = self.get(id)
+        return info.id in self._allowlist or info.credential in self._allowlist
+
+    def check_allowed(self, id: str) -> str:
+        """Validate that an attribute may be requested, and get its single instance.
+
+        :raises ValueError: If the attribute is not in the allowlist.
+        """
+        if not self.is_allowed(id):
+            raise ValueError(f"Attribute is not allowed: {id!r}")
+        return self.intern(id)
+
+
+attribute_registry = AttributeRegistry(allowlist=settings.attribute_allowlist)
+attribute_registry.register([settings.email_attribute])
@@ -0,0 +1,100 @@
+import hashlib
+import json
+import time
+from collections import OrderedDict
+from collections.abc import Callable
+from typing import Any
+
+import redis.asyncio as redis
+
+from app.config import settings
+from app.yivi.models import _BaseSessionRequestJWT
+from app.yivi.service import jwt_service
+
+
+def fingerprint(*parts: Any) -> str:
+    """Get a short, stable fingerprint of JSON-serializable data, such as a ConDisCon."""
+    data = json.dumps(parts, separators=(",", ":"), default=str).encode()
+    return hashlib.sha256(data).hexdigest()[:32]
+
+
+class RequestJWTCache:
+    """Cache of signed session request JWTs.
+
+    Session request JWTs that are the same except for their `iat` can be reused, as long
+    as the IRMA server still accepts them. Entries are kept for `ttl` seconds after they
+    were signed, in a bounded in-process LRU cache, and optionally in Redis, to share them
+    between all workers.
+    """
+
+    def __init__(self, max_entries: int, ttl: int):
+        self._max_entries = max_entries
+        self._ttl = ttl
+        self._entries: OrderedDict[str, tuple[str, float]] = OrderedDict()
+
+    def _get_local(self, key: str) -> str | None:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+
+        token, expires_at = entry
+        if expires_at <= time.time():
+            del self._entries[key]
+            return None
+
+        self._entries.move_to_end(key)
+        return token
+
+    def _set_local(self, key: str, token: str, expires_at: float) -> None:
+        if self._max_entries <= 0:
+            return
+
+        self._entries[key] = (token, expires_at)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self._max_entries:
+            self._entries.popitem(last=False)
+
+    async def get_or_sign(
+        self,
+        key: str,
+        build_request: Callable[[], _BaseSessionRequestJWT],
+        redis: redis.Redis | None = None,
+    ) -> str:
+        """Get a cached JWT for `key`, or sign the request made by `build_request`.
+
+        The key must identify the full content of the request, excluding its `iat`.
+        If `redis` is given, it is used as a second, shared, cache tier.
+        """
+        token = self._get_local(key)
+        if token is not None:
+            return token
+
+        if redis is not None:
+            pipeline = redis.pipeline(transaction=False)
+            pipeline.get(f"request_jwt:{key}")
+            pipeline.pttl(f"request_jwt:{key}")
+            cached, ttl_ms = await pipeline.execute()
+            if cached is not None and ttl_ms > 0:
+                token = cached.decode() if isinstance(cached, bytes) else cached
+                self._set_local(key, token, time.time() + ttl_ms / 1000)
+                return token
+
+        request = build_request()
+        token = await jwt_service.sign(request)
+        self._set_local(key, token, request.iat.timestamp() + self._ttl)
+
+        if redis is not None:
+            await redis.set(f"request_jwt:{key}", token, ex=self._ttl)
+
+        return token
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+
+request_jwt_cache = RequestJWTCache(
+    max_entries=settings.request_jwt_cache_size,
+    # Reuse JWTs for at most half their lifetime, so they are always fresh enough to start
+    # a session with, even if the user takes a while to scan the QR code.
+    ttl=settings.session_request_max_age // 2,
+)
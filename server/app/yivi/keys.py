@@ -0,0 +1,133 @@
+import logging
+import os
+import threading
+import time
+from collections.abc import Sequence
+from dataclasses import dataclass
+
+import jwt
+from cryptography.hazmat.primitives.asymmetric.rsa import RSAPublicKey
+from jwt.algorithms import RSAAlgorithm
+
+from app.config import IRMAServerPublicKey, IRMAServerSettings, settings
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class TrustedKey:
+    """A parsed public key of an IRMA server."""
+
+    key: RSAPublicKey
+    key_id: str | None = None
+    issuer: str | None = None
+
+
+class _KeySource:
+    """A configured public key, parsed once and reloaded when its file changes."""
+
+    def __init__(self, config: IRMAServerPublicKey):
+        self.config = config
+        self._mtime_ns: int | None = None
+        self.trusted_key = self._load()
+
+    def _load(self) -> TrustedKey:
+        mtime_ns = None
+        if self.config.key_file is not None:
+            mtime_ns = os.stat(self.config.key_file).st_mtime_ns
+            pem = self.config.key_file.read_bytes()
+        else:
+            pem = self.config.key  # type: ignore
+
+        key = RSAAlgorithm(RSAAlgorithm.SHA256).prepare_key(pem)
+        if not isinstance(key, RSAPublicKey):
+            raise ValueError("IRMA server key must be an RSA public key")
+
+        self._mtime_ns = mtime_ns
+        return TrustedKey(key=key, key_id=self.config.key_id, issuer=self.config.issuer)
+
+    def reload_if_changed(self) -> None:
+        if self.config.key_file is None:
+            return
+
+        try:
+            mtime_ns = os.stat(self.config.key_file).st_mtime_ns
+            if mtime_ns != self._mtime_ns:
+                self.trusted_key = self._load()
+                logger.info("Reloaded IRMA server public key from %s", self.config.key_file)
+        except (OSError, ValueError, jwt.InvalidKeyError):
+            # Keep using the previously loaded key, e.g. while the file is being replaced.
+            logger.warning(
+                "Could not reload IRMA server public key from %s",
+                self.config.key_file,
+                exc_info=True,
+            )
+
+
+class KeyProvider:
+    """Provides the trusted public keys of IRMA servers as pre-parsed key objects.
+
+    Keys are parsed once, instead of for every verified JWT. Keys that are configured
+    as a file are reloaded when the file changes, which is checked at most once every
+    `reload_interval` seconds.
+    """
+
+    def __init__(self, configs: Sequence[IRMAServerPublicKey], reload_interval: float = 10):
+        self._sources = [_KeySource(config) for config in configs]
+        self._reload_interval = reload_interval
+        self._last_reload_check = time.monotonic()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_settings(cls, irma_settings: IRMAServerSettings) -> "KeyProvider":
+        primary_key = (
+            IRMAServerPublicKey(key_file=irma_settings.server_public_key_file)
+            if irma_settings.server_public_key_file is not None
+            else IRMAServerPublicKey(key=irma_settings.server_public_key)
+        )
+        return cls(
+            [primary_key, *irma_settings.trusted_public_keys],
+            reload_interval=irma_settings.public_key_reload_interval,
+        )
+
+    @property
+    def keys(self) -> list[TrustedKey]:
+        """All trusted keys, after reloading any changed key files."""
+        now = time.monotonic()
+        if now - self._last_reload_check >= self._reload_interval:
+            with self._lock:
+                if now - self._last_reload_check >= self._reload_interval:
+                    self._last_reload_check = now
+                    for source in self._sources:
+                        source.reload_if_changed()
+
+        return [source.trusted_key for source in self._sources]
+
+    def candidate_keys(self, token: str) -> list[TrustedKey]:
+        """Get the keys that may have signed a JWT, in the order they should be tried.
+
+        Keys with a `key_id` matching the `kid` header of the JWT are tried first. Keys
+        restricted to an issuer are only returned if the (unverified) `iss` claim matches.
+
+        :raises jwt.DecodeError: If a header or claim needs to be read, but the input is
+            not a JWT at all.
+        """
+        keys = self.keys
+        if len(keys) == 1:
+            # Avoid decoding the token twice in the common case of a single trusted key.
+            return keys
+
+        if any(key.key_id is not None for key in keys):
+            key_id = jwt.get_unverified_header(token).get("kid")
+            matching = [key for key in keys if key.key_id == key_id]
+            if matching:
+                keys = matching + [key for key in keys if key.key_id != key_id]
+
+        if any(key.issuer is not None for key in keys):
+            issuer = jwt.decode(token, options={"verify_signature": False}).get("iss")
+            keys = [key for key in keys if key.issuer is None or key.issuer == issuer]
+
+        return keys
+
+
+key_provider = KeyProvider.from_settings(settings.irma)
@@ -5,23 +5,44 @@ from enum import StrEnum
 from typing import Annotated, Any, Literal, Self
 
 import jwt
-from pydantic import BaseModel, ConfigDict, Field, PlainSerializer, ValidationError, model_validator
+from pydantic import (
+    AfterValidator,
+    BaseModel,
+    ConfigDict,
+    Field,
+    PlainSerializer,
+    ValidationError,
+    WithJsonSchema,
+    model_validator,
+)
 
 from app.config import settings
+from app.timing import timed
+from app.yivi.attributes import ATTRIBUTE_PATTERN, attribute_registry
+from app.yivi.keys import key_provider
 
 logger = logging.getLogger(__name__)
 
+# The pattern is checked by the registry, which skips it for registered IDs, so it is only
+# in the schema.
 Attribute = Annotated[
     str,
-    Field(
-        pattern=r"^([a-zA-Z0-9_-]+\.){3}[a-zA-Z0-9_-]+$",
-        examples=[
-            "pbdf.gemeente.personalData.firstnames",
-            "pbdf.sidn-pbdf.mobilenumber.mobilenumber",
-        ],
+    AfterValidator(attribute_registry.validate),
+    WithJsonSchema(
+        {
+            "type": "string",
+            "pattern": ATTRIBUTE_PATTERN,
+            "examples": [
+                "pbdf.gemeente.personalData.firstnames",
+                "pbdf.sidn-pbdf.mobilenumber.mobilenumber",
+            ],
+        }
     ),
 ]
 
+# An attribute that may be requested, according to the `attribute_allowlist` setting.
+AllowedAttribute = Annotated[Attribute, AfterValidator(attribute_registry.check_allowed)]
+
 Timestamp = Annotated[datetime, PlainSerializer(lambda x: int(x.timestamp()), return_type=int)]
 
 
@@ -65,12 +86,41 @@ class AttributeProofStatus(StrEnum):
 
 
 class TranslatedString(BaseModel):
+    # Most attribute values are the same in every language. Those can be serialized as a
+    # single string with `compact_translations`, and such a string is expanded to all
+    # translations again when validated. This is not in a docstring, to keep it out of
+    # the OpenAPI schema.
+
     model_config = ConfigDict(populate_by_name=True)
 
     default: str = Field(alias="")
     nl: str = Field()
     en: str = Field()
 
+    @model_validator(mode="before")
+    @classmethod
+    def expand_compact(cls, data: Any) -> Any:
+        if isinstance(data, str):
+            return {"default": data, "nl": data, "en": data}
+        return data
+
+
+def compact_translations(data: Any) -> Any:
+    """Collapse each `TranslatedString` whose translations are all the same into a string.
+
+    This works on serialized data, such as `model.model_dump(mode="json")`, so that the
+    default serialization of models is not slowed down by it.
+    """
+    if isinstance(data, dict):
+        if len(data) == 3 and "nl" in data and "en" in data:
+            default = data.get("default", data.get(""))
+            if isinstance(default, str) and default == data["nl"] == data["en"]:
+                return default
+        return {key: compact_translations(value) for key, value in data.items()}
+    if isinstance(data, list):
+        return [compact_translations(item) for item in data]
+    return data
+
 
 class AttributeValue(BaseModel):
     type: Attribute
@@ -87,7 +137,7 @@ class AttributeValue(BaseModel):
 
 
 class _BaseRequest(BaseModel):
-    disclose: list[list[list[Attribute]]] = Field(
+    disclose: Sequence[Sequence[Sequence[Attribute]]] = Field(
         description="ConDisCon of attributes to disclose."
     )
 
@@ -173,12 +223,13 @@ class _BaseSessionRequestJWT(BaseModel):
     iss: str = settings.irma.session_request_issuer_id
     iat: Timestamp = Field(default_factory=lambda: datetime.now(UTC))
 
+    def claims(self) -> dict[str, Any]:
+        """Get the claims of this session request, as they are included in the JWT."""
+        return self.model_dump(exclude_none=True, by_alias=True)
+
     def signed_jwt(self) -> str:
-        return jwt.encode(
-            self.model_dump(exclude_none=True, by_alias=True),
-            settings.irma.session_request_secret_key.get_secret_value(),
-            algorithm="HS256",
-        )
+        with timed("jwt"):
+            return sign_session_request_claims(self.claims())
 
 
 class DisclosureRequestJWT(_BaseSessionRequestJWT):
@@ -239,7 +290,8 @@ class _BaseSessionResultJWT(BaseModel):
         )
 
     def satisfies_condiscon(
-        self, condiscon: Sequence[Sequence[Sequence[Attribute | AttributeValue]]]
+        self,
+        condiscon: "Sequence[Sequence[Sequence[Attribute | AttributeValue]]] | CompiledConDisCon",
     ) -> bool:
         """Return whether this session result satisfies the given ConDisCon.
 
@@ -248,18 +300,13 @@ class _BaseSessionResultJWT(BaseModel):
         disjunctions in the ConDisCon, and each disjunction should be satisfied by the
         disclosed attributes in the element at the same index.
         """
-        if (
-            self.disclosed is None
-            or len(self.disclosed) != len(condiscon)
-            or not self.is_successful
-        ):
+        if self.disclosed is None or not self.is_successful:
             return False
 
-        for disjunction, disclosed in zip(condiscon, self.disclosed):
-            if not satisfies_disjunction(disjunction, disclosed):
-                return False
-
-        return True
+        with timed("condiscon"):
+            if not isinstance(condiscon, CompiledConDisCon):
+                condiscon = CompiledConDisCon(condiscon)
+            return condiscon.is_satisfied_by(self.disclosed)
 
     @classmethod
     def parse_jwt(cls, raw_result: str) -> Self:
@@ -269,24 +316,61 @@ class _BaseSessionResultJWT(BaseModel):
         :raises pydantic.ValidationError: If the input is not a valid session result.
         """
         try:
-            result_dict = jwt.decode(
-                raw_result,
-                settings.irma.server_public_key,
-                algorithms=["RS256"],
-                # Allow for some inconsistency in system clocks between irma server and diyivi.
-                # This can be necessary when the irma server is running on a different machine.
-                leeway=5,
-            )
-            # The actual result type depends on the subclass this is called on.
-            return cls.model_validate(result_dict)
+            with timed("jwt"):
+                result_dict = decode_session_result_jwt(raw_result)
         except jwt.InvalidTokenError:
             logger.debug("Invalid JWT", exc_info=True)
             raise
+        return cls.from_claims(result_dict)
+
+    @classmethod
+    def from_claims(cls, result_dict: dict[str, Any]) -> Self:
+        """Validate the claims of an already verified session result JWT.
+
+        :raises pydantic.ValidationError: If the input is not a valid session result.
+        """
+        try:
+            # The actual result type depends on the subclass this is called on.
+            with timed("validation"):
+                return cls.model_validate(result_dict)
         except ValidationError:
             logger.debug("Invalid session result in JWT", exc_info=True)
             raise
 
 
+def sign_session_request_claims(claims: dict[str, Any]) -> str:
+    """Sign the claims of a session request JWT with the session request secret key."""
+    return jwt.encode(
+        claims,
+        settings.irma.session_request_secret_key.get_secret_value(),
+        algorithm="HS256",
+    )
+
+
+def decode_session_result_jwt(raw_result: str) -> dict[str, Any]:
+    """Verify a session result JWT with the trusted keys, and return its claims.
+
+    With multiple trusted keys (e.g. during key rotation), each candidate key is tried.
+
+    :raises jwt.InvalidTokenError: If the input is not a valid JWT.
+    """
+    for trusted_key in key_provider.candidate_keys(raw_result):
+        try:
+            return jwt.decode(
+                raw_result,
+                trusted_key.key,
+                algorithms=["RS256"],
+                issuer=trusted_key.issuer,
+                # Allow for some inconsistency in system clocks between irma server and diyivi.
+                # This can be necessary when the irma server is running on a different machine.
+                leeway=5,
+            )
+        except jwt.InvalidSignatureError:
+            continue
+
+    raise jwt.InvalidSignatureError("Signature verification failed")
+
+
 class DisclosureSessionResultJWT(_BaseSessionResultJWT):
     """The result of a disclosure session, signed by the `irma server`."""
 
@@ -318,19 +402,91 @@ class SignatureSessionResultJWT(_BaseSessionResultJWT):
     signature: SignedMessage
 
 
-def satisfies_disjunction(
-    disjunction: Sequence[Sequence[Attribute | AttributeValue]],
-    disclosed: Sequence[DisclosedAttribute],
-) -> bool:
-    return any(satisfies_conjunction(conjunction, disclosed) for conjunction in disjunction)
+class _Requirement:
+    """A single required attribute of a ConDisCon, with its constraint pre-split."""
 
+    __slots__ = ("attribute", "not_null", "rawvalue")
 
-def satisfies_conjunction(
-    conjunction: Sequence[Attribute | AttributeValue],
-    disclosed: Sequence[DisclosedAttribute],
-) -> bool:
-    for required_attribute in conjunction:
-        if any(attribute.satisfies(required_attribute) for attribute in disclosed):
-            continue
-        return False
-    return True
+    def __init__(self, value: Attribute | AttributeValue):
+        if isinstance(value, AttributeValue):
+            self.attribute: str = attribute_registry.intern(value.type)
+            self.rawvalue = value.value
+            self.not_null = value.not_null
+        else:
+            self.attribute = attribute_registry.intern(value)
+            self.rawvalue = None
+            self.not_null = None
+
+    def satisfied_by(self, attribute: DisclosedAttribute) -> bool:
+        if self.not_null is None:
+            return self.rawvalue is None or attribute.rawvalue == self.rawvalue
+        return (attribute.status != AttributeProofStatus.NULL) == self.not_null
+
+
+class _CompiledConjunction:
+    """A conjunction, split into attributes that only need to be disclosed and constraints."""
+
+    __slots__ = ("attributes", "constraints")
+
+    def __init__(self, conjunction: Sequence[Attribute | AttributeValue]):
+        requirements = [_Requirement(value) for value in conjunction]
+        self.attributes = frozenset(requirement.attribute for requirement in requirements)
+        self.constraints = tuple(
+            requirement
+            for requirement in requirements
+            if requirement.rawvalue is not None or requirement.not_null is not None
+        )
+
+    def is_satisfied_by(
+        self, disclosed_ids: set[str], attributes: Sequence[DisclosedAttribute]
+    ) -> bool:
+        if not self.attributes <= disclosed_ids:
+            return False
+        if not self.constraints:
+            return True
+
+        index: dict[str, list[DisclosedAttribute]] = {}
+        for attribute in attributes:
+            index.setdefault(attribute.id, []).append(attribute)
+        return all(
+            any(requirement.satisfied_by(attribute) for attribute in index[requirement.attribute])
+            for requirement in self.constraints
+        )
+
+
+class CompiledConDisCon:
+    """A ConDisCon compiled to efficiently check disclosures against.
+
+    Compile a ConDisCon once and reuse it, instead of passing the ConDisCon itself to
+    `satisfies_condiscon`. Checking which attributes are disclosed is a single set
+    comparison per conjunction. Only attributes with a constraint on their value are
+    compared with the disclosed attributes one by one.
+    """
+
+    __slots__ = ("condiscon", "disjunctions")
+
+    def __init__(self, condiscon: Sequence[Sequence[Sequence[Attribute | AttributeValue]]]):
+        self.condiscon = condiscon
+        self.disjunctions = tuple(
+            tuple(_CompiledConjunction(conjunction) for conjunction in disjunction)
+            for disjunction in condiscon
+        )
+
+    def is_satisfied_by(self, disclosed: Sequence[Sequence[DisclosedAttribute]]) -> bool:
+        """Return whether the disclosed attributes satisfy this ConDisCon.
+
+        Each disjunction must be satisfied by the element of `disclosed` at the same
+        index, and there may not be any additional elements.
+        """
+        if len(disclosed) != len(self.disjunctions):
+            return False
+
+        for disjunction, attributes in zip(self.disjunctions, disclosed):
+            disclosed_ids = {attribute.id for attribute in attributes}
+            if not any(
+                conjunction.is_satisfied_by(disclosed_ids, attributes)
+                for conjunction in disjunction
+            ):
+                return False
+
+        return True
@@ -0,0 +1,127 @@
+import asyncio
+import logging
+import multiprocessing
+import time
+from collections.abc import Callable
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
+from typing import Any, TypeVar
+
+import jwt
+
+from app.config import JWTWorkerSettings, settings
+from app.metrics import JWT_DURATION, JWT_PENDING, JWT_REJECTED, JWT_WAIT_DURATION
+from app.timing import timed
+from app.yivi.models import (
+    _BaseSessionRequestJWT,
+    _BaseSessionResultJWT,
+    decode_session_result_jwt,
+    sign_session_request_claims,
+)
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T", bound=_BaseSessionResultJWT)
+
+
+class JWTServiceOverloadedError(Exception):
+    """Raised when too many JWT operations are already queued or running."""
+
+
+def _timed_call(func: Callable[..., Any], *args: Any) -> tuple[Any, float]:
+    """Call `func` and return its result together with the time it took to run."""
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+
+class JWTService:
+    """Performs JWT signing and verification in a bounded pool of workers.
+
+    RSA verification of session result JWTs is too expensive to do on the event loop,
+    which would stall all other requests handled by the same worker. Instead, operations
+    are run in a thread or process pool. If more than `max_pending` operations are
+    queued or running, new operations are rejected with a `JWTServiceOverloadedError`.
+
+    The pool is made with `make_executor` on first use, and again after `shutdown`.
+    """
+
+    def __init__(self, make_executor: Callable[[], Executor], max_pending: int):
+        self._make_executor = make_executor
+        self._executor: Executor | None = None
+        self._max_pending = max_pending
+        self._pending = 0
+
+    @classmethod
+    def from_settings(cls, worker_settings: JWTWorkerSettings) -> "JWTService":
+        make_executor: Callable[[], Executor]
+        if worker_settings.executor == "process":
+            make_executor = partial(
+                ProcessPoolExecutor,
+                max_workers=worker_settings.max_workers,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        else:
+            make_executor = partial(
+                ThreadPoolExecutor,
+                max_workers=worker_settings.max_workers,
+                thread_name_prefix="jwt",
+            )
+        return cls(make_executor, worker_settings.max_pending)
+
+    @property
+    def pending(self) -> int:
+        """Number of operations that are currently queued or running."""
+        return self._pending
+
+    async def _run(self, operation: str, func: Callable[..., Any], *args: Any) -> Any:
+        if self._pending >= self._max_pending:
+            JWT_REJECTED.labels(operation).inc()
+            raise JWTServiceOverloadedError(f"Too many pending JWT operations ({self._pending})")
+
+        if self._executor is None:
+            self._executor = self._make_executor()
+        self._pending += 1
+        JWT_PENDING.inc()
+        start = time.perf_counter()
+        try:
+            with timed("jwt"):
+                result, run_time = await asyncio.get_running_loop().run_in_executor(
+                    self._executor, _timed_call, func, *args
+                )
+        finally:
+            self._pending -= 1
+            JWT_PENDING.dec()
+
+        wait_time = time.perf_counter() - start - run_time
+        JWT_DURATION.labels(operation).observe(run_time)
+        JWT_WAIT_DURATION.labels(operation).observe(wait_time)
+        return result
+
+    async def sign(self, request: _BaseSessionRequestJWT) -> str:
+        """Sign a session request JWT."""
+        return await self._run("sign", sign_session_request_claims, request.claims())
+
+    async def parse_session_result(self, result_type: type[T], raw_result: str) -> T:
+        """Parse and verify a session result JWT, like `result_type.parse_jwt`.
+
+        :raises jwt.InvalidTokenError: If the input is not a valid JWT.
+        :raises pydantic.ValidationError: If the input is not a valid session result.
+        :raises JWTServiceOverloadedError: If too many operations are pending.
+        """
+        try:
+            result_dict = await self._run("verify", decode_session_result_jwt, raw_result)
+        except jwt.InvalidTokenError:
+            logger.debug("Invalid JWT", exc_info=True)
+            raise
+
+        return result_type.from_claims(result_dict)
+
+    def shutdown(self) -> None:
+        """Stop the pool. It is made again if the service is used afterwards."""
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+jwt_service = JWTService.from_settings(settings.jwt_workers)
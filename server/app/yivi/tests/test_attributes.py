@@ -0,0 +1,89 @@
+import pytest
+from pydantic import ValidationError
+
+from app.exchanges.models import CreateExchangeRequest
+from app.yivi.attributes import AttributeRegistry, attribute_registry
+from app.yivi.models import DisclosureRequest
+
+
+def test_get():
+    registry = AttributeRegistry()
+    registry.register(["pbdf.gemeente.address.street"])
+
+    info = registry.get("pbdf.gemeente.address.street")
+
+    assert info.credential == "pbdf.gemeente.address"
+    assert info.name == "street"
+    assert registry.get("pbdf.gemeente.address.street") is info
+    with pytest.raises(ValueError, match="Invalid attribute ID"):
+        registry.get("pbdf.gemeente.address")
+
+
+def test_validate():
+    registry = AttributeRegistry()
+    registry.register(["pbdf.gemeente.address.street"])
+    street = "".join(["pbdf.gemeente.address.", "street"])
+
+    assert registry.validate(street) is registry.intern("pbdf.gemeente.address.street")
+    assert registry.validate("pbdf.gemeente.address.city") == "pbdf.gemeente.address.city"
+    for invalid in ["pbdf.gemeente.address", "pbdf.gemeente.address.city\n"]:
+        with pytest.raises(ValueError, match="Invalid attribute ID"):
+            registry.validate(invalid)
+    assert len(registry) == 1
+
+
+def test_intern():
+    registry = AttributeRegistry()
+    registry.register(["pbdf.gemeente.address.street"])
+    first = "".join(["pbdf.gemeente.address.", "street"])
+    second = "".join(["pbdf.gemeente.address.", "street"])
+    assert first is not second
+
+    assert registry.intern(first) is registry.intern(second)
+
+
+def test_unknown_ids_are_not_kept():
+    registry = AttributeRegistry()
+    registry.register(["pbdf.gemeente.address.street"])
+
+    assert registry.credential("pbdf.gemeente.address.city") == "pbdf.gemeente.address"
+    assert registry.intern("pbdf.gemeente.address.city") == "pbdf.gemeente.address.city"
+    assert len(registry) == 1
+
+
+def test_allowlist():
+    registry = AttributeRegistry(allowlist=["pbdf.gemeente.address", "pbdf.sidn-pbdf.email.email"])
+
+    assert registry.is_allowed("pbdf.gemeente.address.street")
+    assert registry.is_allowed("pbdf.sidn-pbdf.email.email")
+    assert not registry.is_allowed("pbdf.sidn-pbdf.mobilenumber.mobilenumber")
+    with pytest.raises(ValueError, match="not allowed"):
+        registry.check_allowed("pbdf.sidn-pbdf.mobilenumber.mobilenumber")
+    assert AttributeRegistry().is_allowed("pbdf.sidn-pbdf.mobilenumber.mobilenumber")
+
+
+def test_models_share_attribute_ids():
+    first = DisclosureRequest.model_validate_json(
+        '{"disclose": [[["pbdf.gemeente.address.city"]]]}'
+    )
+    second = DisclosureRequest.model_validate_json(
+        '{"disclose": [[["pbdf.gemeente.address.city"]]]}'
+    )
+
+    assert first.disclose[0][0][0] is second.disclose[0][0][0]
+
+
+def test_create_exchange_request_allowlist(monkeypatch):
+    monkeypatch.setattr(attribute_registry, "_allowlist", frozenset(["pbdf.gemeente.address"]))
+
+    CreateExchangeRequest(
+        send_email=False,
+        attributes=["pbdf.gemeente.address.city"],
+        public_initiator_attributes=["pbdf.gemeente.address.street"],
+    )
+    with pytest.raises(ValidationError, match="not allowed"):
+        CreateExchangeRequest(
+            send_email=False,
+            attributes=["pbdf.sidn-pbdf.mobilenumber.mobilenumber"],
+            public_initiator_attributes=["pbdf.gemeente.address.street"],
+        )
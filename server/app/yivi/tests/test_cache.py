@@ -0,0 +1,88 @@
+from datetime import UTC, datetime, timedelta
+
+import pytest
+from fakeredis import FakeAsyncRedis
+
+from app.yivi.cache import RequestJWTCache, fingerprint
+from app.yivi.models import DisclosureRequest, DisclosureRequestJWT, ExtendedDisclosureRequest
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+def _build_request(iat: datetime | None = None) -> DisclosureRequestJWT:
+    return DisclosureRequestJWT(
+        iat=iat or datetime.now(UTC),
+        sprequest=ExtendedDisclosureRequest(
+            request=DisclosureRequest(disclose=[[["pbdf.sidn-pbdf.email.email"]]]),
+        ),
+    )
+
+
+def test_fingerprint():
+    assert fingerprint([[["a.b.c.d"]]], None) == fingerprint([[["a.b.c.d"]]], None)
+    assert fingerprint([[["a.b.c.d"]]], None) != fingerprint([[["a.b.c.d"]]], 60)
+    assert fingerprint([[["a.b.c.d"]]]) != fingerprint([[["a.b.c.e"]]])
+
+
+@pytest.mark.anyio
+async def test_reuse_signed_jwt():
+    cache = RequestJWTCache(max_entries=10, ttl=150)
+    builds = 0
+
+    def build_request():
+        nonlocal builds
+        builds += 1
+        return _build_request()
+
+    first = await cache.get_or_sign("foo", build_request)
+    second = await cache.get_or_sign("foo", build_request)
+    other = await cache.get_or_sign("bar", build_request)
+
+    assert first == second
+    assert builds == 2
+    assert other is not None
+
+
+@pytest.mark.anyio
+async def test_expire_based_on_iat():
+    cache = RequestJWTCache(max_entries=10, ttl=150)
+
+    old = await cache.get_or_sign(
+        "foo", lambda: _build_request(iat=datetime.now(UTC) - timedelta(seconds=151))
+    )
+    new = await cache.get_or_sign("foo", _build_request)
+
+    assert old != new
+
+
+@pytest.mark.anyio
+async def test_lru_eviction():
+    cache = RequestJWTCache(max_entries=2, ttl=150)
+
+    first = await cache.get_or_sign("first", _build_request)
+    await cache.get_or_sign("second", _build_request)
+    # Use the first entry, so that the second one is evicted instead.
+    assert await cache.get_or_sign("first", _build_request) == first
+    await cache.get_or_sign("third", _build_request)
+
+    assert cache._get_local("first") == first
+    assert cache._get_local("second") is None
+    assert cache._get_local("third") is not None
+
+
+@pytest.mark.anyio
+async def test_shared_through_redis():
+    async with FakeAsyncRedis() as redis:
+        worker_a = RequestJWTCache(max_entries=10, ttl=150)
+        worker_b = RequestJWTCache(max_entries=10, ttl=150)
+
+        token = await worker_a.get_or_sign("foo", _build_request, redis=redis)
+
+        def fail():
+            raise AssertionError("Should not sign again")
+
+        assert await worker_b.get_or_sign("foo", fail, redis=redis) == token
+        assert 0 < await redis.ttl("request_jwt:foo") <= 150
@@ -0,0 +1,135 @@
+import os
+from datetime import UTC, datetime
+
+import jwt
+import pytest
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+
+from app.config import IRMAServerPublicKey
+from app.yivi import models
+from app.yivi.keys import KeyProvider
+from app.yivi.models import decode_session_result_jwt
+
+
+def _generate_key_pair() -> tuple[rsa.RSAPrivateKey, bytes]:
+    private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    public_pem = private_key.public_key().public_bytes(
+        encoding=serialization.Encoding.PEM,
+        format=serialization.PublicFormat.SubjectPublicKeyInfo,
+    )
+    return private_key, public_pem
+
+
+_private_key_a, _public_pem_a = _generate_key_pair()
+_private_key_b, _public_pem_b = _generate_key_pair()
+
+
+def _token(
+    private_key: rsa.RSAPrivateKey, issuer: str = "irmaserver", exp: float | None = None, **headers
+) -> str:
+    claims = {"iss": issuer, "iat": int(datetime.now(UTC).timestamp())}
+    if exp is not None:
+        claims["exp"] = int(exp)
+    return jwt.encode(claims, private_key, algorithm="RS256", headers=headers or None)
+
+
+def _verifies(monkeypatch, provider: KeyProvider, token: str) -> bool:
+    """Check whether `decode_session_result_jwt` accepts a token with the given keys."""
+    monkeypatch.setattr(models, "key_provider", provider)
+    try:
+        decode_session_result_jwt(token)
+    except jwt.InvalidSignatureError:
+        return False
+    return True
+
+
+def test_keys_are_parsed_once():
+    provider = KeyProvider([IRMAServerPublicKey(key=_public_pem_a)])
+    assert provider.keys[0].key is provider.keys[0].key
+
+
+def test_multiple_keys_for_rotation(monkeypatch):
+    provider = KeyProvider(
+        [IRMAServerPublicKey(key=_public_pem_a), IRMAServerPublicKey(key=_public_pem_b)]
+    )
+    assert _verifies(monkeypatch, provider, _token(_private_key_a))
+    assert _verifies(monkeypatch, provider, _token(_private_key_b))
+
+    other_private_key, _ = _generate_key_pair()
+    assert not _verifies(monkeypatch, provider, _token(other_private_key))
+
+
+def test_leeway_for_clock_differences(monkeypatch):
+    provider = KeyProvider([IRMAServerPublicKey(key=_public_pem_a)])
+    now = datetime.now(UTC).timestamp()
+    assert _verifies(monkeypatch, provider, _token(_private_key_a, exp=now - 2))
+    with pytest.raises(jwt.ExpiredSignatureError):
+        _verifies(monkeypatch, provider, _token(_private_key_a, exp=now - 30))
+
+
+def test_no_matching_key(monkeypatch):
+    provider = KeyProvider([IRMAServerPublicKey(key=_public_pem_a, key_id="a")])
+    monkeypatch.setattr(models, "key_provider", provider)
+    with pytest.raises(jwt.InvalidSignatureError, match="Signature verification failed"):
+        decode_session_result_jwt(_token(_private_key_b, kid="b"))
+
+
+def test_key_selection_by_key_id():
+    provider = KeyProvider(
+        [
+            IRMAServerPublicKey(key=_public_pem_a, key_id="a"),
+            IRMAServerPublicKey(key=_public_pem_b, key_id="b"),
+        ]
+    )
+    candidates = provider.candidate_keys(_token(_private_key_b, kid="b"))
+    assert candidates[0].key_id == "b"
+
+
+def test_key_selection_by_issuer(monkeypatch):
+    provider = KeyProvider(
+        [
+            IRMAServerPublicKey(key=_public_pem_a, issuer="server-a"),
+            IRMAServerPublicKey(key=_public_pem_b, issuer="server-b"),
+        ]
+    )
+    assert [key.issuer for key in provider.candidate_keys(_token(_private_key_a, "server-a"))] == [
+        "server-a"
+    ]
+    assert _verifies(monkeypatch, provider, _token(_private_key_b, "server-b"))
+
+    # A key that is trusted for another issuer is not accepted.
+    assert not _verifies(monkeypatch, provider, _token(_private_key_a, "server-b"))
+
+
+def test_reload_changed_key_file(monkeypatch, tmp_path):
+    key_file = tmp_path / "irmaserver.pem"
+    key_file.write_bytes(_public_pem_a)
+
+    provider = KeyProvider([IRMAServerPublicKey(key_file=key_file)], reload_interval=0)
+    assert _verifies(monkeypatch, provider, _token(_private_key_a))
+
+    key_file.write_bytes(_public_pem_b)
+    # Make sure the modification time differs even on filesystems with coarse timestamps.
+    stat = key_file.stat()
+    os.utime(key_file, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+
+    assert _verifies(monkeypatch, provider, _token(_private_key_b))
+    assert not _verifies(monkeypatch, provider, _token(_private_key_a))
+
+
+def test_keep_old_key_if_reload_fails(monkeypatch, tmp_path):
+    key_file = tmp_path / "irmaserver.pem"
+    key_file.write_bytes(_public_pem_a)
+
+    provider = KeyProvider([IRMAServerPublicKey(key_file=key_file)], reload_interval=0)
+    key_file.write_bytes(b"not a key")
+    stat = key_file.stat()
+    os.utime(key_file, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+
+    assert _verifies(monkeypatch, provider, _token(_private_key_a))
+
+
+def test_invalid_key_config():
+    with pytest.raises(ValueError, match="exactly one of key and key_file"):
+        IRMAServerPublicKey()
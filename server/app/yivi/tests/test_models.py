@@ -4,10 +4,13 @@ from app.yivi.models import (
     Attribute,
     AttributeProofStatus,
     AttributeValue,
+    CompiledConDisCon,
     DisclosedAttribute,
     DisclosureSessionResultJWT,
     ProofStatus,
     SessionStatus,
+    TranslatedString,
+    compact_translations,
 )
 
 _issuance_time = datetime.fromtimestamp(1720051200, tz=UTC)
@@ -186,3 +189,51 @@ def test_disclosure_result_satisfies():
             [firstnames],
         ],
     ).satisfies_condiscon(condiscon)
+
+
+def test_compiled_condiscon():
+    condiscon = CompiledConDisCon(
+        [
+            [["pbdf.gemeente.address.houseNumber", "pbdf.gemeente.address.street"]],
+            [
+                [AttributeValue(type="pbdf.gemeente.address.city", value="Nijmegen")],
+                [AttributeValue(type="pbdf.gemeente.address.zipcode", notNull=False)],
+            ],
+        ]
+    )
+
+    def attribute(id: str, rawvalue: str | None) -> DisclosedAttribute:
+        return DisclosedAttribute(
+            rawvalue=rawvalue,
+            value=TranslatedString(default=rawvalue or "", en=rawvalue or "", nl=rawvalue or ""),
+            id=id,
+            status=AttributeProofStatus.PRESENT if rawvalue else AttributeProofStatus.NULL,
+            issuancetime=_issuance_time,
+        )
+
+    housenumber = attribute("pbdf.gemeente.address.houseNumber", "1")
+    street = attribute("pbdf.gemeente.address.street", "Foo Avenue")
+    city = attribute("pbdf.gemeente.address.city", "Nijmegen")
+    other_city = attribute("pbdf.gemeente.address.city", "Arnhem")
+    zipcode = attribute("pbdf.gemeente.address.zipcode", None)
+
+    assert condiscon.is_satisfied_by([[housenumber, street], [city]])
+    assert condiscon.is_satisfied_by([[street, housenumber], [zipcode]])
+    assert not condiscon.is_satisfied_by([[housenumber], [city]])
+    assert not condiscon.is_satisfied_by([[housenumber, street], [other_city]])
+    assert not condiscon.is_satisfied_by([[housenumber, street]])
+    # Any of multiple disclosed values for the same attribute may satisfy a requirement.
+    assert condiscon.is_satisfied_by([[housenumber, street], [other_city, city]])
+
+
+def test_compact_translations():
+    same = TranslatedString(default="foo", nl="foo", en="foo")
+    different = TranslatedString(default="1 jan", nl="1 jan", en="Jan 1")
+
+    # The default serialization has all translations.
+    assert same.model_dump(by_alias=True) == {"": "foo", "nl": "foo", "en": "foo"}
+    assert compact_translations(same.model_dump(by_alias=True)) == "foo"
+    assert compact_translations({"values": [same.model_dump(), different.model_dump(), None]}) == {
+        "values": ["foo", different.model_dump(), None]
+    }
+    assert TranslatedString.model_validate("foo") == same
@@ -0,0 +1,110 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+import jwt
+import pytest
+from prometheus_client import REGISTRY
+
+from app.config import JWTWorkerSettings, settings
+from app.yivi.models import (
+    DisclosureRequest,
+    DisclosureRequestJWT,
+    DisclosureSessionResultJWT,
+    ExtendedDisclosureRequest,
+)
+from app.yivi.service import JWTService, JWTServiceOverloadedError
+
+_request = DisclosureRequestJWT(
+    sprequest=ExtendedDisclosureRequest(
+        request=DisclosureRequest(disclose=[[["pbdf.sidn-pbdf.email.email"]]]),
+    ),
+)
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+def _value(name: str, operation: str) -> float:
+    return REGISTRY.get_sample_value(name, {"operation": operation}) or 0.0
+
+
+@pytest.mark.anyio
+async def test_sign():
+    service = JWTService(partial(ThreadPoolExecutor, max_workers=1), max_pending=1)
+    count = _value("diyivi_jwt_duration_seconds_count", "sign")
+    run_time = _value("diyivi_jwt_duration_seconds_sum", "sign")
+
+    signed = await service.sign(_request)
+
+    assert signed == _request.signed_jwt()
+    assert _value("diyivi_jwt_duration_seconds_count", "sign") == count + 1
+    assert _value("diyivi_jwt_duration_seconds_sum", "sign") > run_time
+    assert service.pending == 0
+
+
+@pytest.mark.anyio
+async def test_sign_in_process_pool():
+    service = JWTService.from_settings(JWTWorkerSettings(executor="process", max_workers=1))
+    try:
+        signed = await service.sign(_request)
+    finally:
+        service.shutdown()
+
+    claims = jwt.decode(
+        signed,
+        key=settings.irma.session_request_secret_key.get_secret_value(),
+        algorithms=["HS256"],
+    )
+    assert DisclosureRequestJWT.model_validate(claims).sprequest == _request.sprequest
+
+
+@pytest.mark.anyio
+async def test_sign_after_shutdown():
+    service = JWTService(partial(ThreadPoolExecutor, max_workers=1), max_pending=1)
+    await service.sign(_request)
+    service.shutdown()
+
+    assert await service.sign(_request) == _request.signed_jwt()
+    service.shutdown()
+
+
+@pytest.mark.anyio
+async def test_invalid_jwt():
+    service = JWTService(partial(ThreadPoolExecutor, max_workers=1), max_pending=1)
+    count = _value("diyivi_jwt_duration_seconds_count", "verify")
+
+    with pytest.raises(jwt.DecodeError):
+        await service.parse_session_result(DisclosureSessionResultJWT, "dummy")
+
+    assert _value("diyivi_jwt_duration_seconds_count", "verify") == count
+    assert service.pending == 0
+
+
+@pytest.mark.anyio
+async def test_reject_when_overloaded():
+    service = JWTService(partial(ThreadPoolExecutor, max_workers=1), max_pending=2)
+    release = threading.Event()
+    count = _value("diyivi_jwt_duration_seconds_count", "sign")
+    rejected = _value("diyivi_jwt_rejected_total", "sign")
+
+    blocking = [
+        asyncio.create_task(service._run("sign", release.wait)),
+        asyncio.create_task(service._run("sign", release.wait)),
+    ]
+    await asyncio.sleep(0)
+    assert service.pending == 2
+
+    with pytest.raises(JWTServiceOverloadedError):
+        await service.sign(_request)
+    assert _value("diyivi_jwt_rejected_total", "sign") == rejected + 1
+
+    release.set()
+    await asyncio.gather(*blocking)
+
+    assert _value("diyivi_jwt_duration_seconds_count", "sign") == count + 2
+    assert service.pending == 0
+    assert await service.sign(_request)
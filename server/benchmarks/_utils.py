@@ -0,0 +1,114 @@
+"""Helpers for the micro-benchmarks in this package.
+
+The benchmarks are plain scripts, run from the `server` directory, for example:
+
+    uv run python -m benchmarks.jwt_verify
+"""
+
+import asyncio
+import time
+from collections.abc import Awaitable, Callable, Iterable, Mapping
+from datetime import UTC, datetime, timedelta
+from typing import Any
+
+from app.exchanges.models import DisclosedValue, Exchange, ExchangeReply, ExchangeType
+from app.yivi.models import TranslatedString
+
+ATTRIBUTE_VALUES = {
+    "pbdf.gemeente.personalData.fullname": "Foo Bar",
+    "pbdf.gemeente.personalData.dateofbirth": "01-01-2000",
+    "pbdf.sidn-pbdf.email.email": "foo@example.com",
+    "pbdf.sidn-pbdf.mobilenumber.mobilenumber": "31612345678",
+    "pbdf.gemeente.address.street": "Toernooiveld",
+    "pbdf.gemeente.address.houseNumber": "212",
+    "pbdf.gemeente.address.zipcode": "6525 EC",
+    "pbdf.gemeente.address.city": "Nijmegen",
+}
+"""Realistic values of the attributes that exchanges ask for, by attribute ID."""
+
+
+def report(name: str, seconds: float, number: int) -> None:
+    """Print the throughput and mean latency of a benchmark."""
+    print(  # noqa: T201
+        f"{name:<50} {number / seconds:>12,.0f} ops/s {seconds / number * 1e6:>10,.1f} us/op"
+    )
+
+
+def bench(name: str, func: Callable[[], object], number: int = 1000) -> float:
+    """Run `func` `number` times after a short warmup, and report the results."""
+    for _ in range(min(number, 10)):
+        func()
+
+    start = time.perf_counter()
+    for _ in range(number):
+        func()
+    seconds = time.perf_counter() - start
+
+    report(name, seconds, number)
+    return seconds
+
+
+def bench_async(name: str, func: Callable[[], Awaitable[object]], number: int = 1000) -> float:
+    """Run the coroutine function `func` `number` times, and report the results."""
+
+    async def run() -> float:
+        for _ in range(min(number, 10)):
+            await func()
+
+        start = time.perf_counter()
+        for _ in range(number):
+            await func()
+        return time.perf_counter() - start
+
+    seconds = asyncio.run(run())
+    report(name, seconds, number)
+    return seconds
+
+
+def disclosed_values(values: Mapping[str, str]) -> list[DisclosedValue]:
+    """Make disclosed values, which are the same in every language."""
+    return [
+        DisclosedValue(id=id, value=TranslatedString(default=value, en=value, nl=value))
+        for id, value in values.items()
+    ]
+
+
+def make_exchange(
+    type: ExchangeType = ExchangeType.ONE_TO_ONE,
+    attributes: Iterable[str] = ATTRIBUTE_VALUES,
+    disclosed: bool = False,
+    **fields: Any,
+) -> Exchange:
+    """Make an exchange of `attributes`, which expires in 10 minutes.
+
+    If `disclosed`, the initiator has disclosed the same attributes already, and shares the
+    first three of them.
+    """
+    attributes = list(attributes)
+    if disclosed:
+        values = disclosed_values({id: ATTRIBUTE_VALUES[id] for id in attributes})
+        fields = {
+            "send_email": True,
+            "initiator_email_value": "foo@example.com",
+            "public_initiator_attributes": attributes[:3],
+            "initiator_attribute_values": values,
+            "public_initiator_attribute_values": values[:3],
+            **fields,
+        }
+    return Exchange(
+        **{
+            "type": type,
+            "send_email": False,
+            "attributes": attributes,
+            "public_initiator_attributes": ["pbdf.sidn-pbdf.mobilenumber.mobilenumber"],
+            "expire_at": datetime.now(UTC) + timedelta(seconds=600),
+            **fields,
+        }
+    )
+
+
+def make_reply(exchange: Exchange, values: Mapping[str, str] | None = None) -> ExchangeReply:
+    """Make a reply to `exchange`, disclosing `values` or else the usual attribute values."""
+    if values is None:
+        values = {id: ATTRIBUTE_VALUES[id] for id in exchange.attributes}
+    return ExchangeReply(exchange_id=exchange.id, attribute_values=disclosed_values(values))
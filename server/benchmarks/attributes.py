@@ -0,0 +1,62 @@
+"""Compare validating attribute IDs with only their pattern and through the registry.
+
+Through the registry, equal attribute IDs are the same object, which makes comparing the
+disclosed attributes with a compiled ConDisCon cheaper.
+"""
+
+import json
+from typing import Annotated
+
+from pydantic import Field, TypeAdapter
+
+from app.utils import compile_condiscon
+from app.yivi.attributes import ATTRIBUTE_PATTERN, attribute_registry
+from app.yivi.models import Attribute
+
+from ._utils import bench
+
+_attributes = [
+    "pbdf.gemeente.personalData.fullname",
+    "pbdf.gemeente.personalData.dateofbirth",
+    "pbdf.sidn-pbdf.email.email",
+    "pbdf.sidn-pbdf.mobilenumber.mobilenumber",
+    "pbdf.gemeente.address.street",
+    "pbdf.gemeente.address.houseNumber",
+    "pbdf.gemeente.address.zipcode",
+    "pbdf.gemeente.address.city",
+]
+
+# Known attributes are registered at startup, for example by the templates.
+attribute_registry.register(_attributes)
+
+_data = json.dumps(_attributes * 100)
+
+_pattern_only = TypeAdapter(list[Annotated[str, Field(pattern=ATTRIBUTE_PATTERN)]])
+_registry = TypeAdapter(list[Attribute])
+
+
+def main() -> None:
+    bench("pattern only: validate 800 IDs", lambda: _pattern_only.validate_json(_data))
+    bench("registry: validate 800 IDs", lambda: _registry.validate_json(_data))
+    unregistered = json.dumps([f"{id}x" for id in _attributes] * 100)
+    bench(
+        "registry: validate 800 unregistered IDs",
+        lambda: _registry.validate_json(unregistered),
+    )
+
+    compiled = compile_condiscon(_attributes)
+    for name, adapter in (("pattern only", _pattern_only), ("registry", _registry)):
+        disclosed = [set(adapter.validate_json(json.dumps(_attributes)))] * 1000
+        bench(
+            f"{name}: compare 1000 disclosures",
+            lambda: [
+                conjunction.attributes <= ids
+                for ids in disclosed
+                for disjunction in compiled.disjunctions
+                for conjunction in disjunction
+            ],
+        )
+
+
+if __name__ == "__main__":
+    main()
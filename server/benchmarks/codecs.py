@@ -0,0 +1,21 @@
+"""Compare the size and speed of the codecs for records stored in Redis."""
+
+from app.codecs import CODECS
+
+from ._utils import bench, make_exchange, make_reply
+
+_exchange = make_exchange(disclosed=True)
+_reply = make_reply(_exchange)
+
+
+def main() -> None:
+    for model in (_exchange, _reply):
+        for codec in CODECS.values():
+            encoded = codec.encode(model)
+            name = f"{type(model).__name__} {codec.name} ({len(encoded)} bytes)"
+            bench(f"{name}: encode", lambda: codec.encode(model), 10_000)
+            bench(f"{name}: decode", lambda: codec.decode(type(model), encoded), 10_000)
+
+
+if __name__ == "__main__":
+    main()
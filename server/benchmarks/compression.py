@@ -0,0 +1,97 @@
+"""Compare sizes and speed with and without compression, for messages of different sizes.
+
+Messages are made of random words, which compresses worse than real text with its
+repeated phrases. Signatures contain large random numbers, which don't compress at all.
+"""
+
+import base64
+import random
+from datetime import UTC, datetime, timedelta
+
+from app.codecs import CODECS
+from app.config import settings
+from app.signatures.email import encode_signature_link_fragment
+from app.signatures.models import SignatureRequest
+from app.yivi.models import SignedMessage
+
+from ._utils import bench
+
+_random = random.Random(0)
+
+_words = (
+    "de het een en van ik te dat die in je niet is op voor met hij zijn ook als maar "
+    "afspraak overeenkomst ondertekenen betaling bedrag datum partij verklaart hierbij "
+    "akkoord voorwaarden huur woning maand euro uiterlijk termijn gegevens verstrekken"
+).split()
+
+# Sizes of messages to sign, from a short statement to the maximum of 64,000 characters.
+_sizes = [100, 1_000, 4_000, 16_000, 64_000]
+
+
+def _message(size: int) -> str:
+    words: list[str] = []
+    while sum(len(word) + 1 for word in words) < size:
+        words.append(_random.choice(_words))
+    return " ".join(words)[:size]
+
+
+def _number() -> str:
+    return base64.b64encode(_random.randbytes(256)).decode()
+
+
+def _signature(message: str) -> SignedMessage:
+    return SignedMessage.model_validate(
+        {
+            "@context": "https://irma.app/ld/signature/v2",
+            "signature": [
+                {"c": _number(), "A": _number(), "e_response": _number(), "v_response": _number()}
+                for _ in range(2)
+            ],
+            "indices": [[{"cred": 0, "attr": 2}]],
+            "nonce": _number()[:16],
+            "context": "AQ==",
+            "message": message,
+            "timestamp": {"Time": 1720051200, "ServerUrl": "https://irma.example.com"},
+        }
+    )
+
+
+def main() -> None:
+    codec = CODECS[settings.storage_codec]
+    for size in _sizes:
+        request = SignatureRequest(
+            message=_message(size),
+            attributes=["pbdf.gemeente.personalData.fullname"],
+            expire_at=datetime.now(UTC) + timedelta(days=7),
+        )
+        plain = codec.encode(request)
+        compressed = codec.encode(request, compress_above=0)
+        print(  # noqa: T201
+            f"{size:>6} chars: record {len(plain):>6} -> {len(compressed):>6} bytes", end=""
+        )
+
+        signature = _signature(request.message)
+        links = {}
+        for encoding in ("base64", "zlib"):
+            settings.signature_link_encoding = encoding  # type: ignore[assignment]
+            links[encoding] = encode_signature_link_fragment(signature)
+        print(  # noqa: T201
+            f", link {len(links['base64']):>6} -> {len(links['zlib']):>6} chars"
+        )
+
+        bench(f"{size} chars: encode", lambda: codec.encode(request), 2000)
+        bench(f"{size} chars: encode compressed", lambda: codec.encode(request, 0), 2000)
+        bench(
+            f"{size} chars: decode",
+            lambda: codec.decode(SignatureRequest, plain, trusted=True),
+            2000,
+        )
+        bench(
+            f"{size} chars: decode compressed",
+            lambda: codec.decode(SignatureRequest, compressed, trusted=True),
+            2000,
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+"""Load test for many concurrent responders to a single 1-to-many exchange.
+
+Uses the Redis server from the `REDIS_URL` setting if it is configured, and an in-process
+fake Redis otherwise. Numbers against the fake are only useful to compare storage code.
+"""
+
+import asyncio
+import statistics
+import time
+
+import redis.asyncio as redis
+from fakeredis import FakeAsyncRedis
+
+from app.config import settings
+from app.exchanges.dependencies import ExchangesStorage, PushReplyStatus
+from app.exchanges.models import ExchangeReply, ExchangeType
+
+from ._utils import make_exchange, make_reply, report
+
+
+async def _run(client: redis.Redis, responders: int) -> None:
+    storage = ExchangesStorage(client)
+    exchange = make_exchange(ExchangeType.ONE_TO_MANY, ["pbdf.sidn-pbdf.email.email"])
+    await storage.save_exchange(exchange)
+    replies = [make_reply(exchange) for _ in range(responders)]
+    latencies: list[float] = []
+
+    async def respond(reply: ExchangeReply) -> None:
+        start = time.perf_counter()
+        assert await storage.push_reply(exchange, reply) == PushReplyStatus.ACCEPTED
+        latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(respond(reply) for reply in replies))
+    seconds = time.perf_counter() - start
+
+    assert await storage.count_replies(exchange.id) == responders
+    report(f"{responders} concurrent responders: push_reply", seconds, responders)
+    quantiles = statistics.quantiles(latencies, n=100)
+    print(  # noqa: T201
+        f"{'':<50} p50 {quantiles[49] * 1e3:,.1f} ms, p99 {quantiles[98] * 1e3:,.1f} ms"
+    )
+
+    start = time.perf_counter()
+    for reply in replies:
+        assert await storage.get_reply_by_secret(exchange.id, reply.recipient_secret)
+    report(f"{responders} replies: get_reply_by_secret", time.perf_counter() - start, responders)
+
+    await storage.delete_exchange(exchange.id)
+
+
+def main() -> None:
+    for responders in (100, 1000, 5000):
+        if settings.redis_url:
+            client = redis.Redis.from_url(settings.redis_url)
+        else:
+            client = FakeAsyncRedis(max_connections=responders)
+        asyncio.run(_run(client, responders))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""Compare checking large disclosures against a ConDisCon and a compiled ConDisCon."""
+
+from datetime import UTC, datetime
+
+from app.utils import ConDisCon, _compile_condiscon, compile_condiscon, create_condiscon
+from app.yivi.models import (
+    AttributeProofStatus,
+    CompiledConDisCon,
+    DisclosedAttribute,
+    DisclosureSessionResultJWT,
+    ProofStatus,
+    SessionStatus,
+    TranslatedString,
+)
+
+from ._utils import bench
+
+
+def _satisfies_uncompiled(result: DisclosureSessionResultJWT, condiscon: ConDisCon) -> bool:
+    """Check the result like before ConDisCons were compiled, for comparison."""
+    return len(result.disclosed) == len(condiscon) and all(
+        any(
+            all(
+                any(attribute.satisfies(required) for attribute in disclosed)
+                for required in conjunction
+            )
+            for conjunction in disjunction
+        )
+        for disjunction, disclosed in zip(condiscon, result.disclosed)
+    )
+
+
+def _result(condiscon: ConDisCon) -> DisclosureSessionResultJWT:
+    return DisclosureSessionResultJWT(
+        iss="irmaserver",
+        iat=datetime.now(UTC),
+        exp=datetime.now(UTC),
+        sub="disclosing_result",
+        type="disclosing",
+        status=SessionStatus.DONE,
+        token="1234567890",
+        proofStatus=ProofStatus.VALID,
+        disclosed=[
+            [
+                DisclosedAttribute(
+                    id=attribute,
+                    rawvalue="value",
+                    value=TranslatedString(default="value", en="value", nl="value"),
+                    status=AttributeProofStatus.PRESENT,
+                    issuancetime=datetime.now(UTC),
+                )
+                # Disclosed in the reverse order, as the order within a conjunction may differ.
+                for attribute in reversed(disjunction[0])
+            ]
+            for disjunction in condiscon
+        ],
+    )
+
+
+def main() -> None:
+    scenarios = {
+        "60 attributes of 1 credential": [f"irma-demo.issuer.credential.a{i}" for i in range(60)],
+        "60 attributes of 12 credentials": [
+            f"irma-demo.issuer.credential{i // 5}.a{i}" for i in range(60)
+        ],
+        "200 attributes of 20 credentials": [
+            f"irma-demo.issuer.credential{i // 10}.a{i}" for i in range(200)
+        ],
+    }
+
+    for name, attributes in scenarios.items():
+        condiscon = create_condiscon(attributes)
+        result = _result(condiscon)
+        compiled = CompiledConDisCon(condiscon)
+        assert result.satisfies_condiscon(condiscon)
+        assert result.satisfies_condiscon(compiled)
+
+        bench(f"{name}: check uncompiled", lambda: _satisfies_uncompiled(result, condiscon))
+        bench(f"{name}: compile", lambda: CompiledConDisCon(condiscon))
+        bench(
+            f"{name}: create_condiscon uncached",
+            lambda: _compile_condiscon.__wrapped__(tuple(attributes)),
+        )
+        bench(f"{name}: create_condiscon cached", lambda: create_condiscon(attributes))
+        bench(f"{name}: check compiled", lambda: result.satisfies_condiscon(compiled))
+        bench(
+            f"{name}: check cached compile_condiscon",
+            lambda: result.satisfies_condiscon(compile_condiscon(attributes)),
+        )
+
+
+if __name__ == "__main__":
+    main()
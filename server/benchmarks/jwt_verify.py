@@ -0,0 +1,97 @@
+"""Compare session result JWT verification with a raw PEM key and with pre-parsed keys."""
+
+from datetime import UTC, datetime
+
+import jwt
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+
+from app.config import IRMAServerPublicKey
+from app.yivi import models
+from app.yivi.keys import KeyProvider
+from app.yivi.models import DisclosureSessionResultJWT
+
+from ._utils import bench
+
+
+def main() -> None:
+    private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    public_pem = private_key.public_key().public_bytes(
+        encoding=serialization.Encoding.PEM,
+        format=serialization.PublicFormat.SubjectPublicKeyInfo,
+    )
+    now = int(datetime.now(UTC).timestamp())
+    token = jwt.encode(
+        {
+            "exp": now + 3600,
+            "iat": now,
+            "iss": "irmaserver",
+            "sub": "disclosing_result",
+            "token": "559RWzTITedKce9uxIJw",
+            "status": "DONE",
+            "type": "disclosing",
+            "proofStatus": "VALID",
+            "disclosed": [
+                [
+                    {
+                        "rawvalue": "foo@example.com",
+                        "value": {"": "foo@example.com", "en": "foo@example.com", "nl": "foo"},
+                        "id": "pbdf.sidn-pbdf.email.email",
+                        "status": "PRESENT",
+                        "issuancetime": 1720051200,
+                    }
+                ]
+            ],
+        },
+        private_key,
+        algorithm="RS256",
+    )
+
+    number = 2000
+
+    bench(
+        "jwt.decode with PEM bytes",
+        lambda: jwt.decode(token, public_pem, algorithms=["RS256"], leeway=5),
+        number,
+    )
+    single_key = KeyProvider([IRMAServerPublicKey(key=public_pem)])
+    bench(
+        "jwt.decode with pre-parsed key",
+        lambda: jwt.decode(token, single_key.keys[0].key, algorithms=["RS256"], leeway=5),
+        number,
+    )
+
+    bench(
+        "parse_jwt with PEM bytes (before)",
+        lambda: DisclosureSessionResultJWT.model_validate(
+            jwt.decode(token, public_pem, algorithms=["RS256"], leeway=5)
+        ),
+        number,
+    )
+    models.key_provider = single_key
+    bench(
+        "parse_jwt with pre-parsed key (after)",
+        lambda: DisclosureSessionResultJWT.parse_jwt(token),
+        number,
+    )
+
+    other_pem = (
+        rsa.generate_private_key(public_exponent=65537, key_size=2048)
+        .public_key()
+        .public_bytes(
+            encoding=serialization.Encoding.PEM,
+            format=serialization.PublicFormat.SubjectPublicKeyInfo,
+        )
+    )
+    models.key_provider = KeyProvider(
+        [IRMAServerPublicKey(key=other_pem), IRMAServerPublicKey(key=public_pem)]
+    )
+    bench(
+        "parse_jwt during rotation, second key matches",
+        lambda: DisclosureSessionResultJWT.parse_jwt(token),
+        number,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""Throughput of the Redis email outbox and the mailer, against a local SMTP server.
+
+Emails are sent to an aiosmtpd stand-in server that accepts everything, so this measures
+the overhead of the outbox and the mailer, not that of a real mail relay. Uses the Redis
+server from the `REDIS_URL` setting if it is configured, and an in-process fake Redis
+otherwise.
+"""
+
+import asyncio
+import time
+
+import redis.asyncio as redis
+from aiosmtpd.controller import Controller
+from fakeredis import FakeAsyncRedis
+
+from app.config import MailerSettings, settings
+from app.mailer import EMAIL_STREAM, Mailer, RedisEmailOutbox
+from app.smtp import SMTPPool
+from app.tests.smtp_server import Handler, authenticate, free_port, smtp_message, smtp_settings
+
+from ._utils import report
+
+
+async def _run(client: redis.Redis, handler: Handler, emails: int, concurrency: int) -> None:
+    await client.delete(EMAIL_STREAM)
+    smtp = smtp_settings(handler, pool_size=concurrency)
+    mailer = Mailer(
+        client, SMTPPool(smtp), smtp, MailerSettings(concurrency=concurrency), "benchmark"
+    )
+    outbox = RedisEmailOutbox(client)
+    messages = [smtp_message(f"{i}@example.com") for i in range(emails)]
+
+    start = time.perf_counter()
+    for message in messages:
+        await outbox.put(message)
+    report(f"{emails} emails: enqueue", time.perf_counter() - start, emails)
+
+    handler.messages.clear()
+    stop = asyncio.Event()
+    start = time.perf_counter()
+    task = asyncio.create_task(mailer.run(stop))
+    while mailer.sent < emails:
+        await asyncio.sleep(0.001)
+    seconds = time.perf_counter() - start
+    stop.set()
+    await task
+
+    assert len(handler.messages) == emails
+    report(f"{emails} emails: send with concurrency {concurrency}", seconds, emails)
+
+
+def main() -> None:
+    handler = Handler()
+    handler.port = free_port()
+    controller = Controller(
+        handler,
+        hostname="127.0.0.1",
+        port=handler.port,
+        authenticator=authenticate,
+        auth_require_tls=False,
+    )
+    controller.start()
+    try:
+        for concurrency in (1, 4):
+            if settings.redis_url:
+                client = redis.Redis.from_url(settings.redis_url)
+            else:
+                client = FakeAsyncRedis()
+            asyncio.run(_run(client, handler, 2000, concurrency))
+    finally:
+        controller.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+"""Compare checking for replies by fetching all replies with LLEN and EXISTS."""
+
+import asyncio
+
+from fakeredis import FakeAsyncRedis
+
+from app.exchanges.dependencies import ExchangesStorage
+from app.exchanges.models import Exchange
+
+from ._utils import bench_async, make_exchange, make_reply
+
+
+async def _create_exchange(storage: ExchangesStorage, reply_count: int) -> Exchange:
+    exchange = make_exchange(
+        attributes=["pbdf.sidn-pbdf.email.email", "pbdf.gemeente.personalData.fullname"]
+    )
+    await storage.save_exchange(exchange)
+
+    reply = make_reply(exchange)
+    # Bypass the 1-to-1 check, to be able to create many replies.
+    await storage._redis.rpush(  # type: ignore
+        f"exchange_replies:{exchange.id}", *[reply.model_dump_json()] * reply_count
+    )
+    return exchange
+
+
+def main() -> None:
+    redis = FakeAsyncRedis()
+    storage = ExchangesStorage(redis)
+
+    for reply_count in (1, 100, 10_000):
+        exchange = asyncio.run(_create_exchange(storage, reply_count))
+        number = 20 if reply_count == 10_000 else 1000
+
+        async def via_get_replies():
+            assert await storage.get_exchange(exchange.id)
+            assert await storage.get_replies(exchange.id)
+
+        async def via_has_replies():
+            assert await storage.get_exchange(exchange.id)
+            assert await storage.has_replies(exchange.id)
+
+        async def via_get_exchange_with_reply_count():
+            assert (await storage.get_exchange_with_reply_count(exchange.id))[1]
+
+        bench_async(f"{reply_count} replies: get_exchange + get_replies", via_get_replies, number)
+        bench_async(f"{reply_count} replies: get_exchange + has_replies", via_has_replies, number)
+        bench_async(
+            f"{reply_count} replies: get_exchange_with_reply_count",
+            via_get_exchange_with_reply_count,
+            number,
+        )
+
+
+if __name__ == "__main__":
+    main()
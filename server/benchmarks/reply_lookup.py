@@ -0,0 +1,51 @@
+"""Compare finding a recipient's reply by scanning all replies and through the secret index.
+
+With the index, the latency should stay constant as the number of replies grows.
+"""
+
+import asyncio
+
+from fakeredis import FakeAsyncRedis
+
+from app.exchanges.dependencies import ExchangesStorage
+from app.exchanges.models import Exchange, ExchangeType
+
+from ._utils import bench_async, make_exchange, make_reply
+
+
+async def _create_exchange(storage: ExchangesStorage, reply_count: int) -> tuple[Exchange, str]:
+    exchange = make_exchange(
+        ExchangeType.ONE_TO_MANY,
+        ["pbdf.sidn-pbdf.email.email", "pbdf.gemeente.personalData.fullname"],
+    )
+    await storage.save_exchange(exchange)
+
+    for _ in range(reply_count):
+        await storage.push_reply(exchange, make_reply(exchange))
+
+    # Look up the reply in the middle, so that the scan has to decode half of the replies.
+    return exchange, (await storage.get_replies(exchange.id, reply_count // 2))[0].recipient_secret
+
+
+def main() -> None:
+    redis = FakeAsyncRedis()
+    storage = ExchangesStorage(redis)
+
+    for reply_count in (1, 100, 10_000):
+        exchange, secret = asyncio.run(_create_exchange(storage, reply_count))
+        number = 20 if reply_count == 10_000 else 1000
+
+        async def via_scan():
+            _, replies = await storage.get_exchange_with_replies(exchange.id)
+            assert next(reply for reply in replies if reply.recipient_secret == secret)
+
+        async def via_index():
+            _, own_reply, _ = await storage.get_exchange_result(exchange.id, secret)
+            assert own_reply is not None
+
+        bench_async(f"{reply_count} replies: get_exchange_with_replies + scan", via_scan, number)
+        bench_async(f"{reply_count} replies: get_exchange_result", via_index, number)
+
+
+if __name__ == "__main__":
+    main()
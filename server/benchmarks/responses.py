@@ -0,0 +1,116 @@
+"""Compare serializing the response of each endpoint by FastAPI and with `ModelResponse`.
+
+FastAPI validates the returned model against the response model, and serializes it to
+Python objects and then to JSON. How much of that is done depends on the version of
+FastAPI: older versions first dump the model to a dict, and validate that again.
+"""
+
+import inspect
+import secrets
+
+from fastapi.responses import JSONResponse, Response
+from fastapi.routing import serialize_response
+from pydantic import BaseModel
+
+from app.exchanges.api import router as exchanges_router
+from app.exchanges.models import (
+    DisclosedValue,
+    ExchangeResultResponse,
+    InitiatorExchangeResponse,
+    RecipientExchangeResponse,
+    RecipientResponseResponse,
+)
+from app.responses import ModelResponse, ModelRoute
+from app.signatures.api import router as signatures_router
+from app.signatures.models import RecipientSignatureRequestResponse, SignatureRequestResponse
+from app.yivi.models import TranslatedString
+
+from ._utils import bench_async
+
+_dump_json = "dump_json" in inspect.signature(serialize_response).parameters
+
+_jwt = secrets.token_urlsafe(600)
+
+_values = [
+    DisclosedValue(id=id, value=TranslatedString(default=value, en=value, nl=value))
+    for id, value in {
+        "pbdf.gemeente.personalData.fullname": "Foo Bar",
+        "pbdf.sidn-pbdf.email.email": "foo@example.com",
+        "pbdf.gemeente.personalData.dateofbirth": "1 januari 2000",
+    }.items()
+]
+_phone = [
+    DisclosedValue(
+        id="pbdf.sidn-pbdf.mobilenumber.mobilenumber",
+        value=TranslatedString(default="31612345678", en="31612345678", nl="31612345678"),
+    )
+]
+
+_responses: list[BaseModel] = [
+    InitiatorExchangeResponse(id="0" * 16, initiator_secret="0" * 32, request_jwt=_jwt),
+    RecipientExchangeResponse(
+        attributes=[value.id for value in _values],
+        public_initiator_attribute_values=_phone,
+        request_jwt=_jwt,
+    ),
+    RecipientResponseResponse(
+        public_initiator_attribute_values=_phone,
+        initiator_attribute_values=_values,
+        response_attribute_values=_values,
+        recipient_secret="0" * 32,
+    ),
+    ExchangeResultResponse(
+        public_initiator_attribute_values=_phone,
+        initiator_attribute_values=_values,
+        replies=[_values] * 100,
+        next_cursor=100,
+    ),
+    SignatureRequestResponse(id="0" * 16, request_jwt=_jwt),
+    RecipientSignatureRequestResponse(
+        attributes=[value.id for value in _values],
+        message="Ik ga akkoord met de voorwaarden. " * 30,
+        initiator_email_value="foo@example.com",
+        request_jwt=_jwt,
+    ),
+]
+
+
+def main() -> None:
+    routes = {
+        route.response_model: route
+        for route in exchanges_router.routes + signatures_router.routes
+        if isinstance(route, ModelRoute) and route.response_model is not None
+    }
+    for response in _responses:
+        route = routes[type(response)]
+
+        async def fastapi(response=response, route=route) -> Response:
+            if _dump_json:
+                # Newer versions serialize straight to JSON, without a custom response class.
+                content = await serialize_response(
+                    field=route.response_field, response_content=response, dump_json=True
+                )
+                return Response(content, media_type="application/json")
+            content = await serialize_response(
+                field=route.response_field, response_content=response
+            )
+            return JSONResponse(content)
+
+        async def fastapi_0_115(response=response, route=route) -> Response:
+            # What FastAPI 0.115, as in uv.lock, does: dump the model to a dict first.
+            content = await serialize_response(
+                field=route.response_field, response_content=response.model_dump(by_alias=True)
+            )
+            return JSONResponse(content)
+
+        async def model_response(response=response) -> Response:
+            return ModelResponse(response)
+
+        name = f"{'/'.join(route.methods or ())} {route.path}"
+        bench_async(f"{name}: fastapi", fastapi, 2000)
+        bench_async(f"{name}: fastapi 0.115", fastapi_0_115, 2000)
+        bench_async(f"{name}: ModelResponse", model_response, 2000)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""Compare rendering reply emails inline with the precompiled templates.
+
+The inline version is how emails were rendered before: every email walks all display
+options, and formats its body with an f-string.
+"""
+
+from app.exchanges.email import (
+    render_initiator_exchange_result_email,
+    render_initiator_exchange_results_digest_email,
+)
+from app.exchanges.models import ExchangeReply, ExchangeType
+from app.templates import ATTRIBUTE_DISPLAY_OPTIONS, attribute_display_renderer
+
+from ._utils import bench, make_exchange, make_reply
+
+_exchange = make_exchange(
+    ExchangeType.ONE_TO_MANY,
+    ["pbdf.sidn-pbdf.email.email", "pbdf.gemeente.personalData.fullname"],
+    send_email=True,
+    initiator_email_value="initiator@example.com",
+)
+
+_replies = [
+    make_reply(
+        _exchange,
+        {
+            "pbdf.sidn-pbdf.email.email": f"{i}@example.com",
+            "pbdf.gemeente.personalData.fullname": f"Naam {i}",
+        },
+    )
+    for i in range(100)
+]
+
+
+def _inline(reply: ExchangeReply) -> str:
+    values = {dv.id: dv.value for dv in reply.attribute_values}
+    attributes_display = "\n".join(
+        f"- {option.label.nl}: {option.display(values, 'nl')}"
+        for option in ATTRIBUTE_DISPLAY_OPTIONS
+        if option.required_attributes <= values.keys()
+    )
+    return f"""Beste gebruiker van DIYivi,
+
+Gefeliciteerd! Iemand heeft gereageerd op je verzoek om gegevens uit te wisselen.
+Dit zijn de gegevens die je hebt ontvangen:
+
+{attributes_display}
+
+Al deze gegevens worden vanzelf binnen 48 uur van DIYivi verwijderd.
+Dit is een automatisch gegenereerd bericht. U kunt hier niet op reageren.
+"""
+
+
+def main() -> None:
+    bench("inline: render 100 bodies", lambda: [_inline(reply) for reply in _replies])
+    bench(
+        "renderer: render 100 bodies",
+        lambda: attribute_display_renderer.render_many(
+            ({dv.id: dv.value for dv in reply.attribute_values} for reply in _replies), ["nl"]
+        ),
+    )
+    bench(
+        "render 100 emails",
+        lambda: [render_initiator_exchange_result_email(_exchange, reply) for reply in _replies],
+        number=100,
+    )
+    bench(
+        "render 1 digest email of 100 replies",
+        lambda: render_initiator_exchange_results_digest_email(_exchange, _replies),
+        number=100,
+    )
+
+
+if __name__ == "__main__":
+    main()
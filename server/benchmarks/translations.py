@@ -0,0 +1,55 @@
+"""Measure the savings of collapsing translated strings that are the same in every language.
+
+This compares the size of stored replies and of a page of 100 replies on the wire, with
+all translations and with identical translations collapsed into a single string.
+"""
+
+from pydantic_core import to_json
+
+from app.codecs import CODECS
+from app.exchanges.models import ExchangeResultResponse
+from app.yivi.models import compact_translations
+
+from ._utils import ATTRIBUTE_VALUES, bench, disclosed_values, make_exchange, make_reply
+
+_values = disclosed_values(ATTRIBUTE_VALUES)
+
+_reply = make_reply(make_exchange())
+
+_response = ExchangeResultResponse(
+    public_initiator_attribute_values=_values[:3],
+    initiator_attribute_values=_values,
+    replies=[_values] * 100,
+    next_cursor=100,
+)
+
+
+def _report_size(name: str, full: int, compact: int) -> None:
+    print(  # noqa: T201
+        f"{name:<50} {full:>8,} -> {compact:>8,} bytes ({1 - compact / full:.0%} smaller)"
+    )
+
+
+def main() -> None:
+    # Stored replies, without compact translations as by default, and with them.
+    full_size = len(_reply.model_dump_json())
+    for codec in CODECS.values():
+        _report_size(
+            f"ExchangeReply stored as {codec.name}",
+            full_size,
+            len(codec.encode(_reply, compact=True)),
+        )
+
+    full = _response.model_dump_json(by_alias=True)
+    compact = to_json(compact_translations(_response.model_dump(mode="json", by_alias=True)))
+    _report_size("Page of 100 replies on the wire", len(full), len(compact))
+
+    bench("Page of 100 replies: serialize", lambda: _response.model_dump_json(by_alias=True))
+    bench(
+        "Page of 100 replies: serialize compact",
+        lambda: to_json(compact_translations(_response.model_dump(mode="json", by_alias=True))),
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,39 @@
+"""Compare the latency of loading stored records with and without validating them.
+
+Exchanges of realistic size are loaded through the storage, with the trusted load path
+for records written by the server itself, and with full validation.
+"""
+
+import asyncio
+
+from fakeredis import FakeAsyncRedis
+
+from app.codecs import CODECS
+from app.exchanges.dependencies import ExchangesStorage
+
+from ._utils import bench, bench_async, make_exchange, make_reply
+
+_exchange = make_exchange(disclosed=True)
+_reply = make_reply(_exchange)
+
+
+def main() -> None:
+    for codec in CODECS.values():
+        for trusted_load in (False, True):
+            name = f"{codec.name}, {'trusted' if trusted_load else 'validated'}"
+            for model in (_exchange, _reply):
+                encoded = codec.encode(model, trusted=trusted_load)
+                bench(
+                    f"{name}: decode {type(model).__name__}",
+                    lambda: codec.decode(type(model), encoded, trusted=trusted_load),
+                    10_000,
+                )
+
+            storage = ExchangesStorage(FakeAsyncRedis(), codec=codec)
+            storage._trusted_load = trusted_load
+            asyncio.run(storage.save_exchange(_exchange))
+            bench_async(f"{name}: get_exchange", lambda: storage.get_exchange(_exchange.id))
+
+
+if __name__ == "__main__":
+    main()